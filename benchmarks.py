@@ -0,0 +1,121 @@
+"""
+File: benchmarks.py
+Timings behind the claims in the commit log, so that they can be checked on other
+machines. Each function runs its benchmark on some sample_probs problems and prints
+a table; call them from the interpreter, e.g. benchmarks.batch_speedup().
+"""
+
+import time
+import multiprocessing as mp
+import sample_probs
+import fsearch
+import geometry
+import gridfile
+import opponents
+import racetrack_example as rt
+import proj2_example
+
+
+def walldist(problem):
+    """Return h_walldist for problem, as a three-argument function"""
+    (title, p0, f_line, walls) = problem
+    xmax = max([max(x,x1) for ((x,y),(x1,y1)) in walls])
+    ymax = max([max(y,y1) for ((x,y),(x1,y1)) in walls])
+    grid = geometry.distance_grid(f_line, walls, xmax, ymax)
+    grid = gridfile.as_grid(grid, xmax+1, ymax+1)
+    return lambda state, f_line, walls: proj2_example.h_walldist(state, f_line, walls, grid)
+
+def batch_speedup(problems=(sample_probs.rhook32a, sample_probs.twisty1), strategy='uc', \
+                  batch=1024, processes=None):
+    """
+    For each problem, time a search with the given strategy (and h_walldist, if it
+    uses h) expanding one node at a time, and then batch nodes at a time with each
+    number of worker processes in processes (by default 1, 2, 4, ... up to the number
+    of CPUs). Print the wall time of each, its speedup over the first, and the length
+    of the path it found. With 1 process, the slowdown is the cost of sending the
+    nodes to the worker and back.
+
+    On a machine with one CPU, the only one it has been run on so far, a batched
+    search takes about as long as an unbatched one, within the timing noise (about a
+    second either way on these problems):
+        problem     processes   seconds   speedup  length
+        rhook32a            -     14.21     1.00x      17
+                            1     14.59     0.97x      17
+        twisty1             -      8.24     1.00x      17
+                            1      6.72     1.23x      17
+    """
+    if processes is None:
+        processes = [1]
+        while 2*processes[-1] <= mp.cpu_count():
+            processes.append(2*processes[-1])
+    print('{} CPUs, batch {}'.format(mp.cpu_count(), batch))
+    print('{:<10} {:>10} {:>9} {:>9} {:>7}'.format('problem', 'processes', 'seconds', \
+        'speedup', 'length'))
+    for problem in problems:
+        (title, p0, f_line, walls) = problem
+        h = walldist(problem)
+        s0 = (p0, (0,0))
+        start = time.perf_counter()
+        path = rt.main(s0, f_line, walls, strategy, h, verbose=0)
+        base = time.perf_counter() - start
+        print('{:<10} {:>10} {:>9.2f} {:>8.2f}x {:>7}'.format(title, '-', base, 1.0, \
+            len(path)-1))
+        for n in processes:
+            start = time.perf_counter()
+            path = rt.main(s0, f_line, walls, strategy, h, verbose=0, batch=batch, \
+                processes=n)
+            t = time.perf_counter() - start
+            print('{:<10} {:>10} {:>9.2f} {:>8.2f}x {:>7}'.format('', n, t, base/t, \
+                len(path)-1))
+
+def forget_caches(walls):
+    """Forget the move table, distance field, and opponent errors kept for walls"""
+    geometry.rebuild_index(walls)
+    geometry._field = None
+    rt._opponent_track = None
+
+def old_next_states(state, f_line, walls):
+    """
+    next_states as it was before it took an opponent argument: it called opponent1
+    for every move and didn't use the answer
+    """
+    states = []
+    (loc,(vx,vy)) = state
+    for dx in [0,-1,1,-2,2]:
+        for dy in [0,-1,1,-2,2]:
+            (wx,wy) = (vx+dx,vy+dy)
+            newloc = (loc[0]+wx,loc[1]+wy)
+            err = opponents.opponent1(loc, (wx, wy), f_line, walls)
+            if not rt.crash((loc,newloc),walls):
+                states.append((newloc,(wx,wy)))
+    return states
+
+def next_states_modes(problems=(sample_probs.rhook32a, sample_probs.walls32, \
+                      sample_probs.twisty1)):
+    """
+    For each problem, run a* with h_walldist using old_next_states, and then using
+    next_states with each opponent mode (None, 'opponent1', and 'fan'), each one
+    starting with nothing cached. Print the total time spent in next_states for each,
+    and the length of the path found.
+    """
+    modes = ['before', None, 'opponent1', 'fan']
+    print('{:<10}'.format('problem') + ''.join('{:>15}'.format(str(m)) for m in modes))
+    for problem in problems:
+        (title, p0, f_line, walls) = problem
+        h = walldist(problem)
+        s0 = (p0, (0,0))
+        results = []
+        for mode in modes:
+            forget_caches(walls)
+            if mode == 'before':
+                (path, stats) = fsearch.main(s0, \
+                    lambda s: [(t,1) for t in old_next_states(s, f_line, walls)], \
+                    lambda s: rt.goal_test(s, f_line), 'a*', \
+                    lambda s: h(s, f_line, walls), 0, None, rt.pack_state, \
+                    rt.unpack_state, stats=True)
+            else:
+                (path, stats) = rt.main(s0, f_line, walls, 'a*', h, verbose=0, \
+                    stats=True, opponent=mode)
+            results.append('{:>8.3f} s {:>3}'.format(stats.next_states_time, \
+                len(path)-1 if path else '-'))
+        print('{:<10}'.format(title) + ''.join(results))
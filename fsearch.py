@@ -8,31 +8,220 @@ For information on how to use it, see the docstring for fsearch.main.
 """
 
 import sys                              # We need flush() and readline()
+import heapq                            # the frontier is a binary heap
+import time                             # for the timings in Stats
+import multiprocessing as mp            # for batch_search's worker processes
+import multiprocessing.connection       # to wait for whichever worker finishes first
+from array import array                 # nodes are stored in typed arrays
+
+nan = float('nan')
+infinity = float('inf')
+
+
+class NodeStore():
+    """
+    All of the nodes generated by a search, kept in parallel typed arrays indexed by
+    ID#. Slot 0 isn't a node, so a parent ID# of 0 means that a node has no parent.
+    If pack and unpack are given, pack(s) must map each state s to an unsigned 64-bit
+    integer and unpack must invert it; the states are then kept in an array too.
+    """
+    __slots__ = ('parent', 'depth', 'g', 'h', 'states', 'pack', 'unpack')
+
+    def __init__(self, pack=None, unpack=None):
+        self.parent = array('i', [0])        # parent node's ID#
+        self.depth = array('i', [0])         # depth in the search tree
+        self.g = array('d', [0.0])           # total accumulated cost
+        self.h = array('d', [nan])           # h(state), or nan if there isn't one
+        self.pack = pack
+        self.unpack = unpack
+        if pack:    self.states = array('Q', [0])
+        else:       self.states = [None]
+
+    def add(self, state, parent, cost, h_value):
+        """
+        Args: current state, parent node's ID# (0 if none), cost of transition from
+        parent state to current state, and h(current state). Return the new ID#.
+        """
+        return self.add_key(self.pack(state) if self.pack else state, parent, cost, h_value)
+
+    def add_key(self, key, parent, cost, h_value):
+        """Like add, but with the state as it's kept in states (packed, if there's pack)"""
+        if parent:
+            self.depth.append(self.depth[parent] + 1)
+            self.g.append(self.g[parent] + cost)
+        else:
+            self.depth.append(0)
+            self.g.append(cost)
+        self.parent.append(parent)
+        if h_value is None: self.h.append(nan)
+        else:               self.h.append(h_value)
+        self.states.append(key)
+        return len(self.g) - 1
+
+    def state(self, id):
+        """Return the state of the node whose ID# is id"""
+        if self.unpack: return self.unpack(self.states[id])
+        return self.states[id]
+
+    def __len__(self):
+        """number of nodes in the store"""
+        return len(self.g) - 1
+
+    def nbytes(self):
+        """
+        Number of bytes allocated for the arrays. If the states aren't packed, this
+        counts the list that points to them but not the state objects themselves.
+        """
+        arrays = [self.parent, self.depth, self.g, self.h]
+        if self.pack:   arrays.append(self.states)
+        n = sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+        if not self.pack:   n += sys.getsizeof(self.states)
+        return n
 
 
 class Node():
     """
-    Each node includes ID#, state, parent node, g-value, h-value, and list of children.
+    A view of the node whose ID# is id in a NodeStore. It has the attributes that
+    printing, drawing and the key functions in sort_options need (ID#, state, parent
+    node, depth, g-value and h-value), but nothing is stored in it except the ID#.
+    """
+    __slots__ = ('store', 'id')
+
+    def __init__(self, store, id):
+        self.store = store
+        self.id = id
+
+    @property
+    def state(self):
+        return self.store.state(self.id)
+
+    @property
+    def parent(self):
+        p = self.store.parent[self.id]
+        if p: return Node(self.store, p)
+        return None
+
+    @property
+    def depth(self):
+        return self.store.depth[self.id]
+
+    @property
+    def g(self):
+        return self.store.g[self.id]
+
+    @property
+    def h(self):
+        return self.store.h[self.id]
+
+class ZeroHNode(Node):
     """
-    def __init__(self,state,parent,cost,h_value):
+    A Node view whose h-value reads as 0. Nodes for the same state have the same
+    h-value, so comparing their keys with h = 0 gives the same answer as comparing their
+    real keys, even if h hasn't been computed for them yet.
+    """
+    __slots__ = ()
+
+    @property
+    def h(self):
+        return 0
+
+class TreeNode():
+    """
+    A node that isn't kept in a NodeStore, for the strategies that throw nodes away
+    ('ida*' and 'sma*'). It has the same attributes as a Node view, plus an f-value
+    (which SMA* may back up from the node's children) and some bookkeeping for SMA*.
+    """
+    __slots__ = ('id', 'state', 'parent', 'depth', 'g', 'h', 'f', \
+                 'successors', 'children', 'kids', 'in_open', 'version')
+
+    def __init__(self, state, parent, cost, h_value, id):
         """
         Args: current state, parent node, cost of transition from parent state
-        to current state, and h(current state)
+        to current state, h(current state), and ID#
         """
-        global node_count
+        self.id = id
         self.state = state
         self.parent = parent
-        node_count += 1                      # total number of nodes
-        self.id = node_count                 # this node's ID number
-        if parent: 
-            parent.children.append(self)
+        if parent:
             self.depth = parent.depth + 1    # depth in the search tree
-            self.g = parent.g + cost         # total accumulated cost 
+            self.g = parent.g + cost         # total accumulated cost
         else:
             self.depth = 0
             self.g = cost
-        self.children = []
         self.h = h_value
+        self.f = self.g + h_value
+        self.successors = None  # the (state,cost) pairs from next_states, once needed
+        self.children = None    # for each successor: its node if it's in memory, the
+                                # f-value it had when it was forgotten, or None if it
+                                # hasn't been generated yet
+        self.kids = 0           # number of children in memory
+        self.in_open = False    # whether SMA* may still choose this node
+        self.version = 0        # changed whenever f or in_open changes; -1 if forgotten
+
+class Stats():
+    """
+    Statistics about a search, which main returns along with the solution if its stats
+    argument is true. Times are in seconds. peak_frontier is the most unpruned nodes
+    the frontier had at once; for 'ida*' and 'sma*' it's the most nodes in memory.
+    prune_time is the time expand spent making and pruning nodes, not counting calls
+    to next_states and h; it's None for the strategies that don't use expand. as_dict
+    returns everything as a dictionary, e.g. for json.
+    """
+    __slots__ = ('strategy', 'solved', 'path_length', 'generated', 'pruned', 'explored', \
+                 'peak_frontier', 'time', 'next_states_time', 'h_time', 'h_calls', \
+                 'goal_test_time', 'prune_time')
+
+    def __init__(self, strategy):
+        self.strategy = strategy
+        self.solved = False
+        self.path_length = None
+        self.generated = 0
+        self.pruned = 0
+        self.explored = 0
+        self.peak_frontier = 0
+        self.time = 0.0
+        self.next_states_time = 0.0
+        self.h_time = 0.0
+        self.h_calls = 0
+        self.goal_test_time = 0.0
+        self.prune_time = None
+
+    @property
+    def expansions_per_sec(self):
+        return self.explored/self.time if self.time else 0.0
+
+    def as_dict(self):
+        d = {name: getattr(self, name) for name in self.__slots__}
+        d['expansions_per_sec'] = self.expansions_per_sec
+        return d
+
+    def __repr__(self):
+        return 'Stats({})'.format(', '.join('{}={!r}'.format(k, v) \
+            for (k, v) in self.as_dict().items()))
+
+    def count(self, generated, pruned, explored, peak_frontier):
+        """called by a search when it's done, to record its totals"""
+        self.generated = generated
+        self.pruned = pruned
+        self.explored = explored
+        self.peak_frontier = peak_frontier
+
+    def timed(self, f, name):
+        """
+        Return a version of f that adds the time it takes to the attribute called
+        name (and counts the calls, if name is 'h_time'). A next_states function's
+        result is turned into a list, so that the time includes making all the states.
+        """
+        def timed_f(*args):
+            start = time.perf_counter()
+            try:
+                if name == 'next_states_time':  return list(f(*args))
+                return f(*args)
+            finally:
+                setattr(self, name, getattr(self, name) + time.perf_counter() - start)
+                if name == 'h_time':    self.h_calls += 1
+        return timed_f
+
 
 def getpath(y):
     """Return the path from the root to y"""
@@ -51,7 +240,12 @@ sort_options = {
     'df':   ('-id', lambda x: -x.id,   '#{0}: d {1}, g {3:.2f}, state {5}'),
     'uc':   ('g',   lambda x: x.g,     '#{0}: g {3:.2f}, d {1}, state {5}'),
     'gbf':  ('h',   lambda x: x.h,     '#{0}: h {4:.2f}, d {1}, g {3:.2f}, state {5}'),
-    'a*':   ('f',   lambda x: x.g+x.h, '#{0}: f {2:.2f}, g {3:.2f}, h {4:.2f}, d {1}, state {5}')}
+    'a*':   ('f',   lambda x: x.g+x.h, '#{0}: f {2:.2f}, g {3:.2f}, h {4:.2f}, d {1}, state {5}'),
+    'ida*': ('f',   lambda x: x.g+x.h, '#{0}: f {2:.2f}, g {3:.2f}, h {4:.2f}, d {1}, state {5}'),
+    'sma*': ('f',   lambda x: x.f,     '#{0}: f {2:.2f}, g {3:.2f}, h {4:.2f}, d {1}, state {5}'),
+    'ara*': ('f',   lambda x: x.g+x.h, '#{0}: f {2:.2f}, g {3:.2f}, h {4:.2f}, d {1}, state {5}'),
+    'bi-uc':('g',   lambda x: x.g,     '#{0}: g {3:.2f}, d {1}, state {5}'),
+    'bi-a*':('f',   lambda x: x.g+x.h, '#{0}: f {2:.2f}, g {3:.2f}, h {4:.2f}, d {1}, state {5}')}
 
 def printnodes(message, nodes, strategy, verbose):
     """For each node in nodes, print its state and its 'key_func' value"""
@@ -84,18 +278,37 @@ def print_nodetypes(new, n_prune, e_prune, f_prune, frontier, strategy, verbose)
     if f_prune: printnodes('fron. rm', f_prune, strategy, verbose)
     printnodes('frontier', frontier, strategy, verbose)
 
-def finish(x, node_count, prunes, frontier, explored, verbose, draw_edges):
+def finish(x, node_count, prunes, frontier_size, explored_size, verbose, draw_edges):
     """called after a successful search, to print info and/or draw the solution"""
     path = getpath(x)
     if verbose >= 1:
+        cost = x.g          # a NodeStore keeps g as a float, but print integer costs as ints
+        if isinstance(cost, float) and cost.is_integer(): cost = int(cost)
         # Path length = number of actions = number of nodes - 1
-        print('==> Path length {}, cost {}.'.format(len(path)-1,x.g), \
+        print('==> Path length {}, cost {}.'.format(len(path)-1,cost), \
             'Generated {}, pruned {}, explored {}, frontier {}.'.format( \
-            node_count, prunes, len(explored), len(frontier)))
+            node_count, prunes, explored_size, frontier_size))
     if draw_edges:  
         draw_edges([(x.parent.state[0],x.state[0]) for x in path if x.parent], 'solution')
     return [p.state for p in path]
 
+def on_path(state, x):
+    """Test whether state is the state of x or one of x's ancestors"""
+    while x:
+        if x.state == state: return True
+        x = x.parent
+    return False
+
+def print_memory(*stores):
+    """Print the peak node memory. The stores' arrays never shrink, so it's their size now."""
+    print('==> Peak node memory {:.3f} MB for {} nodes.'.format( \
+        sum(store.nbytes() for store in stores)/1e6, sum(len(store) for store in stores)))
+
+def print_lazy(store, h_calls):
+    """Print how many h calls a lazy search made, and how many it saved"""
+    # every node but the first would have had an h call if the search weren't lazy
+    print('==> Lazy h: {} calls, {} saved.'.format(h_calls, len(store) - 1 - h_calls))
+
 def get_edges(nodes):
     return [(x.parent.state[0],x.state[0]) for x in nodes if x.parent]
 
@@ -107,50 +320,128 @@ def draw_expand(x, n_prune, new, f_prune, e_prune,draw_edges):
     draw_edges(get_edges(e_prune), 'explored_prune')
 
 
-def expand(x, next_states, h, frontier, explored, strategy, verbose, draw_edges):
+def frontier_nodes(store, frontier, best):
+    """Return the nodes that are really in frontier (not pruned), in the order they'll be popped"""
+    return [Node(store, id) for (key, id) in sorted(frontier) if best.get(store.states[id]) == id]
+
+def pop_frontier(store, frontier, best):
     """
-    expand returns six lists of nodes: new nodes, nodes pruned from new, frontier
-    nodes, nodes pruned from frontier, explored nodes, and nodes pruned from explored
+    Pop the heap entries in frontier until finding a node that hasn't been pruned, and
+    return its ID#. Pruned nodes are left in the heap (lazy deletion), but they're no
+    longer the node that best has for their state.
     """
-    (key_name, key_func, template) = sort_options[strategy]
-    new = [Node(s, x, cost, h(s)) for (s,cost) in next_states(x.state)]
+    while True:
+        (key, id) = heapq.heappop(frontier)
+        if best.get(store.states[id]) == id:
+            return id
 
-    # make a list of dominated new nodes, then prune them
-    n_prune = [m for m in new if
-        [n for n in explored if m.state == n.state and key_func(m) >= key_func(n)] or
-        [n for n in frontier if m.state == n.state and key_func(m) >= key_func(n)] or
-        [n for n in new if m.state == n.state and key_func(m) > key_func(n)] or
-        [n for n in new if m.state == n.state and key_func(m) == key_func(n) and m.id > n.id]]
-    new = [m for m in new if not m in n_prune]
 
-    # make a list of dominated frontier nodes, then prune them
-    f_prune = [m for m in frontier if
-        [n for n in new if m.state == n.state and key_func(m) > key_func(n)]]
-    frontier = [m for m in frontier if not m in f_prune]
+def expand(x, next_states, h, store, frontier, best, explored, strategy, verbose, \
+           draw_edges, lazy=False, successors=None, by_g=False):
+    """
+    expand returns four lists of ID#s: new nodes, nodes pruned from new, nodes pruned
+    from frontier, and nodes pruned from explored. frontier is a heap of (key, ID#)
+    entries; best maps each state (as kept in store.states) to the ID# of the only node
+    for that state that's in frontier or explored; explored maps the ID# of each
+    explored node to the iteration it was expanded at. All three are updated in place.
+    If lazy is true, h isn't called here. A new node gets the h-value of the frontier
+    or explored node for its state if that one has been computed, and otherwise nan
+    (see main), and it goes into frontier with x's key until its h-value is known.
+    If successors is given, it's an iterable of (key, cost, h-value) triples for x's
+    children that were already computed (see batch_search), where key is the child's
+    state as it's kept in store.states, and next_states and h aren't called.
+    If by_g is true, nodes for the same state are compared by their g-values alone, as
+    if they had the same h-value even when they don't (see Replanner).
+    """
+    (key_name, key_func, template) = sort_options[strategy]
+    key = lambda id: key_func(Node(store, id))
+    if lazy or by_g:
+        # nodes for the same state have the same h-value, even if it's still nan (or,
+        # with by_g, they're compared as if they had)
+        same_state_key = lambda id: key_func(ZeroHNode(store, id))
+    else:
+        same_state_key = key
+    if lazy:
+        x_key = key(x)
+    states = store.states
+    new = []
+    keys = {}       # sort key of each new node
+    top = {}        # for each state, the new node with the smallest key
+    if successors is None:
+        successors = ((s, cost, None) for (s,cost) in next_states(store.state(x)))
+        add = store.add
+    else:
+        (h, add) = (None, store.add_key)
+    for (s,cost,h_value) in successors:
+        if lazy:
+            m = add(s, x, cost, nan)
+            n = best.get(states[m])
+            if n is not None:   store.h[m] = store.h[n]
+        elif h:     m = add(s, x, cost, h(s))
+        else:       m = add(s, x, cost, h_value)
+        new.append(m)
+        # ties go to the smallest ID#; the other new nodes for the state are dominated
+        keys[m] = same_state_key(m)
+        n = top.get(states[m])
+        if n is None or keys[m] < keys[n]:
+            top[states[m]] = m
 
-    # make a list of dominated explored nodes, then prune them
-    e_prune = [m for m in explored if
-        [n for n in new if m.state == n.state and key_func(m) > key_func(n)]]
-    explored = [m for m in explored if not m in e_prune]
+    # make a list of dominated new nodes, then prune them. Since best has at most one
+    # node per state, a new node needs just one dictionary lookup.
+    n_prune = []
+    survivors = []
+    for m in new:
+        n = best.get(states[m])
+        if top[states[m]] != m or (n is not None and keys[m] >= same_state_key(n)):
+            n_prune.append(m)
+        else:
+            survivors.append(m)
+    new = survivors
 
-    frontier.extend(new)
-    frontier.sort(key=key_func)
+    # Each new node replaces any frontier or explored node for the same state. A pruned
+    # frontier node stays in the heap, but pop_frontier will skip it.
+    f_prune = []
+    e_prune = []
+    for m in new:
+        n = best.get(states[m])
+        if n is not None:
+            if n in explored:   e_prune.append(n)
+            else:               f_prune.append(n)
+        best[states[m]] = m
+        if lazy:
+            k = key(m)
+            if k != k:  k = x_key       # k is nan, so use x's key until h is known
+            heapq.heappush(frontier, (k, m))
+        else:
+            heapq.heappush(frontier, (keys[m], m))
+    # put the pruned nodes in the same order the old list-based frontier and explored had
+    f_prune.sort(key=lambda n: (key(n), n))
+    e_prune.sort(key=lambda n: explored[n])
+    for n in e_prune:
+        del explored[n]
 
+    if verbose >= 2 or draw_edges:
+        views = [[Node(store, id) for id in ids] for ids in (new, n_prune, f_prune, e_prune)]
     if verbose >= 2:
-        print_nodetypes(new, n_prune, e_prune, f_prune, frontier, strategy, verbose)
+        print_nodetypes(views[0], views[1], views[3], views[2], \
+            frontier_nodes(store, frontier, best), strategy, verbose)
     if draw_edges:
-        draw_expand(x, n_prune, new, f_prune, e_prune, draw_edges)
-    return (new, n_prune, frontier, f_prune, explored, e_prune)
+        draw_expand(Node(store, x), views[1], views[0], views[2], views[3], draw_edges)
+    return (new, n_prune, f_prune, e_prune)
 
 
-def main(s0, next_states, goal_test, strategy, h=None, verbose=2, draw_edges=None):
+def main(s0, next_states, goal_test, strategy, h=None, verbose=2, draw_edges=None, \
+         pack=None, unpack=None, max_nodes=100000, weight=3.0, weight_step=0.5, \
+         on_solution=None, prev_states=None, goals=None, h_back=None, lazy=False, \
+         stats=False, batch=1, processes=None, deterministic=True, deadline=None):
     """
     Do a "graph-search-redo" search starting at state s0, looking for a path
     from s0 to a state that satisfies a user-supplied goal test. The arguments are:
     - s0 is the starting state.
     - next_states(s) is a user-supplied function to return the children of state s.
     - goal_test(s) is a user-supplied predicate to tell whether s is a goal state.
-    - strategy is 'bf', 'df', 'uc', 'gbf', or 'a*'. 
+    - strategy is 'bf', 'df', 'uc', 'gbf', 'a*', 'ida*', 'sma*', 'ara*', 'bi-uc', or
+      'bi-a*'. 
     - h(s) is a user-supplied heuristic function.
     - verbose is a numeric argument; here are its possible values and their meanings:
           0 - run silently.
@@ -163,31 +454,881 @@ def main(s0, next_states, goal_test, strategy, h=None, verbose=2, draw_edges=Non
           edges - a list of edges to draw;
           status - one of the following strings, to tell what kind of edge to draw:
           'expand', 'add', 'discard', 'frontier_prune', 'explored_prune', or 'solution'.
+    - pack(s) and unpack(n) are optional user-supplied functions to convert a state to
+      an unsigned 64-bit integer and back. If they're given, the node store keeps the
+      states packed, which takes much less memory than keeping the state objects.
+    - max_nodes is the most nodes that 'sma*' may keep in memory at once.
+    - weight is the heuristic weight that 'ara*' starts with, and weight_step is how
+      much it lowers the weight after each search, until the weight gets to 1.
+    - on_solution(path,cost,weight) is an optional user-supplied function that 'ara*'
+      calls each time it finds a better solution, as soon as it finds it. path is a
+      list of states, and weight is the weight of the search that found it. That's
+      before the search is done, so the cost may be more than weight times the optimal
+      cost; it's at most that only if the search runs to the end (see ara_star).
+    - deadline is an optional time (as time.time() gives it) at which 'ara*' stops and
+      returns the best solution it has found so far, or False if it hasn't found one.
+    - prev_states(s), goals, and h_back(s) are for 'bi-uc' and 'bi-a*', which also search
+      backward from the goals. prev_states(s) is a user-supplied function to return the
+      parents of state s, as (state, cost) pairs; goals is a list of all the goal
+      states (goal_test isn't used); and h_back(s) estimates the cost from s0 to s.
+    - lazy tells whether to put off calling h on a node until it gets to the top of
+      the frontier. Until then, the node's h-value is nan, and its key in the frontier
+      is its parent's key. When it gets to the top, it's put back into the frontier
+      with its real key, unless that key is still the smallest one. Nodes that get
+      pruned or are never popped don't cost an h call. For 'a*', the parent's key is a
+      lower bound if h is consistent, so the search expands the same kind of nodes as
+      usual; otherwise it may find worse solutions. This works with the strategies done
+      by main itself, not 'ida*', 'sma*', 'ara*', 'bi-uc', or 'bi-a*'.
+    - stats tells whether to return a pair (solution, Stats) instead of just the
+      solution. The Stats has the counts, times, and rates of the search, and it costs
+      some time to keep track of them, so it's only done if stats is true.
+    - batch is how many nodes to expand at once. If it's more than 1, the search is
+      done by batch_search, which calls next_states and h in worker processes
+      (processes of them, or one per CPU if processes is None). Each batch costs a
+      round trip to the workers, and the nodes in it are expanded even if a node
+      ahead of them leads to the goal, so batching only pays if next_states and h
+      are slow, the search expands many batches' worth of nodes, and there's a CPU
+      for each worker. No speedup has been measured yet: on one CPU, a batched search
+      takes about as long as an unbatched one (see benchmarks.batch_speedup). If
+      deterministic is false, each node's children are added as soon as they're
+      ready, instead of in the order the nodes were taken from the frontier, so the
+      search may not do the same thing each time. This works with 'bf', 'df', 'uc', 'gbf', and 'a*'.
+    The frontier is a heap ordered by (key, ID#), which pops nodes in the same order
+    as keeping a list sorted by key would. Each state has at most one node in the
+    frontier or explored, so pruning uses a dictionary from states to nodes. The
+    nodes themselves are kept in a NodeStore.
+    The search is done by graph_search (or batch_search), except that 'ida*' and 'sma*'
+    are done by ida_star and sma_star, since they only keep some of the nodes, 'ara*'
+    is done by ara_star, and 'bi-uc' and 'bi-a*' are done by bidirectional.
+    """
+    record = Stats(strategy) if stats else None
+    if record:
+        next_states = record.timed(next_states, 'next_states_time')
+        if goal_test:   goal_test = record.timed(goal_test, 'goal_test_time')
+        if h:           h = record.timed(h, 'h_time')
+        if prev_states: prev_states = record.timed(prev_states, 'next_states_time')
+        if h_back:      h_back = record.timed(h_back, 'h_time')
+        start = time.perf_counter()
+    if strategy == 'ida*':
+        solution = ida_star(s0, next_states, goal_test, h, verbose, draw_edges, record)
+    elif strategy == 'sma*':
+        solution = sma_star(s0, next_states, goal_test, h, max_nodes, verbose, draw_edges, \
+            record)
+    elif strategy == 'ara*':
+        solution = ara_star(s0, next_states, goal_test, h, weight, weight_step, \
+            on_solution, verbose, draw_edges, pack, unpack, record, deadline)
+    elif strategy in ('bi-uc', 'bi-a*'):
+        solution = bidirectional(s0, next_states, prev_states, goals, h, h_back, strategy, \
+            verbose, draw_edges, pack, unpack, record)
+    elif batch > 1:
+        solution = batch_search(s0, next_states, goal_test, strategy, h, verbose, \
+            draw_edges, pack, unpack, batch, processes, deterministic, record)
+    else:
+        solution = graph_search(s0, next_states, goal_test, strategy, h, verbose, \
+            draw_edges, pack, unpack, lazy, record)
+    if record:
+        record.time = time.perf_counter() - start
+        record.solved = bool(solution)
+        if solution:    record.path_length = len(solution) - 1
+        return (solution, record)
+    return solution
+
+
+def graph_search(s0, next_states, goal_test, strategy, h, verbose, draw_edges, pack, \
+                 unpack, lazy, record):
+    """
+    The graph-search-redo search that main does for 'bf', 'df', 'uc', 'gbf', and 'a*'.
+    The arguments are the same as for main, and record is a Stats or None.
     """
-    global node_count
-    node_count = 0      # total number of generated nodes
+    store = NodeStore(pack, unpack)
     prunes = 0          # total number of pruned nodes
-    explored = []       # all nodes that have been expanded
+    best = {}           # the frontier or explored node for each state
+    explored = {}       # ID#s of all nodes that have been expanded
+    lazy = lazy and h   # there's nothing to put off if there's no h
+    h_calls = 0         # number of times h was called, if lazy
     (key_name, key_func, template) = sort_options[strategy]
     if verbose >= 2:
         print('==> {} search, keep frontier ordered by {}:\n'.format(strategy, key_name))
-    # Below, thes 2nd arg is None because the node has no parent.
-    if h: frontier = [Node(s0,None,0,h(s0))]
-    else: frontier = [Node(s0,None,0,None)]
+    # Below, the 2nd arg is 0 because the node has no parent.
+    if h: x = store.add(s0,0,0,h(s0))
+    else: x = store.add(s0,0,0,None)
+    best[store.states[x]] = x
+    frontier = [(key_func(Node(store, x)), x)]
+    frontier_size = 1   # number of heap entries that haven't been pruned
+    peak = 1
+    if record:  record.prune_time = 0.0
     iteration = 0
-    while frontier: 
+    while frontier_size: 
+        x = pop_frontier(store, frontier, best)
+        if lazy and store.h[x] != store.h[x]:
+            # x's h-value is nan, so compute it, and put x back if it's no longer first
+            store.h[x] = h(store.state(x))
+            h_calls += 1
+            key = key_func(Node(store, x))
+            if frontier and key > frontier[0][0]:
+                heapq.heappush(frontier, (key, x))
+                continue
         iteration += 1                  # keep track of how many iterations we've done
-        x = frontier.pop(0)             # inefficient
-        explored.append(x)
-        if verbose >= 2: print('{0:>3} Expand'.format(iteration), nodeinfo(x,template))
-        if goal_test(x.state):
-            return finish(x, node_count, prunes, frontier, explored, verbose, draw_edges)
-        (new, n_prune, frontier, f_prune, explored, e_prune) = expand( \
-            x, next_states, h, frontier, explored, strategy, verbose, draw_edges)
+        frontier_size -= 1
+        explored[x] = iteration
+        if verbose >= 2: print('{0:>3} Expand'.format(iteration), nodeinfo(Node(store, x),template))
+        if goal_test(store.state(x)):
+            solution = finish(Node(store, x), len(store), prunes, frontier_size, \
+                len(explored), verbose, draw_edges)
+            if record:  record.count(len(store), prunes, len(explored), peak)
+            if verbose >= 1:
+                if lazy:    print_lazy(store, h_calls)
+                print_memory(store)
+            return solution
+        if record:
+            times = (time.perf_counter(), record.next_states_time, record.h_time)
+        (new, n_prune, f_prune, e_prune) = expand(x, next_states, h, \
+            store, frontier, best, explored, strategy, verbose, draw_edges, lazy)
+        if record:
+            record.prune_time += time.perf_counter() - times[0] \
+                - (record.next_states_time - times[1]) - (record.h_time - times[2])
+        frontier_size += len(new) - len(f_prune)
+        peak = max(peak, frontier_size)
         if verbose >= 4:
             print("continue > ", end='')
             sys.stdout.flush(); sys.stdin.readline()
         elif verbose >= 2:  print('')
         prunes += len(n_prune) + len(f_prune) + len(e_prune)
     if verbose >= 3:    print("==> Couldn't find a solution.")
+    if record:  record.count(len(store), prunes, len(explored), peak)
+    if verbose >= 1:
+        if lazy:    print_lazy(store, h_calls)
+        print_memory(store)
     return False
+
+
+def batch_search(s0, next_states, goal_test, strategy, h, verbose, draw_edges, pack, \
+                 unpack, batch, processes, deterministic, record):
+    """
+    graph_search, except that it takes up to batch nodes from the frontier at a time,
+    and calls next_states and h on their states in a set of worker processes. Each
+    worker gets next_states, h, pack and unpack (and whatever they use, such as the
+    walls and grid) once, when they start. The workers are forked (see
+    worker_context), so these may be lambdas or closures. Each batch is split into
+    one chunk of nodes per worker, so a batch costs one round trip to each worker,
+    however big it is. If pack is given, a chunk is sent as an array of packed states,
+    and the children come back as arrays of packed states, costs and h-values (see
+    run_worker), so the pipe carries 8 bytes per node each way, plus 16 per child for
+    its cost and h-value, rather than pickled state objects. Even so, batch only pays
+    if next_states and h take much longer than that, and there are CPUs to spare:
+    with one CPU, the workers just take turns with this process.
+    Then each node's children are added by expand, in the order the nodes were taken
+    from the frontier if deterministic is true, or in the order the chunks finish
+    otherwise. A node whose state got a better node from an earlier node in the same
+    batch isn't expanded, and a goal node is only accepted if it's the first node in
+    its batch, so that the nodes ahead of it in the frontier have all been expanded.
+    The arguments are the same as for main, and record is a Stats or None. record
+    counts the workers' calls to h, but its times for next_states and h don't include
+    the time spent in the workers.
+    """
+    store = NodeStore(pack, unpack)
+    states = store.states
+    prunes = 0
+    best = {}
+    explored = {}
+    (key_name, key_func, template) = sort_options[strategy]
+    if verbose >= 2:
+        print('==> {} search, keep frontier ordered by {}, {} nodes at a time:\n'.format( \
+            strategy, key_name, batch))
+    if h: x = store.add(s0,0,0,h(s0))
+    else: x = store.add(s0,0,0,None)
+    best[states[x]] = x
+    frontier = [(key_func(Node(store, x)), x)]
+    frontier_size = 1
+    peak = 1
+    if record:  record.prune_time = 0.0
+    iteration = 0
+    solution = False
+    workers = start_workers(processes or mp.cpu_count(), next_states, h, pack, unpack)
+    try:
+        while frontier_size and not solution:
+            xs = []
+            while frontier_size and len(xs) < batch:
+                x = pop_frontier(store, frontier, best)
+                is_goal = goal_test(store.state(x))
+                if is_goal and xs:
+                    # the nodes before x might have cheaper children, so put x back
+                    # until they've been expanded
+                    heapq.heappush(frontier, (key_func(Node(store, x)), x))
+                    break
+                iteration += 1
+                frontier_size -= 1
+                explored[x] = iteration
+                if verbose >= 2:
+                    print('{0:>3} Expand'.format(iteration), nodeinfo(Node(store, x),template))
+                if is_goal:
+                    solution = finish(Node(store, x), len(store), prunes, frontier_size, \
+                        len(explored), verbose, draw_edges)
+                    break
+                xs.append(x)
+            if solution:
+                break
+            # send each worker its chunk of the batch, then add the children of each
+            # chunk in order, or as soon as they come back if not deterministic
+            size = -(-len(xs) // len(workers))  # nodes per chunk, rounded up
+            chunks = {}     # for each worker that has a chunk, the chunk's start in xs
+            for ((p, conn), i) in zip(workers, range(0, len(xs), size)):
+                keys = [states[x] for x in xs[i:i+size]]
+                conn.send(array('Q', keys) if pack else keys)
+                chunks[conn] = i
+            while chunks:
+                if deterministic:   ready = [next(iter(chunks))]
+                else:               ready = mp.connection.wait(list(chunks))
+                for conn in ready:
+                    i = chunks.pop(conn)
+                    chunk = conn.recv()
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    (counts, children, costs, h_values) = chunk
+                    j = 0           # where x's children start in children
+                    for (x, n) in zip(xs[i:], counts):
+                        successors = zip(children[j:j+n], costs[j:j+n], h_values[j:j+n])
+                        j += n
+                        if record and h:    record.h_calls += n
+                        if best.get(states[x]) != x:
+                            continue
+                        if record:  start = time.perf_counter()
+                        (new, n_prune, f_prune, e_prune) = expand(x, next_states, h, \
+                            store, frontier, best, explored, strategy, verbose, draw_edges, \
+                            successors=successors)
+                        if record:  record.prune_time += time.perf_counter() - start
+                        frontier_size += len(new) - len(f_prune)
+                        prunes += len(n_prune) + len(f_prune) + len(e_prune)
+            peak = max(peak, frontier_size)
+            if verbose >= 4:
+                print("continue > ", end='')
+                sys.stdout.flush(); sys.stdin.readline()
+            elif verbose >= 2:  print('')
+    finally:
+        for (p, conn) in workers:
+            p.terminate()
+            p.join()
+            conn.close()
+    if record:  record.count(len(store), prunes, len(explored), peak)
+    if not solution and verbose >= 3:   print("==> Couldn't find a solution.")
+    if verbose >= 1:    print_memory(store)
+    return solution
+
+def worker_context():
+    """
+    Return the multiprocessing context for batch_search's workers. Forked workers
+    inherit next_states and h, rather than getting them by pickling, which lambdas
+    and closures can't be; so use 'fork' wherever there is one, even where it isn't
+    the default (e.g. on macOS). Where there's no fork (Windows), next_states and h
+    must be functions defined at the top level of a module.
+    """
+    if 'fork' in mp.get_all_start_methods():
+        return mp.get_context('fork')
+    return mp.get_context()
+
+def start_workers(count, next_states, h, pack=None, unpack=None):
+    """
+    Start count of batch_search's worker processes, and return a list of (process,
+    connection) pairs. Each worker has its own pipe, rather than sharing a Pool's
+    queues, so that a chunk costs just one send and one receive at each end.
+    """
+    context = worker_context()
+    workers = []
+    for _ in range(count):
+        (conn, worker_conn) = context.Pipe()
+        p = context.Process(target=run_worker, \
+            args=(worker_conn, next_states, h, pack, unpack), daemon=True)
+        p.start()
+        worker_conn.close()
+        workers.append((p, conn))
+    return workers
+
+def run_worker(conn, next_states, h, pack=None, unpack=None):
+    """
+    The loop that each of batch_search's worker processes runs. It receives lists of
+    states from conn (as an array of packed states, if pack and unpack are given), and
+    for each list, sends back (counts, children, costs, h_values): the number of
+    children of each state, and then each child's state (packed, if pack is given),
+    cost, and h-value (nan if there's no h), in order. If this raises an exception, it
+    sends that instead. It returns when conn is closed.
+    """
+    while True:
+        try:
+            keys = conn.recv()
+        except EOFError:
+            return
+        try:
+            (counts, costs, h_values) = (array('I'), array('d'), array('d'))
+            children = array('Q') if pack else []
+            for key in keys:
+                start = len(costs)
+                for (s,cost) in next_states(unpack(key) if unpack else key):
+                    children.append(pack(s) if pack else s)
+                    costs.append(cost)
+                    h_values.append(h(s) if h else nan)
+                counts.append(len(costs) - start)
+            chunk = (counts, children, costs, h_values)
+        except Exception as e:
+            chunk = e
+        conn.send(chunk)
+
+
+def ida_star(s0, next_states, goal_test, h, verbose, draw_edges, record=None):
+    """
+    Iterative-deepening A*. Each iteration is a depth-first search that doesn't expand
+    nodes whose f-value is above a limit; the next iteration's limit is the smallest
+    f-value that was above it. Only the current path and the unexpanded children of the
+    nodes on it are kept in memory. The arguments are the same as for main, and record
+    is a Stats or None.
+    """
+    if not h: h = lambda s: 0
+    template = sort_options['ida*'][2]
+    node_count = 1      # total number of generated nodes
+    prunes = 0          # total number of pruned nodes
+    explored = 0        # total number of expansions
+    root = TreeNode(s0, None, 0, h(s0), node_count)
+    limit = root.f
+    in_memory = 1       # nodes on the path, plus their children that are waiting
+    peak = 1
+    iteration = 0
+    while True:
+        if verbose >= 2:
+            print('==> ida* search with f limit {:.2f}:\n'.format(limit))
+        next_limit = infinity
+        stack = [(root, None)]      # each node on the path, and an iterator for its children
+        while stack:
+            (x, children) = stack[-1]
+            if children:
+                y = next(children, None)
+                if y:
+                    stack.append((y, None))
+                else:
+                    stack.pop()
+                    in_memory -= 1
+                continue
+            # x hasn't been expanded yet during this iteration
+            iteration += 1
+            explored += 1
+            if verbose >= 2: print('{0:>3} Expand'.format(iteration), nodeinfo(x,template))
+            if goal_test(x.state):
+                solution = finish(x, node_count, prunes, in_memory - len(stack), explored, \
+                    verbose, draw_edges)
+                if record:  record.count(node_count, prunes, explored, peak)
+                if verbose >= 1:    print('==> Peak of {} nodes in memory.'.format(peak))
+                return solution
+            new = []
+            n_prune = []
+            for (s,cost) in next_states(x.state):
+                node_count += 1
+                y = TreeNode(s, x, cost, h(s), node_count)
+                if y.f > limit:
+                    next_limit = min(next_limit, y.f)
+                    n_prune.append(y)
+                elif on_path(s, x):
+                    n_prune.append(y)
+                else:
+                    new.append(y)
+            new.sort(key=lambda y: y.f)
+            prunes += len(n_prune)
+            in_memory += len(new)
+            peak = max(peak, in_memory)
+            stack[-1] = (x, iter(new))
+            if verbose >= 2:
+                printnodes('add', new, 'ida*', verbose)
+                if n_prune: printnodes('discard', n_prune, 'ida*', verbose)
+                print('')
+            if draw_edges:
+                draw_expand(x, n_prune, new, [], [], draw_edges)
+        if next_limit == infinity:
+            if verbose >= 3:    print("==> Couldn't find a solution.")
+            if record:  record.count(node_count, prunes, explored, peak)
+            return False
+        limit = next_limit
+        in_memory = 1
+
+
+def sma_star(s0, next_states, goal_test, h, max_nodes, verbose, draw_edges, record=None):
+    """
+    Simplified memory-bounded A*. It chooses the deepest node with the least f-value
+    and generates its children, or regenerates the best of the children it forgot
+    (ties go to the node with the least g+h). When there are max_nodes nodes in memory,
+    it forgets the shallowest leaf with the highest f-value; the leaf's parent keeps
+    that f-value, and regenerates the leaf if everything else turns out to be worse.
+    Once all of a node's children have been generated, its f-value is backed up to the
+    least f-value of its children. The other arguments are the same as for main, and
+    record is a Stats or None.
+    """
+    if not h: h = lambda s: 0
+    template = sort_options['sma*'][2]
+    open_heap = []      # entries (f, tie-breaker, -depth, ID#, version, node) for nodes in open
+    leaf_heap = []      # entries (-f, depth, ID#, version, node) for leaves
+
+    def open_f(x):
+        """
+        The f-value of the child that x would generate if it were chosen: x's own f-value
+        if it hasn't been expanded, else the least f-value of its forgotten children
+        """
+        if x.children is None:  return x.f
+        return min([c for c in x.children if isinstance(c, float)], default=infinity)
+
+    def update(x):
+        """x's f-value, in_open or kids changed, so make new heap entries for it"""
+        x.version += 1
+        if x.in_open:
+            f = open_f(x)
+            if x.children is None:  heapq.heappush(open_heap, (f, x.g+x.h, -x.depth, x.id, x.version, x))
+            else:                   heapq.heappush(open_heap, (f, f, -x.depth, x.id, x.version, x))
+        if x.kids == 0:
+            heapq.heappush(leaf_heap, (-x.f, x.depth, x.id, x.version, x))
+
+    def worst_leaf(exclude):
+        """Pop and return the leaf to forget, or None if there isn't one except exclude"""
+        held = []
+        leaf = None
+        while leaf_heap:
+            entry = heapq.heappop(leaf_heap)
+            m = entry[4]
+            if entry[3] != m.version or m.kids:
+                continue
+            if m is exclude or m is root:
+                held.append(entry)
+                continue
+            leaf = m
+            break
+        for entry in held:
+            heapq.heappush(leaf_heap, entry)
+        return leaf
+
+    def forget(m):
+        """remove the leaf m from memory, and make its parent remember m's f-value"""
+        p = m.parent
+        p.children[p.children.index(m)] = float(m.f)
+        p.kids -= 1
+        p.in_open = True
+        m.version = -1
+        update(p)
+
+    def backup(x):
+        """if all of x's children have been generated, back up their least f-value"""
+        while x and None not in x.children:
+            f = min([c if isinstance(c, float) else c.f for c in x.children], default=infinity)
+            if f == x.f:
+                return
+            x.f = f
+            update(x)
+            x = x.parent
+
+    node_count = 1      # total number of generated nodes
+    prunes = 0          # total number of pruned or forgotten nodes
+    explored = 0        # total number of times a node was chosen
+    root = TreeNode(s0, None, 0, h(s0), node_count)
+    root.in_open = True
+    update(root)
+    in_memory = 1
+    peak = 1
+    while open_heap:
+        entry = open_heap[0]
+        x = entry[5]
+        if entry[4] != x.version or not x.in_open:
+            heapq.heappop(open_heap)
+            continue
+        if entry[0] == infinity:
+            break
+        explored += 1
+        if verbose >= 2: print('{0:>3} Expand'.format(explored), nodeinfo(x,template))
+        if x.successors is None:
+            if goal_test(x.state):
+                frontier_size = len([e for e in open_heap if e[4] == e[5].version and e[5].in_open])
+                solution = finish(x, node_count, prunes, frontier_size, explored, \
+                    verbose, draw_edges)
+                if record:  record.count(node_count, prunes, explored, peak)
+                if verbose >= 1:    print('==> Peak of {} nodes in memory.'.format(peak))
+                return solution
+            x.successors = list(next_states(x.state))
+            x.children = [None for s in x.successors]
+            if not x.successors:
+                x.in_open = False
+                update(x)
+                backup(x)       # x can't lead to a solution, so this makes x.f infinite
+                if verbose >= 2: print('')
+                continue
+
+        # The first time x is chosen, generate all of its children; after that, regenerate
+        # the forgotten child that had the least f-value. A child that can't lead to a
+        # solution (it's on the path, or it's too deep to fit in memory) isn't kept.
+        if None in x.children:
+            todo = range(len(x.children))
+        else:
+            todo = [min([j for j in range(len(x.children)) if isinstance(x.children[j], float)], \
+                key=lambda j: x.children[j])]
+        new = []
+        n_prune = []
+        f_prune = []
+        for i in todo:
+            (s, cost) = x.successors[i]
+            node_count += 1
+            y = TreeNode(s, x, cost, h(s), node_count)
+            y.f = max(y.f, x.f, x.children[i] or 0)
+            if on_path(s, x) or (y.depth >= max_nodes - 1 and not goal_test(s)):
+                x.children[i] = infinity
+                n_prune.append(y)
+                continue
+            if in_memory >= max_nodes:
+                m = worst_leaf(x)
+                if m:
+                    forget(m)
+                    in_memory -= 1
+                    if m in new:    new.remove(m)
+                    f_prune.append(m)
+            if in_memory < max_nodes:
+                x.children[i] = y
+                x.kids += 1
+                in_memory += 1
+                peak = max(peak, in_memory)
+                y.in_open = True
+                update(y)
+                new.append(y)
+            else:
+                x.children[i] = float(y.f)
+                n_prune.append(y)
+        prunes += len(n_prune) + len(f_prune)
+
+        # x stays in open until all of its children are in memory
+        if not [c for c in x.children if c is None or isinstance(c, float) and c < infinity]:
+            x.in_open = False
+        update(x)
+        backup(x)
+        if verbose >= 2:
+            printnodes('add', new, 'sma*', verbose)
+            if n_prune: printnodes('discard', n_prune, 'sma*', verbose)
+            if f_prune: printnodes('forget', f_prune, 'sma*', verbose)
+            print('')
+        if draw_edges:
+            draw_expand(x, n_prune, new, f_prune, [], draw_edges)
+    if verbose >= 3:    print("==> Couldn't find a solution within {} nodes.".format(max_nodes))
+    if record:  record.count(node_count, prunes, explored, peak)
+    return False
+
+
+def ara_star(s0, next_states, goal_test, h, weight, weight_step, on_solution, verbose, \
+             draw_edges, pack, unpack, record=None, deadline=None):
+    """
+    Anytime repairing A*. It does a weighted A* search (key g + weight*h) that stops as
+    soon as no node in open has a smaller key than the best solution's cost, so the
+    solution it has then costs at most weight times the optimal cost. Solutions are
+    reported to on_solution when they're generated, in the middle of a search, so the
+    bound doesn't hold for them until that search ends. Then it lowers the weight and
+    searches again, keeping all of its g-values. Nodes whose g-value went down after
+    they were expanded are put back into open, and the other explored nodes aren't
+    expanded again unless their g-value goes down. The last search uses weight 1, so
+    its solution is optimal if h is admissible and consistent. The other arguments are
+    the same as for main, and record is a Stats or None. Return the best solution found,
+    when the last search is done or when time.time() gets to deadline, if that's first.
+    """
+    if not h: h = lambda s: 0
+    template = sort_options['ara*'][2]
+    store = NodeStore(pack, unpack)
+    states = store.states
+    best = {}           # the node with the least g-value found so far, for each state
+    open_set = set()    # states whose node is in open
+    closed = set()      # states expanded during the current search
+    incons = set()      # states whose g-value went down after they were expanded
+    goal = None         # ID# of the node at the end of the best solution
+    goal_cost = infinity
+    prunes = 0
+    explored = 0
+    peak = 1            # most states in open at once
+
+    def report(x):
+        """x is a goal node that's better than the previous one"""
+        nonlocal goal, goal_cost
+        goal = x
+        goal_cost = store.g[x]
+        cost = int(goal_cost) if goal_cost.is_integer() else goal_cost
+        if verbose >= 1:
+            print('==> ara* weight {:.2f}: path length {}, cost {}.'.format( \
+                weight, store.depth[x], cost))
+        if on_solution:
+            on_solution([y.state for y in getpath(Node(store, x))], cost, weight)
+
+    x = store.add(s0, 0, 0, h(s0))
+    best[states[x]] = x
+    if goal_test(s0):
+        report(x)
+    open_set.add(states[x])
+    frontier = [(store.g[x] + weight*store.h[x], x)]
+    out_of_time = False
+    while True:
+        # improve the path: do a weighted A* search until it can't beat the goal's cost
+        while frontier and frontier[0][0] < goal_cost:
+            if deadline is not None and time.time() >= deadline:
+                out_of_time = True
+                if verbose >= 1:    print('==> ara* ran out of time.')
+                break
+            (key, x) = heapq.heappop(frontier)
+            if best[states[x]] != x or states[x] not in open_set:
+                continue
+            open_set.discard(states[x])
+            closed.add(states[x])
+            explored += 1
+            if verbose >= 2: print('{0:>3} Expand'.format(explored), nodeinfo(Node(store, x),template))
+            new = []
+            n_prune = []
+            for (s,cost) in next_states(store.state(x)):
+                n = best.get(store.pack(s) if pack else s)
+                if n is not None and store.g[n] <= store.g[x] + cost:
+                    n_prune.append(store.add(s, x, cost, store.h[n]))
+                    continue
+                if n is None:   m = store.add(s, x, cost, h(s))
+                else:           m = store.add(s, x, cost, store.h[n])
+                best[states[m]] = m
+                new.append(m)
+                if states[m] in closed:
+                    incons.add(states[m])
+                else:
+                    open_set.add(states[m])
+                    heapq.heappush(frontier, (store.g[m] + weight*store.h[m], m))
+                if store.g[m] < goal_cost and goal_test(s):
+                    report(m)
+            prunes += len(n_prune)
+            peak = max(peak, len(open_set))
+            if verbose >= 2:
+                printnodes('add', [Node(store, m) for m in new], 'ara*', verbose)
+                if n_prune: printnodes('discard', [Node(store, m) for m in n_prune], 'ara*', verbose)
+                print('')
+            if draw_edges:
+                draw_expand(Node(store, x), [Node(store, m) for m in n_prune], \
+                    [Node(store, m) for m in new], [], [], draw_edges)
+        if out_of_time or weight <= 1 or goal is None and not frontier:
+            break
+        # lower the weight, move incons into open, and recompute the keys
+        weight = max(1, weight - weight_step)
+        open_set |= incons
+        incons = set()
+        closed = set()
+        frontier = [(store.g[best[sk]] + weight*store.h[best[sk]], best[sk]) for sk in open_set]
+        heapq.heapify(frontier)
+        if verbose >= 2:
+            print('==> ara* search with weight {:.2f}:\n'.format(weight))
+
+    if record:  record.count(len(store), prunes, explored, peak)
+    if goal is None:
+        if verbose >= 3:    print("==> Couldn't find a solution.")
+        return False
+    solution = finish(Node(store, goal), len(store), prunes, len(open_set), explored, \
+        verbose, draw_edges)
+    if verbose >= 1:    print_memory(store)
+    return solution
+
+
+def bidirectional(s0, next_states, prev_states, goals, h, h_back, strategy, verbose, \
+                  draw_edges, pack, unpack, record=None):
+    """
+    Bidirectional uniform-cost or A* search. One side searches forward from s0 using
+    next_states and h, and the other searches backward from all of the goals at once
+    using prev_states and h_back. Each side is a graph-search-redo search like main's,
+    and each time a side generates a node whose state the other side already has, that
+    gives a path whose cost is the sum of the two g-values. The side with the smaller
+    frontier is expanded next. The search stops when no path can cost less than the
+    best one found: for 'bi-uc', when the two frontiers' smallest g-values add up to at
+    least its cost, and for 'bi-a*', when either frontier's smallest f-value is at least
+    its cost. The solution is optimal if h and h_back are admissible and consistent.
+    The other arguments are the same as for main, and record is a Stats or None.
+    """
+    base = strategy[3:]     # each side uses the key and template of 'uc' or 'a*'
+    if base == 'uc':        h = h_back = None
+    else:
+        if not h:           h = lambda s: 0
+        if not h_back:      h_back = lambda s: 0
+    (key_name, key_func, template) = sort_options[strategy]
+    # everything is kept separately for the two sides; index 0 is forward, 1 is backward
+    stores = [NodeStore(pack, unpack), NodeStore(pack, unpack)]
+    bests = [{}, {}]
+    explored = [{}, {}]
+    frontiers = [[], []]
+    sizes = [0, 0]          # number of heap entries in each frontier that aren't pruned
+    successors = [next_states, prev_states]
+    heuristics = [h, h_back]
+    prunes = 0
+    meet = None             # (forward ID#, backward ID#) of the best path found so far
+    cost = infinity
+
+    def check(side, ids):
+        """check whether the new nodes in ids give better paths than the best one"""
+        nonlocal meet, cost
+        (store, other) = (stores[side], stores[1-side])
+        for m in ids:
+            n = bests[1-side].get(store.states[m])
+            if n is not None and store.g[m] + other.g[n] < cost:
+                cost = store.g[m] + other.g[n]
+                meet = (m, n) if side == 0 else (n, m)
+                if verbose >= 2:
+                    print('==> found a path with cost {:.2f} through {}\n'.format( \
+                        cost, store.state(m)))
+
+    def top(side):
+        """smallest key in a frontier, after discarding pruned heap entries"""
+        (frontier, store, best) = (frontiers[side], stores[side], bests[side])
+        while frontier and best.get(store.states[frontier[0][1]]) != frontier[0][1]:
+            heapq.heappop(frontier)
+        return frontier[0][0] if frontier else infinity
+
+    if verbose >= 2:
+        print('==> {} search, keep frontiers ordered by {}:\n'.format(strategy, key_name))
+    for (side, starts) in ((0, [s0]), (1, goals)):
+        (store, best, hf) = (stores[side], bests[side], heuristics[side])
+        for s in starts:
+            x = store.add(s, 0, 0, hf(s) if hf else None)
+            if store.states[x] not in best:
+                best[store.states[x]] = x
+                heapq.heappush(frontiers[side], (key_func(Node(store, x)), x))
+                sizes[side] += 1
+    check(0, [1])
+    peak = sizes[0] + sizes[1]
+    if record:  record.prune_time = 0.0
+    iteration = 0
+    while sizes[0] and sizes[1]:
+        (f0, f1) = (top(0), top(1))
+        if (f0 + f1 if base == 'uc' else max(f0, f1)) >= cost:
+            break
+        side = 0 if sizes[0] <= sizes[1] else 1
+        iteration += 1
+        x = pop_frontier(stores[side], frontiers[side], bests[side])
+        sizes[side] -= 1
+        explored[side][x] = iteration
+        if verbose >= 2:
+            print('{0:>3} Expand {1}'.format(iteration, ('forward', 'backward')[side]), \
+                nodeinfo(Node(stores[side], x),template))
+        if record:
+            times = (time.perf_counter(), record.next_states_time, record.h_time)
+        (new, n_prune, f_prune, e_prune) = expand(x, successors[side], heuristics[side], \
+            stores[side], frontiers[side], bests[side], explored[side], base, verbose, \
+            draw_edges)
+        if record:
+            record.prune_time += time.perf_counter() - times[0] \
+                - (record.next_states_time - times[1]) - (record.h_time - times[2])
+        sizes[side] += len(new) - len(f_prune)
+        peak = max(peak, sizes[0] + sizes[1])
+        prunes += len(n_prune) + len(f_prune) + len(e_prune)
+        check(side, new)
+        if verbose >= 4:
+            print("continue > ", end='')
+            sys.stdout.flush(); sys.stdin.readline()
+        elif verbose >= 2:  print('')
+
+    if record:
+        record.count(len(stores[0]) + len(stores[1]), prunes, \
+            len(explored[0]) + len(explored[1]), peak)
+    if meet is None:
+        if verbose >= 3:    print("==> Couldn't find a solution.")
+        if verbose >= 1:    print_memory(*stores)
+        return False
+    # the backward side's path goes from a goal to the meeting state, so reverse it
+    path = getpath(Node(stores[0], meet[0])) + getpath(Node(stores[1], meet[1]))[-2::-1]
+    if verbose >= 1:
+        if cost.is_integer(): cost = int(cost)
+        print('==> Path length {}, cost {}.'.format(len(path)-1,cost), \
+            'Generated {}, pruned {}, explored {}, frontier {}.'.format( \
+            len(stores[0]) + len(stores[1]), prunes, \
+            len(explored[0]) + len(explored[1]), sizes[0] + sizes[1]))
+        print_memory(*stores)
+    if draw_edges:
+        draw_edges([(x.state[0],y.state[0]) for (x,y) in zip(path, path[1:])], 'solution')
+    return [x.state for x in path]
+
+
+class Replanner():
+    """
+    A search graph that's kept from one call to the next, for choosing a move again
+    after each move. It's an A* search backward from the goals toward the current
+    state, using a user-supplied prev_states(s) and a heuristic h_back(s,s0) that
+    estimates the cost from s0 to s. Since the costs never change, every explored
+    node's g-value stays the exact cost from its state to the nearest goal, and the
+    path to a goal is just the chain of parents. So when the current state has already
+    been explored, plan returns at once. Otherwise, plan re-roots the search: it
+    recomputes the frontier's keys for the new current state (as D* Lite does when
+    the start moves) and keeps searching from where the last call stopped. Explored
+    nodes keep the h-values they had for an earlier root, so nodes for the same state
+    are compared by g-value alone; otherwise a node with a worse g-value could prune an
+    explored node whose h-value is larger.
+    A Replanner can be pickled, as long as pack and unpack can be.
+    """
+    __slots__ = ('store', 'best', 'explored', 'frontier', 'root', 'iteration')
+
+    def __init__(self, goals, pack=None, unpack=None):
+        self.store = NodeStore(pack, unpack)
+        self.best = {}          # the frontier or explored node for each state
+        self.explored = {}      # ID# of each explored node, and when it was expanded
+        self.frontier = []      # heap of (key, ID#), as in main
+        self.root = None        # the state the frontier's keys are for
+        self.iteration = 0      # total number of expansions
+        for s in goals:
+            x = self.store.add(s, 0, 0, 0)
+            if self.store.states[x] not in self.best:
+                self.best[self.store.states[x]] = x
+                self.frontier.append((0, x))
+        heapq.heapify(self.frontier)
+
+    def has_path(self, s0):
+        """Tell whether plan can return a path from s0 without searching"""
+        x = self.best.get(self.store.pack(s0) if self.store.pack else s0)
+        return x is not None and x in self.explored
+
+    def plan(self, s0, prev_states, h_back, verbose=0, max_expansions=None):
+        """
+        Return a least-cost path (a list of states) from s0 to a goal, or False if
+        there isn't one. prev_states(s) returns the parents of state s as (state, cost)
+        pairs, and h_back(s,s0) must be admissible and consistent. If max_expansions
+        is given and the search hasn't reached s0 after that many expansions, return
+        None; the graph is left as it is, so the next call (which may be after the
+        Replanner has been pickled) picks up where this one stopped.
+        """
+        (store, best, explored) = (self.store, self.best, self.explored)
+        states = store.states
+        start = store.pack(s0) if store.pack else s0
+        h = lambda s: h_back(s, s0)
+        template = sort_options['a*'][2]
+        count = 0               # number of expansions in this call
+        x = best.get(start)
+        if x is None or x not in explored:
+            if s0 != self.root:
+                self.root = s0
+                live = {id for (key, id) in self.frontier if best.get(states[id]) == id}
+                for id in live:
+                    store.h[id] = h(store.state(id))
+                self.frontier = [(store.g[id] + store.h[id], id) for id in live]
+                heapq.heapify(self.frontier)
+            frontier = self.frontier
+            while True:
+                # discard pruned heap entries, to see whether the frontier is empty
+                while frontier and best.get(states[frontier[0][1]]) != frontier[0][1]:
+                    heapq.heappop(frontier)
+                if not frontier:
+                    if verbose >= 1:
+                        print("==> Replanner couldn't find a solution after {} expansions." \
+                            .format(count))
+                    return False
+                if max_expansions is not None and count >= max_expansions:
+                    if verbose >= 1:
+                        print('==> Replanner stopped after {} expansions ({} in all, {} nodes).' \
+                            .format(count, self.iteration, len(store)))
+                    return None
+                self.iteration += 1
+                count += 1
+                x = heapq.heappop(frontier)[1]
+                explored[x] = self.iteration
+                if verbose >= 2:
+                    print('{0:>3} Expand'.format(self.iteration), nodeinfo(Node(store, x),template))
+                # expand x even if it's the start, so that its parents are in the graph
+                # for later calls
+                expand(x, prev_states, h, store, frontier, best, explored, 'a*', verbose, None, \
+                    by_g=True)
+                if verbose >= 2:    print('')
+                if states[x] == start:
+                    break
+        path = [y.state for y in getpath(Node(store, x))]
+        path.reverse()
+        if verbose >= 1:
+            print('==> Replanned with {} expansions ({} in all, {} nodes): path length {}.' \
+                .format(count, self.iteration, len(store), len(path)-1))
+        return path
@@ -0,0 +1,1097 @@
+"""
+File: geometry.py
+Segment-intersection tests for the racetrack programs. racetrack_example, env,
+opponents, proj2 and proj2_example all use these, rather than keeping their own
+copies of intersect.
+
+crash tests one move against the walls. crash_mask tests a whole list of moves
+against the walls at once; if NumPy is installed it does this with a single array
+operation, otherwise it falls back to calling crash on each move. Both of them
+look the walls up in a WallIndex, so that a move is only tested against walls
+near it.
+"""
+
+import math
+import heapq
+from array import array
+
+try:
+    import numpy as np
+except ImportError:                     # crash_mask still works, just more slowly
+    np = None
+
+infinity = float('inf')
+
+chunk_size = 1 << 20    # largest number of move-wall pairs crash_mask tests at once
+small_batch = 16        # crash_mask calls crash instead of NumPy for fewer moves than this
+cell_size = 4           # width and height of a WallIndex bucket, in lattice units
+
+
+def crash(move,walls):
+    """Test whether move intersects a wall in walls"""
+    return wall_index(walls).crash(move)
+
+
+def crash_mask(moves,walls):
+    """
+    Test each move in moves against every wall in walls. Return a sequence of
+    booleans, one per move, whose i'th element is crash(moves[i],walls).
+    With NumPy this is a boolean array, otherwise it's a list.
+    """
+    return wall_index(walls).crash_mask(moves)
+
+
+class WallIndex():
+    """
+    A uniform grid over a list of walls. Each bucket is a cell_size x cell_size
+    square of the plane, and holds the numbers of the walls whose bounding boxes
+    touch it. crash and crash_mask only test a move against the walls in the buckets
+    that the move's bounding box touches. queries and tested count the moves tested
+    and the walls they were tested against, for candidates_per_query.
+    """
+    __slots__ = ('walls', 'size', 'cell', 'buckets', 'nbuckets', 'arrays', \
+                 'queries', 'tested')
+
+    def __init__(self, walls, cell=None):
+        self.cell = cell or cell_size
+        self.queries = 0
+        self.tested = 0
+        self.rebuild(walls)
+
+    def rebuild(self, walls):
+        """Index walls instead of the old walls list (the counters are kept)"""
+        self.walls = walls
+        self.size = len(walls)
+        c = self.cell
+        self.buckets = {}
+        for (n, ((xa,ya),(xb,yb))) in enumerate(walls):
+            for i in range(int(min(xa,xb)//c), int(max(xa,xb)//c)+1):
+                for j in range(int(min(ya,yb)//c), int(max(ya,yb)//c)+1):
+                    self.buckets.setdefault((i,j), []).append(n)
+        self.nbuckets = len(self.buckets)
+        self.arrays = None          # crash_mask's NumPy arrays, made when needed
+
+    def candidates(self, xlo, ylo, xhi, yhi):
+        """Return the numbers of the walls in the buckets the box touches"""
+        c = self.cell
+        (ilo, ihi) = (int(xlo//c), int(xhi//c))
+        (jlo, jhi) = (int(ylo//c), int(yhi//c))
+        if (ihi-ilo+1)*(jhi-jlo+1) >= self.nbuckets:
+            return range(self.size)     # cheaper than looking in every bucket
+        found = set()
+        buckets = self.buckets
+        for i in range(ilo, ihi+1):
+            for j in range(jlo, jhi+1):
+                b = buckets.get((i,j))
+                if b: found.update(b)
+        return found
+
+    def crash(self, move):
+        """Test whether move intersects one of the walls"""
+        ((xa,ya),(xb,yb)) = move
+        if xa > xb: (xa,xb) = (xb,xa)
+        if ya > yb: (ya,yb) = (yb,ya)
+        found = self.candidates(xa, ya, xb, yb)
+        self.queries += 1
+        self.tested += len(found)
+        walls = self.walls
+        for n in found:
+            if intersect(move,walls[n]): return True
+        return False
+
+    def crash_mask(self, moves):
+        """
+        Test each move in moves against the walls, as described in the crash_mask
+        function's docstring. The moves share one set of candidate walls, found from
+        the bounding box of all of them.
+        """
+        if np is None or len(moves) < small_batch or not self.walls:
+            return [self.crash(move) for move in moves]
+        # Keep the (M,W) arrays to about chunk_size elements each
+        rows = max(1, chunk_size // self.size)
+        if len(moves) > rows:
+            return np.concatenate([self.crash_mask(moves[i:i+rows]) \
+                for i in range(0,len(moves),rows)])
+        m = np.array(moves, dtype=float)        # shape (M,2,2)
+        found = self.candidates(m[:,:,0].min(), m[:,:,1].min(), \
+            m[:,:,0].max(), m[:,:,1].max())
+        self.queries += len(moves)
+        self.tested += len(moves)*len(found)
+        if not found:
+            return np.zeros(len(moves), dtype=bool)
+        if self.arrays is None:
+            w = np.array(self.walls, dtype=float)   # shape (W,2,2)
+            (ax, ay, bx, by) = (w[:,0,0], w[:,0,1], w[:,1,0], w[:,1,1])
+            self.arrays = (ax, ay, bx, by, np.minimum(ax,bx), np.maximum(ax,bx), \
+                np.minimum(ay,by), np.maximum(ay,by))
+        if len(found) == self.size:
+            arrays = self.arrays
+        else:
+            n = np.fromiter(found, dtype=np.intp, count=len(found))
+            arrays = [a[n] for a in self.arrays]
+        # Columns, so that broadcasting against the walls gives (M,W) arrays
+        return meet(m[:,0,0,None], m[:,0,1,None], m[:,1,0,None], m[:,1,1,None], \
+            *arrays).any(axis=1)
+
+    def candidates_per_query(self):
+        """average number of walls tested per move"""
+        return self.tested/self.queries if self.queries else 0.0
+
+    def summary(self):
+        return '{} walls, {} buckets'.format(self.size, self.nbuckets)
+
+
+def meet(pax, pay, pbx, pby, ax, ay, bx, by, xlo, xhi, ylo, yhi):
+    """
+    The NumPy kernel for crash_mask. Test whether the segments from (pax,pay) to
+    (pbx,pby) meet the walls from (ax,ay) to (bx,by), whose bounding boxes are given
+    by xlo, xhi, ylo, yhi. The arguments are arrays (or numbers) that broadcast
+    together, and so is the boolean result.
+    """
+    # The bounding boxes must overlap. This also settles the collinear case.
+    hit = (np.minimum(pax,pbx) <= xhi) & (np.maximum(pax,pbx) >= xlo) \
+        & (np.minimum(pay,pby) <= yhi) & (np.maximum(pay,pby) >= ylo)
+    # The move's endpoints mustn't be strictly on the same side of the wall ...
+    (wx, wy) = (bx-ax, by-ay)
+    s1 = np.sign(wx*(pay-ay) - wy*(pax-ax))
+    s2 = np.sign(wx*(pby-ay) - wy*(pbx-ax))
+    hit &= s1*s2 <= 0
+    # ... and the wall's endpoints mustn't be strictly on the same side of the move.
+    (mx, my) = (pbx-pax, pby-pay)
+    s3 = np.sign(mx*(ay-pay) - my*(ax-pax))
+    s4 = np.sign(mx*(by-pay) - my*(bx-pax))
+    hit &= s3*s4 <= 0
+    return hit
+
+
+# Flags for the cells of a RasterIndex's bitmap
+POINT = 1       # the lattice point (x,y) is on a wall
+UP = 2          # the unit edge from (x,y) to (x,y+1) is part of a wall
+RIGHT = 4       # the unit edge from (x,y) to (x+1,y) is part of a wall
+
+class RasterIndex():
+    """
+    An alternative to WallIndex, for moves between lattice points. The walls that
+    are vertical or horizontal and have integer endpoints are rasterized into a
+    bitmap that says, for each lattice point, whether the point is on a wall and
+    whether the unit edges going up and right from it are. A move from (x0,y0) to
+    (x1,y1) meets such a wall iff, on some grid line x=k or y=k it crosses, it
+    either goes through a lattice point that's on a wall or crosses a unit edge
+    that's part of one. crash finds those crossings with integer arithmetic, so
+    each query takes time proportional to the move's length. The other walls, if
+    any, go in a list that every move is tested against with intersect, and so do
+    moves whose endpoints aren't integers.
+
+    queries counts the moves tested and tested counts the grid lines (and other
+    walls) they were tested against, for candidates_per_query.
+    """
+    __slots__ = ('walls', 'size', 'bitmap', 'xmin', 'ymin', 'width', 'height', \
+                 'others', 'queries', 'tested')
+
+    def __init__(self, walls):
+        self.queries = 0
+        self.tested = 0
+        self.rebuild(walls)
+
+    def rebuild(self, walls):
+        """Rasterize walls instead of the old walls list (the counters are kept)"""
+        self.walls = walls
+        self.size = len(walls)
+        self.others = []
+        lines = []
+        for wall in walls:
+            ((xa,ya),(xb,yb)) = wall
+            if all(type(z) is int or z == int(z) for z in (xa,ya,xb,yb)) \
+                and (xa == xb or ya == yb):
+                lines.append((int(min(xa,xb)), int(min(ya,yb)), \
+                    int(max(xa,xb)), int(max(ya,yb))))
+            else:
+                self.others.append(wall)
+        if lines:
+            self.xmin = min(l[0] for l in lines)
+            self.ymin = min(l[1] for l in lines)
+            self.width = max(l[2] for l in lines) - self.xmin + 1
+            self.height = max(l[3] for l in lines) - self.ymin + 1
+        else:
+            (self.xmin, self.ymin, self.width, self.height) = (0, 0, 0, 0)
+        self.bitmap = bitmap = bytearray(self.width*self.height)
+        (xmin, ymin, height) = (self.xmin, self.ymin, self.height)
+        for (xa,ya,xb,yb) in lines:
+            if xa == xb:
+                for y in range(ya, yb+1):
+                    bitmap[(xa-xmin)*height + y-ymin] |= POINT | (UP if y < yb else 0)
+            else:
+                for x in range(xa, xb+1):
+                    bitmap[(x-xmin)*height + ya-ymin] |= POINT | (RIGHT if x < xb else 0)
+
+    def flag(self, x, y, f):
+        """Test whether the bitmap has flag f at the lattice point (x,y)"""
+        x -= self.xmin
+        y -= self.ymin
+        return 0 <= x < self.width and 0 <= y < self.height \
+            and self.bitmap[x*self.height + y] & f
+
+    def crash(self, move):
+        """Test whether move intersects one of the walls"""
+        self.queries += 1
+        ((x0,y0),(x1,y1)) = move
+        if not all(type(z) is int or z == int(z) for z in (x0,y0,x1,y1)):
+            self.tested += self.size
+            return any(intersect(move,wall) for wall in self.walls)
+        (x0, y0, x1, y1) = (int(x0), int(y0), int(x1), int(y1))
+        self.tested += len(self.others)
+        for wall in self.others:
+            if intersect(move,wall): return True
+        (dx, dy) = (x1-x0, y1-y0)
+        if dx < 0: (x0, y0, x1, y1, dx, dy) = (x1, y1, x0, y0, -dx, -dy)
+        self.tested += dx + abs(dy) + 1
+        if dx == 0:
+            # A vertical move is blocked iff one of its lattice points is on a wall
+            return any(self.flag(x0, y, POINT) for y in range(min(y0,y1), max(y0,y1)+1))
+        # Where the move crosses x = k, y = y0 + (k-x0)*dy/dx
+        for k in range(x0, x1+1):
+            (y, r) = divmod(y0*dx + (k-x0)*dy, dx)
+            if self.flag(k, y, POINT if r == 0 else UP): return True
+        if dy == 0:
+            return False
+        if dy < 0: (x0, y0, x1, y1, dx, dy) = (x1, y1, x0, y0, -dx, -dy)
+        # Where the move crosses y = k, x = x0 + (k-y0)*dx/dy. The lattice points
+        # were all checked above, so only the unit edges are left.
+        for k in range(y0+1, y1):
+            (x, r) = divmod(x0*dy + (k-y0)*dx, dy)
+            if r and self.flag(x, k, RIGHT): return True
+        return False
+
+    def crash_mask(self, moves):
+        """Test each move in moves against the walls, and return a list of booleans"""
+        return [self.crash(move) for move in moves]
+
+    def candidates_per_query(self):
+        """average number of grid lines and walls tested per move"""
+        return self.tested/self.queries if self.queries else 0.0
+
+    def summary(self):
+        return '{} walls, {}x{} bitmap, {} walls not rasterized'.format(self.size, \
+            self.width, self.height, len(self.others))
+
+
+# The kind of index that crash and crash_mask use: 'grid' for WallIndex, or
+# 'raster' for RasterIndex
+backend = 'grid'
+backends = {'grid': WallIndex, 'raster': RasterIndex}
+
+# The index that crash and crash_mask use, for the last walls list they were given
+_index = None
+
+def wall_index(walls):
+    """
+    Return the index (see backend) for walls. It's kept from one call to the next, and
+    rebuilt when walls is a different list, or has changed length. If you change walls
+    in place without changing its length, call rebuild_index(walls) afterwards.
+    """
+    global _index
+    if type(_index) is not backends[backend]:
+        _index = backends[backend](walls)
+    elif walls is not _index.walls or len(walls) != _index.size:
+        _index.rebuild(walls)
+    return _index
+
+def rebuild_index(walls):
+    """Rebuild the index that crash and crash_mask use, and forget the move table"""
+    global _table
+    wall_index(walls).rebuild(walls)
+    _table = None
+
+def print_index_stats():
+    """Print how many walls crash and crash_mask have tested per move, on average"""
+    if _index is not None:
+        print('{} crash queries, {:.2f} candidates per query ({})'.format(_index.queries, \
+            _index.candidates_per_query(), _index.summary()))
+    if _table is not None:
+        print('{} move table lookups, {} cells filled ({})'.format(_table.lookups, \
+            _table.nfilled, _table.summary()))
+
+
+max_speed = 6           # largest displacement a MoveTable tabulates ...
+table_budget = 1 << 24  # ... unless that would take more than this many bytes
+
+# The errors an opponent can add to a move's endpoint
+errors = [(q,r) for q in (-1,0,1) for r in (-1,0,1)]
+
+class MoveTable():
+    """
+    Whether the move from a lattice point (x,y) to (x+dx,y+dy) crashes depends only
+    on those four integers, so a MoveTable remembers the answers. For each point in
+    the walls' bounding box it has a bitmask with one bit per displacement (dx,dy)
+    with |dx|,|dy| <= speed, set if that move crashes. speed is max_speed, or less
+    if the table would need more than budget bytes.
+
+    It has a second bitmask per point for crash_fans, whose bit for (dx,dy) is set
+    if the move crashes when any of the 9 errors in errors is added to its endpoint.
+    That's the first bitmask dilated by one step in each direction, i.e., the set
+    of displacements within one step of a crashing one.
+
+    Both bitmasks for a point are filled the first time it's needed, with one
+    crash_mask call, and after that a query is a lookup in a bytearray. Queries the
+    table doesn't cover are answered by calling crash or crash_mask.
+
+    A MoveTable can be pickled, to keep it with a track's other precomputed data.
+    lookups counts the queries answered from the table, and nfilled the points whose
+    bitmasks have been filled.
+    """
+    __slots__ = ('walls', 'size', 'xmin', 'ymin', 'width', 'height', 'speed', 'span', \
+                 'nbytes', 'bits', 'fans', 'filled', 'nfilled', 'lookups')
+
+    def __init__(self, walls, speed=None, budget=None):
+        self.walls = walls
+        self.size = len(walls)
+        self.lookups = 0
+        self.nfilled = 0
+        if walls:
+            xs = [x for wall in walls for (x,y) in wall]
+            ys = [y for wall in walls for (x,y) in wall]
+            (self.xmin, self.ymin) = (int(min(xs)), int(min(ys)))
+            self.width = int(max(xs)) - self.xmin + 1
+            self.height = int(max(ys)) - self.ymin + 1
+        else:
+            (self.xmin, self.ymin, self.width, self.height) = (0, 0, 0, 0)
+        # Each point needs nbytes for each bitmask and one byte to say it's been filled
+        cells = self.width*self.height
+        budget = budget or table_budget
+        speed = max_speed if speed is None else speed
+        while speed > 0 and cells*(2*(((2*speed+1)**2 + 7)//8) + 1) > budget:
+            speed -= 1
+        self.speed = speed
+        self.span = 2*speed + 1
+        self.nbytes = (self.span**2 + 7)//8
+        self.bits = bytearray(cells*self.nbytes)
+        self.fans = bytearray(cells*self.nbytes)
+        self.filled = bytearray(cells)
+
+    def fill(self, x, y, cell):
+        """Compute the bitmasks for (x,y), whose number in the table is cell"""
+        # Test the displacements up to speed+1, so that the fans at the edge of the
+        # table are complete. Bit k of raw is displacement k in row-major order.
+        s = self.speed + 1
+        w = 2*s + 1
+        moves = [((x,y),(x+dx,y+dy)) for dx in range(-s,s+1) for dy in range(-s,s+1)]
+        raw = 0
+        for (k, c) in enumerate(crash_mask(moves, self.walls)):
+            if c: raw |= 1 << k
+        # Dilate raw along the rows (dy) and then along the columns (dx), without
+        # letting bits wrap around from the end of one row to the next.
+        first = sum(1 << (k*w) for k in range(w))       # the bits where dy = -s
+        last = first << (w-1)                           # the bits where dy = s
+        fan = raw | (raw << 1 & ~first) | (raw >> 1 & ~last)
+        fan |= (fan << w) | (fan >> w)
+        # Keep the middle span x span square of each
+        (span, row) = (self.span, (1 << self.span) - 1)
+        (mask, fans) = (0, 0)
+        for dx in range(span):
+            shift = (dx+1)*w + 1
+            mask |= (raw >> shift & row) << (dx*span)
+            fans |= (fan >> shift & row) << (dx*span)
+        start = cell*self.nbytes
+        self.bits[start:start+self.nbytes] = mask.to_bytes(self.nbytes, 'little')
+        self.fans[start:start+self.nbytes] = fans.to_bytes(self.nbytes, 'little')
+        self.filled[cell] = 1
+        self.nfilled += 1
+
+    def lookup(self, loc, displacements, bits, test):
+        """
+        Look up each (dx,dy) in displacements in the bitmask for loc in bits. For a
+        displacement the table doesn't cover, call test(loc,(dx,dy)) instead.
+        """
+        (x, y) = loc
+        (i, j) = (x - self.xmin, y - self.ymin)
+        if not (type(x) is int and type(y) is int \
+            and 0 <= i < self.width and 0 <= j < self.height):
+            return [test(loc, d) for d in displacements]
+        cell = i*self.height + j
+        if not self.filled[cell]:
+            self.fill(x, y, cell)
+        (s, span, start) = (self.speed, self.span, cell*self.nbytes)
+        result = []
+        for (dx,dy) in displacements:
+            if -s <= dx <= s and -s <= dy <= s:
+                k = (dx+s)*span + dy+s
+                result.append(bits[start + (k >> 3)] >> (k & 7) & 1 == 1)
+                self.lookups += 1
+            else:
+                result.append(test(loc, (dx,dy)))
+        return result
+
+    def crashes(self, loc, displacements):
+        """
+        Return a list of booleans saying, for each (dx,dy) in displacements, whether
+        the move from loc to loc+(dx,dy) crashes.
+        """
+        walls = self.walls
+        test = lambda loc, d: crash((loc,(loc[0]+d[0],loc[1]+d[1])), walls)
+        return self.lookup(loc, displacements, self.bits, test)
+
+    def fan_crashes(self, loc, displacements):
+        """
+        Return a list of booleans saying, for each (dx,dy) in displacements, whether
+        the move from loc to loc+(dx,dy)+(q,r) crashes for any (q,r) in errors.
+        """
+        walls = self.walls
+        test = lambda loc, d: any(crash_mask([(loc,(loc[0]+d[0]+q,loc[1]+d[1]+r)) \
+            for (q,r) in errors], walls))
+        return self.lookup(loc, displacements, self.fans, test)
+
+    def summary(self):
+        return '{}x{} points, speed {}, {} bytes'.format(self.width, self.height, \
+            self.speed, len(self.bits) + len(self.fans) + len(self.filled))
+
+
+# The move table that crash_moves and crash_fans use, for the last walls list
+# they were given
+_table = None
+
+def move_table(walls):
+    """
+    Return the MoveTable for walls. Like wall_index, it's kept from one call to the
+    next, and replaced when walls is a different list or has changed length.
+    """
+    global _table
+    if _table is None or walls is not _table.walls or len(walls) != _table.size:
+        _table = MoveTable(walls)
+    return _table
+
+def use_move_table(table, walls):
+    """Make crash_moves and crash_fans use table, e.g. one saved earlier, for walls"""
+    global _table
+    table.walls = walls
+    _table = table
+
+def crash_moves(loc, displacements, walls):
+    """
+    Return a list of booleans saying, for each (dx,dy) in displacements, whether the
+    move from loc to loc+(dx,dy) crashes into a wall in walls. The answers come from
+    move_table(walls).
+    """
+    return move_table(walls).crashes(loc, displacements)
+
+def crash_fans(loc, displacements, walls):
+    """
+    Return a list of booleans saying, for each (dx,dy) in displacements, whether the
+    move from loc to loc+(dx,dy) can be made to crash by the opponent, i.e., whether
+    it crashes when any of the 9 errors is added to its endpoint. Each answer is one
+    lookup in move_table(walls), about the same cost as crash_moves.
+    """
+    return move_table(walls).fan_crashes(loc, displacements)
+
+
+class DistanceField():
+    """
+    For each lattice point p in the walls' bounding box (plus a margin of one, for
+    the opponent's errors), the squared distance from p to the nearest lattice point
+    on a wall, not counting wall points that can't be reached from p without
+    crossing f_line. Its square root is exactly what opponents.edistf_to_line gives
+    for the nearest wall. A wall's lattice points are the ones edistf_to_line uses:
+    the points of a vertical wall, or the points at the height of its first
+    endpoint for any other wall.
+
+    The field is filled in lazily, a point at a time, or all at once by fill; a
+    point outside the box is computed each time it's asked for. distance(p) returns
+    the distance, or infinity if no wall point is reachable.
+    """
+    __slots__ = ('f_line', 'walls', 'size', 'xmin', 'ymin', 'width', 'height', \
+                 'points', 'tx', 'ty', 'sq', 'nfilled')
+
+    def __init__(self, f_line, walls):
+        self.f_line = f_line
+        self.walls = walls
+        self.size = len(walls)
+        self.points = []
+        for ((x1,y1),(x2,y2)) in walls:
+            if x1 == x2:
+                self.points += [(x1,y) for y in range(min(y1,y2),max(y1,y2)+1)]
+            else:
+                self.points += [(x,y1) for x in range(min(x1,x2),max(x1,x2)+1)]
+        if self.points:
+            self.xmin = min(x for (x,y) in self.points) - 1
+            self.ymin = min(y for (x,y) in self.points) - 1
+            self.width = max(x for (x,y) in self.points) - self.xmin + 2
+            self.height = max(y for (x,y) in self.points) - self.ymin + 2
+        else:
+            (self.xmin, self.ymin, self.width, self.height) = (0, 0, 0, 0)
+        if np is not None and self.points:
+            self.tx = np.array([x for (x,y) in self.points], dtype=float)
+            self.ty = np.array([y for (x,y) in self.points], dtype=float)
+        # -1 means not computed yet
+        self.sq = array('d', [-1.0])*(self.width*self.height)
+        self.nfilled = 0
+
+    def compute(self, x, y):
+        """Return the squared distance for (x,y), without looking in the field"""
+        if not self.points:
+            return infinity
+        if np is None:
+            return min([(tx-x)**2 + (ty-y)**2 for (tx,ty) in self.points \
+                if not intersect(((x,y),(tx,ty)), self.f_line)] + [infinity])
+        ((fax,fay),(fbx,fby)) = self.f_line
+        sq = (self.tx-x)**2 + (self.ty-y)**2
+        sq[meet(x, y, self.tx, self.ty, fax, fay, fbx, fby, min(fax,fbx), max(fax,fbx), \
+            min(fay,fby), max(fay,fby))] = infinity
+        return float(sq.min())
+
+    def sqdistance(self, point):
+        """Return the squared distance for point"""
+        (x, y) = point
+        (i, j) = (x - self.xmin, y - self.ymin)
+        if not (0 <= i < self.width and 0 <= j < self.height):
+            return self.compute(x, y)
+        cell = i*self.height + j
+        sq = self.sq[cell]
+        if sq < 0:
+            sq = self.sq[cell] = self.compute(x, y)
+            self.nfilled += 1
+        return sq
+
+    def distance(self, point):
+        """Return the distance from point to the nearest reachable wall point"""
+        return math.sqrt(self.sqdistance(point))
+
+    def fill(self):
+        """Compute the whole field at once, with chunk_size-sized NumPy operations"""
+        if np is None or not self.points:
+            for x in range(self.xmin, self.xmin+self.width):
+                for y in range(self.ymin, self.ymin+self.height):
+                    self.sqdistance((x,y))
+            return
+        ((fax,fay),(fbx,fby)) = self.f_line
+        box = (min(fax,fbx), max(fax,fbx), min(fay,fby), max(fay,fby))
+        (tx, ty) = (self.tx[None,:], self.ty[None,:])
+        cells = np.arange(self.width*self.height)
+        rows = max(1, chunk_size // len(self.points))
+        for start in range(0, len(cells), rows):
+            c = cells[start:start+rows]
+            x = (c // self.height + self.xmin).astype(float)[:,None]
+            y = (c % self.height + self.ymin).astype(float)[:,None]
+            sq = (tx-x)**2 + (ty-y)**2
+            sq[meet(x, y, tx, ty, fax, fay, fbx, fby, *box)] = infinity
+            self.sq[start:start+len(c)] = array('d', sq.min(axis=1).tobytes())
+        self.nfilled = len(cells)
+
+    def summary(self):
+        return '{}x{} points, {} filled, {} wall points'.format(self.width, self.height, \
+            self.nfilled, len(self.points))
+
+
+# The distance field that distance_field returns, for the last track it was given
+_field = None
+
+def distance_field(f_line, walls):
+    """
+    Return the DistanceField for f_line and walls. It's kept from one call to the
+    next, and replaced when f_line or walls is a different list, or walls has
+    changed length.
+    """
+    global _field
+    if _field is None or f_line is not _field.f_line or walls is not _field.walls \
+        or len(walls) != _field.size:
+        _field = DistanceField(f_line, walls)
+    return _field
+
+
+def edge_distance(point, edge):
+    """
+    Euclidean distance from point to the nearest lattice point of edge, where edge is
+    vertical or horizontal (any other edge is treated as horizontal, at the height of
+    its first endpoint). That's the nearest lattice point to point's projection onto
+    the edge, so it takes constant time however long the edge is. For an integer
+    point it's also the distance from point to the edge.
+    """
+    (x,y) = point
+    ((x1,y1),(x2,y2)) = edge
+    if x1 == x2:
+        y3 = min(max(round(y), min(y1,y2)), max(y1,y2))
+        return math.sqrt((x1-x)**2 + (y3-y)**2)
+    else:
+        x3 = min(max(round(x), min(x1,x2)), max(x1,x2))
+        return math.sqrt((x3-x)**2 + (y1-y)**2)
+
+def edge_distances(points, edge):
+    """
+    Return edge_distance(p, edge) for each p in points, as a NumPy array if NumPy is
+    installed, otherwise as a list.
+    """
+    if np is None or not points:
+        return [edge_distance(p, edge) for p in points]
+    p = np.array(points, dtype=float)
+    (x, y) = (p[:,0], p[:,1])
+    ((x1,y1),(x2,y2)) = edge
+    if x1 == x2:
+        y3 = np.clip(np.rint(y), min(y1,y2), max(y1,y2))
+        return np.sqrt((x1-x)**2 + (y3-y)**2)
+    else:
+        x3 = np.clip(np.rint(x), min(x1,x2), max(x1,x2))
+        return np.sqrt((x3-x)**2 + (y1-y)**2)
+
+def edge_distance_blocked(point, edge, f_line):
+    """
+    Like edge_distance, but leave out the lattice points of edge that can't be reached
+    from point without intersecting f_line; return infinity if that's all of them.
+
+    The points of edge's line whose segments from point meet f_line form an interval
+    (the shadow of f_line, seen from point), so the blocked lattice points are a run
+    of consecutive ones. If the nearest lattice point is blocked, the answer is the
+    nearer of the two unblocked points just outside the run, whose ends are found by
+    binary search, so this makes O(log(length of edge)) calls to intersect.
+    """
+    (x,y) = point
+    ((x1,y1),(x2,y2)) = edge
+    if x1 == x2:
+        (c, lo, hi) = (y, min(y1,y2), max(y1,y2))
+        lattice = lambda k: (x1,k)
+    else:
+        (c, lo, hi) = (x, min(x1,x2), max(x1,x2))
+        lattice = lambda k: (k,y1)
+    blocked = lambda k: intersect(((x,y),lattice(k)), f_line)
+    def dist(k):
+        (xk,yk) = lattice(k)
+        return math.sqrt((xk-x)**2 + (yk-y)**2)
+    k0 = min(max(round(c), lo), hi)
+    if not blocked(k0):
+        return dist(k0)
+    best = infinity
+    if not blocked(lo):
+        # blocked(a) is false and blocked(b) is true; close in on the end of the run
+        (a, b) = (lo, k0)
+        while b - a > 1:
+            m = (a+b)//2
+            if blocked(m): b = m
+            else: a = m
+        best = dist(a)
+    if not blocked(hi):
+        (a, b) = (k0, hi)
+        while b - a > 1:
+            m = (a+b)//2
+            if blocked(m): a = m
+            else: b = m
+        best = min(best, dist(b))
+    return best
+
+
+def finish_distance_grid(f_line, walls, xmax, ymax, xmin=0, ymin=0):
+    """
+    Return a grid, as a list of lists indexed by [x-xmin][y-ymin] for xmin <= x <= xmax
+    and ymin <= y <= ymax, of the straight-line distance from each point to the nearest
+    lattice point of f_line that it can reach without crashing into a wall, or
+    infinity if there's none. That's what proj2_example's original edistw_to_finish
+    computed for a single point, and like it, this treats a finish line that isn't vertical as
+    horizontal, at the height of its first endpoint. Each point's answer depends only
+    on the point, so a big grid can be done in pieces, e.g. in parallel.
+
+    Rather than testing every point against every finish-line point, this computes,
+    for all the points at once and one wall at a time, the run of finish-line points
+    that the wall hides (its shadow on the finish line); see shadows. A point's
+    answer is then its nearest finish-line point, or if that one's hidden, the nearest
+    one just past the ends of the shadows that cover it. Without NumPy, _finish_column
+    does the same thing a point at a time. The points level with the finish line are
+    done by _finish_line_column.
+    """
+    ((x1,y1),(x2,y2)) = f_line
+    if x1 != x2:
+        # Swap x and y, so that the finish line is vertical
+        swap = lambda e: ((e[0][1],e[0][0]), (e[1][1],e[1][0]))
+        grid = finish_distance_grid(((y1,x1),(y1,x2)), [swap(w) for w in walls], \
+            ymax, xmax, ymin, xmin)
+        return [list(column) for column in zip(*grid)]
+    (fx, flo, fhi) = (x1, min(y1,y2), max(y1,y2))
+    if np is None:
+        return [_finish_line_column(ymin, ymax, fx, flo, fhi, walls) if x == fx \
+            else _finish_column(x, ymin, ymax, fx, flo, fhi, walls) \
+            for x in range(xmin, xmax+1)]
+    (width, height) = (xmax-xmin+1, ymax-ymin+1)
+    sq = np.empty(width*height)
+    cells = np.arange(len(sq))
+    rows = max(1, chunk_size // max(1, len(walls)))
+    for start in range(0, len(cells), rows):
+        c = cells[start:start+rows]
+        (px, py) = (xmin + c // height, ymin + c % height)
+        sq[start:start+len(c)] = _finish_sqdistances(px, py, fx, flo, fhi, walls)
+    # Points on the finish line's own line see it edge-on, so they're done separately
+    if xmin <= fx <= xmax:
+        start = (fx-xmin)*height
+        sq[start:start+height] = np.array(_finish_line_column(ymin, ymax, fx, flo, fhi, \
+            walls))**2
+    return np.sqrt(sq).reshape(width, height).tolist()
+
+def _finish_line_column(ymin, ymax, fx, flo, fhi, walls):
+    """
+    finish_distance_grid's answers for the points (fx,y), ymin <= y <= ymax, on the
+    finish line's own line. The move from (fx,y) to (fx,k) stays on that line, so it
+    crashes iff it overlaps the place where some wall meets the line. The moves to
+    farther finish-line points contain the move to the nearest one, so if that one
+    crashes, they all do, and only the nearest one needs to be tested.
+    """
+    # Where each wall meets the line x = fx, as (a, b, d) for the interval [a/d, b/d]
+    meets = []
+    for ((ax,ay),(bx,by)) in walls:
+        if ax == bx:
+            if ax == fx:
+                meets.append((min(ay,by), max(ay,by), 1))
+        elif min(ax,bx) <= fx <= max(ax,bx):
+            (n, d) = (ay*(bx-ax) + (fx-ax)*(by-ay), bx-ax)
+            if d < 0: (n, d) = (-n, -d)
+            meets.append((n, n, d))
+    column = []
+    for y in range(ymin, ymax+1):
+        k = min(max(y, flo), fhi)
+        (lo, hi) = (min(y,k), max(y,k))
+        if any(a <= hi*d and lo*d <= b for (a, b, d) in meets):
+            column.append(infinity)
+        else:
+            column.append(math.sqrt((k-y)**2))
+    return column
+
+def _finish_column(x, ymin, ymax, fx, flo, fhi, walls):
+    """
+    finish_distance_grid's answers for the points (x,y), ymin <= y <= ymax, where
+    x != fx, without NumPy. It's the same sweep as _finish_sqdistances, a point at a
+    time. A wall that lies wholly outside the slab from x to fx can't hide anything
+    from the column (or have a point of it on the wall), so it's left out.
+    """
+    sgn = 1 if fx > x else -1
+    dist = abs(fx - x)
+    near = [wall for wall in walls if not (max((wall[0][0]-x)*sgn, (wall[1][0]-x)*sgn) < 0 \
+        or min((wall[0][0]-x)*sgn, (wall[1][0]-x)*sgn) > dist)]
+    d = (fx - x)**2
+    column = []
+    for y in range(ymin, ymax+1):
+        shadows = [(lo, hi) for (lo, hi) in \
+            (_shadow(x, y, fx, wall) for wall in near) if lo <= hi]
+        c = min(max(y, flo), fhi)
+        # Walk up from the nearest finish-line point until it's not in a shadow, and
+        # then down, jumping over a whole shadow at a time.
+        (up, moved) = (c, True)
+        while moved and up <= fhi:
+            moved = False
+            for (lo, hi) in shadows:
+                if lo <= up <= hi:
+                    (up, moved) = (hi + 1, True)
+        (down, moved) = (c, True)
+        while moved and down >= flo:
+            moved = False
+            for (lo, hi) in shadows:
+                if lo <= down <= hi:
+                    (down, moved) = (lo - 1, True)
+        sq = infinity
+        if up <= fhi:   sq = d + (up - y)**2
+        if down >= flo: sq = min(sq, d + (down - y)**2)
+        column.append(math.sqrt(sq))
+    return column
+
+def _shadow(px, py, fx, wall):
+    """shadow for the single point (px,py), with numbers instead of arrays"""
+    ((ax,ay),(bx,by)) = wall
+    big = 1 << 62
+    if (bx-ax)*(py-ay) == (by-ay)*(px-ax) and min(ax,bx) <= px <= max(ax,bx) \
+        and min(ay,by) <= py <= max(ay,by):
+        return (-big, big)
+    sgn = 1 if fx > px else -1
+    dist = abs(fx - px)
+    ends = []
+    for (ex, ey) in ((ax,ay),(bx,by)):
+        u = (ex - px)*sgn
+        if u <= 0:
+            if bx != ax:
+                side = ((ay-py)*(bx-ax) + (px-ax)*(by-ay))*(bx-ax)
+            else:
+                side = ay - py
+            lo = hi = (side > 0) - (side < 0)
+            lo = hi = lo*big
+        elif u > dist and bx != ax:
+            (n, d) = (ay*(bx-ax) + (fx-ax)*(by-ay), bx-ax)
+            if d < 0: (n, d) = (-n, -d)
+            (lo, hi) = (-((-n)//d), n//d)
+        else:
+            num = py*u + dist*(ey - py)
+            (lo, hi) = (-((-num)//u), num//u)
+        ends.append((lo, hi, u))
+    ((lo_a, hi_a, ua), (lo_b, hi_b, ub)) = ends
+    if (ua <= 0 and ub <= 0) or (ua > dist and ub > dist):
+        return (big, -big)
+    return (min(lo_a, lo_b), max(hi_a, hi_b))
+
+def _finish_sqdistances(px, py, fx, flo, fhi, walls):
+    """
+    finish_distance_grid's squared answers for the points (px[i],py[i]), which must
+    not be on the line x = fx.
+    """
+    shadows = [shadow(px, py, fx, wall) for wall in walls]
+    # Walk up from the nearest finish-line point until it's not in a shadow, and
+    # then down, jumping over a whole shadow at a time.
+    c = np.clip(py, flo, fhi)
+    (up, down) = (c.copy(), c.copy())
+    for (k, step) in ((up, 1), (down, -1)):
+        active = np.ones(len(k), dtype=bool)
+        while active.any():
+            moved = np.zeros(len(k), dtype=bool)
+            for (lo, hi) in shadows:
+                hidden = active & (lo <= k) & (k <= hi)
+                k[hidden] = (hi if step > 0 else lo)[hidden] + step
+                moved |= hidden
+            active &= moved & (flo <= k) & (k <= fhi)
+    # (a shadow can reach 1 << 62, so keep the squares below from overflowing)
+    (up, down) = (np.minimum(up, fhi+1), np.maximum(down, flo-1))
+    d = (fx-px)**2
+    big = np.iinfo(np.int64).max
+    sq_up = np.where(up <= fhi, d + (up-py)**2, big)
+    sq_down = np.where(down >= flo, d + (down-py)**2, big)
+    sq = np.minimum(sq_up, sq_down).astype(float)
+    sq[(up > fhi) & (down < flo)] = infinity
+    return sq
+
+def shadow(px, py, fx, wall):
+    """
+    For each point p = (px[i],py[i]) not on the line x = fx, return the run of integers
+    k such that the segment from p to (fx,k) intersects wall, as arrays (lo, hi); if
+    there's none, lo > hi. This is exact, using integer arithmetic.
+
+    The segment from p to (fx,k) meets wall at a point q other than p iff q is in the
+    slab strictly past p and up to x = fx, and projecting q from p onto x = fx gives
+    (fx,k). So the run is the projection of the part of the wall in the slab, which
+    is an interval since the projection is monotonic there. At an end where the wall
+    leaves the slab at x = fx, the end of the interval is where the wall crosses
+    x = fx; where it leaves the slab next to p, the interval goes on forever.
+    """
+    ((ax,ay),(bx,by)) = wall
+    big = 1 << 62
+    sgn = np.sign(fx - px)
+    dist = np.abs(fx - px)
+    # If p is on the wall, every segment from p intersects it
+    on_wall = ((bx-ax)*(py-ay) == (by-ay)*(px-ax)) & (np.minimum(ax,bx) <= px) \
+        & (px <= np.maximum(ax,bx)) & (np.minimum(ay,by) <= py) & (py <= np.maximum(ay,by))
+    ends = []
+    for (ex, ey) in ((ax,ay),(bx,by)):
+        u = (ex - px)*sgn                   # how far the endpoint is toward x = fx
+        # the endpoint's projection, if it's in the slab ...
+        den = np.where(u > 0, u, 1)
+        num = py*den + dist*(ey - py)
+        (lo, hi) = (-((-num)//den), num//den)
+        # ... where the wall crosses x = fx, if the endpoint is past it ...
+        if bx != ax:
+            (n, d) = (ay*(bx-ax) + (fx-ax)*(by-ay), bx-ax)
+            if d < 0: (n, d) = (-n, -d)
+            lo = np.where(u > dist, -((-n)//d), lo)
+            hi = np.where(u > dist, n//d, hi)
+        # ... or + or - infinity if it's behind p (or level with it), depending on
+        # which side of p the wall passes
+        if bx != ax:
+            side = np.sign(((ay-py)*(bx-ax) + (px-ax)*(by-ay))*(bx-ax))
+        else:
+            side = np.sign(ay - py)
+        lo = np.where(u <= 0, side*big, lo)
+        hi = np.where(u <= 0, side*big, hi)
+        ends.append((lo, hi, u))
+    ((lo_a, hi_a, ua), (lo_b, hi_b, ub)) = ends
+    lo = np.minimum(lo_a, lo_b)
+    hi = np.maximum(hi_a, hi_b)
+    missed = ((ua <= 0) & (ub <= 0)) | ((ua > dist) & (ub > dist))
+    lo = np.where(on_wall, -big, np.where(missed, big, lo))
+    hi = np.where(on_wall, big, np.where(missed, -big, hi))
+    return (lo, hi)
+
+# The 8 steps to a neighboring lattice point, and their lengths
+steps = [(dx,dy) for dx in (-1,0,1) for dy in (-1,0,1) if dx or dy]
+step_lengths = [math.sqrt(dx*dx + dy*dy) for (dx,dy) in steps]
+
+def distance_grid(f_line, walls, xmax, ymax):
+    """
+    Return the wall-aware distance to f_line of every lattice point (x,y) with
+    0 <= x <= xmax and 0 <= y <= ymax, as an array('d') in which (x,y) is at
+    x*(ymax+1) + y. A point's distance is the length of the shortest path that takes
+    steps of length 1 or sqrt(2) to neighboring points without crashing, and then
+    goes to f_line in a straight line (i.e., finish_distance_grid's distance), or
+    infinity if there's no such path. This is the fixpoint that edist_grid in
+    proj2_example computes, and it's the same to the last bit. See GridSearch.
+    """
+    search = GridSearch(f_line, walls, xmax, ymax)
+    search.run()
+    return search.values()
+
+class GridSearch():
+    """
+    The search that distance_grid does, which can be run a few steps at a time.
+    run(steps) settles up to steps more points, and values() returns the distances
+    found so far, with NaN for the points that aren't settled yet. Giving it the
+    values from an unfinished search as known picks that search up where it left off.
+
+    It's Dijkstra's algorithm, with every point that can see f_line as a source. The
+    sources are sorted once, and only points whose distance improves on that go in
+    the heap. Which steps crash comes from the walls' raster (see RasterIndex): a
+    step between lattice points meets a vertical or horizontal wall with integer
+    endpoints iff one of its ends is on the wall. Steps that meet one of the other
+    walls are found by testing the steps near it.
+
+    The points are numbered with a border of one point on each side, so (x,y) is
+    point (x+1)*col + y+1. los, if given, has finish_distance_grid's distances, with
+    (x,y)'s at x*height + y, so that they can be computed some other way, and so does
+    known. settled counts the points settled, and missing the ones left.
+    """
+    __slots__ = ('width', 'height', 'col', 'free', 'cut', 'moves', 'dist', 'out', \
+                 'done', 'heap', 'sources', 'next', 'settled', 'missing', 'finished')
+
+    def __init__(self, f_line, walls, xmax, ymax, los=None, known=None):
+        (self.width, self.height) = (width, height) = (xmax+1, ymax+1)
+        if los is None:
+            los = [d for column in finish_distance_grid(f_line, walls, xmax, ymax) \
+                for d in column]
+        # free says which points aren't on a wall
+        self.col = col = height + 2
+        self.free = free = bytearray(col) + (b'\0' + b'\1'*height + b'\0')*width \
+            + bytearray(col)
+        raster = RasterIndex(walls)
+        on_wall = bytes(0 if k & POINT else 1 for k in range(256))
+        (lo, hi) = (max(0, raster.ymin), min(ymax, raster.ymin + raster.height - 1))
+        for x in range(max(0, raster.xmin), min(xmax, raster.xmin + raster.width - 1) + 1):
+            start = (x - raster.xmin)*raster.height - raster.ymin
+            free[(x+1)*col + lo+1 : (x+1)*col + hi+2] = \
+                raster.bitmap[start+lo : start+hi+1].translate(on_wall)
+        self.cut = _cut_steps(raster.others, xmax, ymax, col)
+        self.moves = [(dx*col + dy, length) for ((dx,dy), length) in zip(steps, step_lengths)]
+
+        # dist has the best distance found for each point, and out the distances of
+        # the settled points, with NaN for the rest
+        self.dist = dist = array('d', [infinity])*(col*(width+2))
+        for x in range(width):
+            dist[(x+1)*col + 1 : (x+1)*col + height+1] = array('d', los[x*height : (x+1)*height])
+        self.out = out = array('d', [math.nan])*len(dist)
+        self.done = done = bytearray(len(dist))
+        self.heap = []
+        self.settled = 0
+        if known is not None:
+            # The points were settled in order of distance, so the only ones whose
+            # neighbors may not be settled are those within sqrt(2) of the farthest
+            top = max([d for d in known if d < infinity], default=0)
+            shell = []
+            for x in range(width):
+                for y in range(height):
+                    d = known[x*height + y]
+                    if d < infinity:
+                        c = (x+1)*col + y+1
+                        dist[c] = out[c] = d
+                        done[c] = 1
+                        self.settled += 1
+                        if d > top - 1.5:
+                            shell.append(c)
+        # The sources, in order of the distances they start with
+        self.sources = [c for c in range(len(dist)) if dist[c] < infinity and not done[c]]
+        self.sources.sort(key=dist.__getitem__)
+        if known is not None:
+            for c in shell:
+                self.relax(c, dist[c])
+        self.next = 0
+        self.missing = width*height - self.settled
+        self.finished = False
+
+    def relax(self, c, d):
+        """Update the distances of point c's neighbors, given that c's distance is d"""
+        (free, done, dist, cut) = (self.free, self.done, self.dist, self.cut)
+        for (move, length) in self.moves:
+            e = c + move
+            if free[e] and not done[e] and d + length < dist[e] \
+                and not (cut and (c, e) in cut):
+                dist[e] = d + length
+                heapq.heappush(self.heap, (d + length, e))
+
+    def run(self, steps=None):
+        """
+        Settle up to steps more points, or all of them if steps is None, and return
+        True if the search is finished
+        """
+        (free, done, dist, out, cut, heap, sources, moves) = (self.free, self.done, \
+            self.dist, self.out, self.cut, self.heap, self.sources, self.moves)
+        (i, n, count) = (self.next, len(sources), 0)
+        while steps is None or count < steps:
+            # (A source whose distance has improved is also in the heap, with that
+            # distance, so it's all right to compare the heap with its new distance.)
+            if heap and (i == n or heap[0][0] < dist[sources[i]]):
+                (d, c) = heapq.heappop(heap)
+            elif i < n:
+                c = sources[i]
+                d = dist[c]
+                i += 1
+            else:
+                self.finished = True
+                break
+            if done[c]: continue
+            done[c] = 1
+            out[c] = d
+            count += 1
+            for (move, length) in moves:
+                e = c + move
+                if free[e] and not done[e] and d + length < dist[e] \
+                    and not (cut and (c, e) in cut):
+                    dist[e] = d + length
+                    heapq.heappush(heap, (d + length, e))
+        self.next = i
+        self.settled += count
+        self.missing -= count
+        return self.finished
+
+    def values(self):
+        """
+        Return the distances as an array('d') in which (x,y) is at x*height + y. Until
+        the search is finished, the points not settled yet are NaN; after that, the
+        ones it never reached are infinity.
+        """
+        (col, source) = (self.col, self.dist if self.finished else self.out)
+        result = array('d')
+        for x in range(self.width):
+            result.extend(source[(x+1)*col + 1 : (x+1)*col + self.height+1])
+        return result
+
+def _cut_steps(others, xmax, ymax, col):
+    """
+    The set of steps (c,e) between neighboring points, numbered as in GridSearch,
+    that intersect one of the walls in others
+    """
+    cut = set()
+    for wall in others:
+        ((xa,ya),(xb,yb)) = wall
+        xs = range(max(0, math.floor(min(xa,xb)) - 1), min(xmax, math.ceil(max(xa,xb)) + 1) + 1)
+        ys = range(max(0, math.floor(min(ya,yb)) - 1), min(ymax, math.ceil(max(ya,yb)) + 1) + 1)
+        for x in xs:
+            for y in ys:
+                for (dx,dy) in steps:
+                    if 0 <= x+dx <= xmax and 0 <= y+dy <= ymax \
+                        and intersect(((x,y),(x+dx,y+dy)), wall):
+                        cut.add(((x+1)*col + y+1, (x+dx+1)*col + y+dy+1))
+    return cut
+
+
+def intersect(e1,e2):
+    """
+    Test whether edges e1 and e2 intersect. This uses the same test as meet: the
+    bounding boxes must overlap, and neither edge's endpoints may lie strictly on
+    the same side of the other edge. The sides are the signs of cross products, so
+    nothing is divided and the answer is exact for integer coordinates. Collinear
+    edges and edges that are single points need no special cases, since their
+    cross products are all 0 and the bounding boxes settle them.
+    """
+    ((x1a,y1a), (x1b,y1b)) = e1
+    ((x2a,y2a), (x2b,y2b)) = e2
+    # Bounding boxes
+    if x1a < x1b:
+        if x1b < x2a and x1b < x2b or x1a > x2a and x1a > x2b: return False
+    elif x1a < x2a and x1a < x2b or x1b > x2a and x1b > x2b: return False
+    if y1a < y1b:
+        if y1b < y2a and y1b < y2b or y1a > y2a and y1a > y2b: return False
+    elif y1a < y2a and y1a < y2b or y1b > y2a and y1b > y2b: return False
+    # Which side of e2 are e1's endpoints on?
+    dx2 = x2b-x2a
+    dy2 = y2b-y2a
+    s1 = dx2*(y1a-y2a) - dy2*(x1a-x2a)
+    s2 = dx2*(y1b-y2a) - dy2*(x1b-x2a)
+    if s1 > 0 and s2 > 0 or s1 < 0 and s2 < 0: return False
+    # Which side of e1 are e2's endpoints on?
+    dx1 = x1b-x1a
+    dy1 = y1b-y1a
+    s3 = dx1*(y2a-y1a) - dy1*(x2a-x1a)
+    s4 = dx1*(y2b-y1a) - dy1*(x2b-x1a)
+    return not (s3 > 0 and s4 > 0 or s3 < 0 and s4 < 0)
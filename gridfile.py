@@ -0,0 +1,343 @@
+"""
+File: gridfile.py
+A binary file format for the heuristic grids that initialize computes and main reads,
+in place of writing them to data.txt as JSON. main runs in a new process for every
+move, and parsing a JSON list of lists takes time proportional to the grid's size;
+read_grid maps the file into memory instead, so it takes the same time for any size.
+
+A grid file is a 40-byte header followed by the grid's values as little-endian
+32-bit floats, with the value for (x,y) at x*height + y. The header is
+    magic         8 bytes, b'RTGRID2\\0'
+    width         4 bytes, unsigned (xmax+1)
+    height        4 bytes, unsigned (ymax+1)
+    missing       8 bytes, unsigned, how many of the values aren't computed yet
+    fingerprint   16 bytes, a hash of the finish line and walls (see fingerprint)
+so a grid written for one track is never read for another. The values that aren't
+computed yet are NaN: compute_grid writes the grid every so often while it's
+computing it, so that if it's killed (e.g., when initialize runs out of time), the
+part it's done isn't lost, and the next call can pick up from there. Those partial
+grids have magic b'RTGRID2D' and 64-bit floats instead, so that the next call picks
+up from exactly the distances it had, and finishes with the same grid as a call
+that was never stopped.
+
+The walls' geometry.MoveTable is kept in a file too (see write_move_table), since
+main fills in more of it on every move. That file is a pickle of the track's
+fingerprint and the table.
+"""
+
+import sys
+import os
+import math
+import time
+import mmap
+import struct
+import hashlib
+import pickle
+import signal
+import multiprocessing as mp            # for finish_distances' worker processes
+from array import array
+import geometry
+
+magic = b'RTGRID2\0'             # for a grid of 32-bit floats
+magic64 = b'RTGRID2D'           # for a grid of 64-bit floats
+header = struct.Struct('<8sIIQ16s')
+
+checkpoint_interval = 1.0   # seconds between the partial grids that compute_grid writes
+checkpoint_steps = 10000    # points compute_grid's search settles between looks at the clock
+parallel_cells = 1 << 18    # finish_distances uses one process for grids with fewer points
+strip_cells = 1 << 14       # about how many points are in each of finish_distances' strips
+
+def fingerprint(f_line, walls):
+    """
+    Return a 16-byte hash of f_line and walls. Lists and tuples, and ints and
+    floats with the same value, hash the same.
+    """
+    def canon(z):
+        if isinstance(z, (list, tuple)):
+            return tuple(canon(e) for e in z)
+        return float(z)
+    text = repr((canon(f_line), canon(walls)))
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+def as_grid(values, width, height):
+    """
+    Return a view of values (an array, or anything else with the buffer interface,
+    holding width*height floats with the value for (x,y) at x*height + y) that's
+    indexed by grid[x,y]
+    """
+    view = memoryview(values)
+    return view.cast('B').cast(view.format, (width, height))
+
+def write_grid(filename, grid, f_line, walls, missing=0, typecode='f'):
+    """
+    Write grid (a view made by as_grid) to filename, for the track given by f_line
+    and walls, saying that missing of its values are NaN because they haven't been
+    computed yet. The values are written as 32-bit floats, or as 64-bit floats if
+    typecode is 'd'. It's written to a temporary file that's then renamed, so a
+    reader never sees a half-written grid.
+    """
+    (width, height) = grid.shape
+    values = array(typecode, grid.cast('B').cast(grid.format))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    temp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(temp, 'wb') as grid_file:
+        grid_file.write(header.pack(magic if typecode == 'f' else magic64, width, height, \
+            missing, fingerprint(f_line, walls)))
+        values.tofile(grid_file)
+    os.replace(temp, filename)
+
+def read_grid(filename, f_line, walls):
+    """
+    Map the grid in filename into memory, and return a view of it that's indexed by
+    grid[x,y]. Return None if there's no such file, or it isn't a grid file for the
+    track given by f_line and walls. The grid may have NaN for values that haven't
+    been computed yet.
+    """
+    mapped = map_grid(filename, f_line, walls)
+    return None if mapped is None else mapped[0]
+
+def map_grid(filename, f_line, walls):
+    """
+    Like read_grid, but return (grid, missing), where missing is how many of the
+    grid's values haven't been computed yet, or None
+    """
+    mapped = _map(filename, f_line, walls)
+    return None if mapped is None else (as_grid(*mapped[:3]), mapped[3])
+
+def close_grid(grid):
+    """
+    Unmap grid, a view that read_grid returned (or one of _map's), which can't be
+    used after this. A file can't be replaced while it's mapped on Windows, so this
+    must be done before writing a new grid to the file it came from.
+    """
+    data = grid.obj
+    grid.release()
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+def _map(filename, f_line, walls):
+    """
+    Map the grid in filename into memory, and return (values, width, height, missing),
+    where values is a flat view of it, or None if read_grid would return None
+    """
+    try:
+        with open(filename, 'rb') as grid_file:
+            data = mmap.mmap(grid_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):           # ValueError if the file is empty
+        return None
+    if len(data) < header.size:
+        return None
+    (m, width, height, missing, f) = header.unpack_from(data)
+    typecode = {magic: 'f', magic64: 'd'}.get(m)
+    if typecode is None or f != fingerprint(f_line, walls) \
+        or len(data) != header.size + array(typecode).itemsize*width*height:
+        return None
+    values = memoryview(data)[header.size:].cast(typecode)
+    if sys.byteorder == 'big':
+        values = array(typecode, values)
+        values.byteswap()
+    return (values, width, height, missing)
+
+def write_move_table(filename, table, f_line, walls):
+    """
+    Write table (a geometry.MoveTable) to filename, for the track given by f_line and
+    walls. Like write_grid, it's written to a temporary file that's then renamed.
+    """
+    temp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(temp, 'wb') as table_file:
+        pickle.dump((fingerprint(f_line, walls), table), table_file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, filename)
+
+def read_move_table(filename, f_line, walls):
+    """
+    Return the geometry.MoveTable in filename, set up for walls, or None if there's
+    no such file, or it isn't a move table for the track given by f_line and walls
+    """
+    try:
+        with open(filename, 'rb') as table_file:
+            (f, table) = pickle.load(table_file)
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        return None
+    if f != fingerprint(f_line, walls) or not isinstance(table, geometry.MoveTable):
+        return None
+    table.walls = walls
+    return table
+
+def compute_grid(filename, f_line, walls, processes=None):
+    """
+    Compute geometry.distance_grid for the track given by f_line and walls, and
+    write it to filename. Every checkpoint_interval seconds, write the part that's
+    been computed so far, as 64-bit floats. If filename already has a partial grid
+    for this track, carry on from it, and if it has the whole grid, just return that.
+    Return the grid, as a view indexed by grid[x,y]; it's the same, to the last bit,
+    whether or not it was carried on from a partial grid. The finished grid is
+    written as 32-bit floats.
+
+    The first part of the computation is finish_distances, which is done in worker
+    processes (see there). Its distances are kept in filename + '.los' until the
+    grid is finished, and written there as they're computed, so that a call that
+    carries on from a partial grid, or from a partial first part, needn't compute
+    them again. The second part, geometry.GridSearch, is done here.
+    """
+    xmax = max([max(x,x1) for ((x,y),(x1,y1)) in walls])
+    ymax = max([max(y,y1) for ((x,y),(x1,y1)) in walls])
+    (width, height) = (xmax+1, ymax+1)
+    mapped = _map(filename, f_line, walls)
+    known = None
+    if mapped is not None:
+        if mapped[1:3] == (width, height):
+            if mapped[3] == 0:
+                return as_grid(mapped[0], width, height)
+            known = array('d', mapped[0])
+        # unmap the file (having copied any partial grid), so that it can be replaced
+        close_grid(mapped[0])
+    if known is None:
+        # Write a grid with nothing computed yet, so that main has one to read
+        empty = array('f', [math.nan])*(width*height)
+        write_grid(filename, as_grid(empty, width, height), f_line, walls, width*height)
+    los_file = filename + '.los'
+    los = finish_distances(f_line, walls, xmax, ymax, processes, los_file)
+    search = geometry.GridSearch(f_line, walls, xmax, ymax, los=los, known=known)
+    start = time.time()
+    while not search.run(checkpoint_steps):
+        if time.time() - start >= checkpoint_interval:
+            grid = as_grid(search.values(), width, height)
+            write_grid(filename, grid, f_line, walls, search.missing, 'd')
+            start = time.time()
+    grid = as_grid(search.values(), width, height)
+    write_grid(filename, grid, f_line, walls)
+    try:
+        os.remove(los_file)
+    except OSError:
+        pass
+    return grid
+
+def finish_distances(f_line, walls, xmax, ymax, processes=None, filename=None):
+    """
+    Return geometry.finish_distance_grid's distances for 0 <= x <= xmax and
+    0 <= y <= ymax, as an array with (x,y)'s at x*(ymax+1) + y. Each point's distance
+    depends only on the point, so the grid is cut into strips of columns with about
+    strip_cells points each. If the grid has at least parallel_cells points, the
+    strips are done in worker processes (processes of them, or one per CPU if
+    processes is None; see start_workers), with at least four strips per process so
+    that they all finish at about the same time.
+
+    If filename is given, the strips are written to it, as a grid file of 64-bit
+    floats with NaN for the columns that aren't done yet, every checkpoint_interval
+    seconds and at the end. If it already has some of the columns (from a call that was killed), only
+    the rest are computed.
+
+    While the workers are running, SIGTERM (which is how env kills initialize and
+    main) raises SystemExit, so that the workers are terminated too, rather than
+    being left to run on after their parent is gone.
+    """
+    processes = processes or mp.cpu_count()
+    (width, height) = (xmax+1, ymax+1)
+    los = array('d', [math.nan])*(width*height)
+    first = 0                   # the first column that isn't done
+    saved = _map(filename, f_line, walls) if filename else None
+    if saved is not None:
+        if saved[1:3] == (width, height):
+            first = (width*height - saved[3]) // height
+            los[:first*height] = array('d', saved[0][:first*height])
+        close_grid(saved[0])
+    cols = width - first
+    if cols == 0:
+        return los
+    parallel = processes > 1 and width*height >= parallel_cells
+    n = max(1, -(-cols*height // strip_cells))
+    if parallel:
+        n = max(n, 4*processes)
+    n = min(n, cols)
+    bounds = [first + cols*i//n for i in range(n+1)]
+    strips = [(bounds[i], bounds[i+1]-1) for i in range(n)]
+    (workers, handler) = ([], None)
+    if parallel:
+        workers = start_workers(processes, f_line, walls, ymax)
+        parts = worker_strips(workers, strips)
+        try:
+            # (after the workers are forked, so that they don't get it too)
+            handler = signal.signal(signal.SIGTERM, _exit_on_sigterm)
+        except ValueError:          # not in the main thread
+            pass
+    else:
+        parts = (strip_distances(f_line, walls, ymax, strip) for strip in strips)
+    try:
+        start = time.time()
+        for ((x0, x1), part) in zip(strips, parts):
+            los[x0*height : (x1+1)*height] = part
+            if filename and (x1 == xmax or time.time() - start >= checkpoint_interval):
+                write_grid(filename, as_grid(los, width, height), f_line, walls, \
+                    (xmax-x1)*height, 'd')
+                start = time.time()
+    finally:
+        for (p, conn) in workers:
+            p.terminate()
+            p.join()
+            conn.close()
+        if handler is not None:
+            signal.signal(signal.SIGTERM, handler)
+    return los
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(128 + signum)
+
+def strip_distances(f_line, walls, ymax, strip):
+    """strip is (x0,x1); return the distances for x0 <= x <= x1, as an array('d')"""
+    (x0, x1) = strip
+    grid = geometry.finish_distance_grid(f_line, walls, x1, ymax, x0, 0)
+    return array('d', [d for column in grid for d in column])
+
+def start_workers(count, f_line, walls, ymax):
+    """
+    Start count of finish_distances' worker processes, and return a list of (process,
+    connection) pairs. Each worker has its own pipe, rather than sharing a Pool's
+    queues: Pool.terminate can wait forever for a queue's lock if it kills a worker
+    that's holding it, and finish_distances' workers are killed whenever it's stopped.
+    """
+    workers = []
+    for _ in range(count):
+        (conn, worker_conn) = mp.Pipe()
+        p = mp.Process(target=run_worker, args=(worker_conn, f_line, walls, ymax), \
+            daemon=True)
+        p.start()
+        worker_conn.close()
+        workers.append((p, conn))
+    return workers
+
+def run_worker(conn, f_line, walls, ymax):
+    """
+    The loop that each of finish_distances' worker processes runs. It receives strips
+    from conn, and sends back each one's strip_distances (or the exception that
+    raised). It returns when conn is closed.
+    """
+    while True:
+        try:
+            strip = conn.recv()
+        except EOFError:
+            return
+        try:
+            part = strip_distances(f_line, walls, ymax, strip)
+        except Exception as e:
+            part = e
+        conn.send(part)
+
+def worker_strips(workers, strips):
+    """
+    Generate the strip_distances of each of strips, in order, from workers (see
+    start_workers). Strip i goes to worker i % len(workers), which is sent its next
+    strip before this one's distances come back, so that it needn't wait for them to
+    be received before starting on it.
+    """
+    n = len(workers)
+    for (i, strip) in enumerate(strips[:2*n]):
+        workers[i % n][1].send(strip)
+    for i in range(len(strips)):
+        conn = workers[i % n][1]
+        part = conn.recv()
+        if isinstance(part, Exception):
+            raise part
+        if i + 2*n < len(strips):
+            conn.send(strips[i + 2*n])
+        yield part
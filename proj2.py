@@ -16,10 +16,11 @@ The function takes three arguments: state, fline, walls.
 
 """
 import racetrack_example as racetrack
+import geometry
+import gridfile
+import trackcache
 import math
-import sys
 import json
-from collections import deque
 
 # global variables
 infinity = float('inf')
@@ -40,17 +41,30 @@ def main(state, finish, walls):
     """
     ((x, y), (u, v)) = state
 
-    # Retrieve the grid data that the "initialize" function stored in data.txt
-    data_file = open('data.txt', 'r')
-    grid = json.load(data_file)
-    data_file.close()
+    # Map in the grid that the "initialize" function stored in grid.dat, so that
+    # h_opp doesn't have to compute it again
+    global grid, g_fline, g_walls, xmax, ymax
+    mapped = gridfile.map_grid('grid.dat', finish, walls)
+    (saved, missing) = (None, 0) if mapped is None else mapped
+    if saved is not None:
+        (grid, g_fline, g_walls) = (saved, finish, walls)
+        (xmax, ymax) = (grid.shape[0] - 1, grid.shape[1] - 1)
+
+    # Use the move table that earlier moves filled in, if there is one
+    table = gridfile.read_move_table('moves.pickle', finish, walls)
+    if table is not None:
+        geometry.use_move_table(table, walls)
+    filled = geometry.move_table(walls).nfilled
 
     choices_file = open('choices.txt', 'w')
 
     # read the frontier for cycle checking
-    data2 = open('data2.txt', 'r')
-    frontier = json.load(data2)
-    data2.close()
+    try:
+        data2 = open('data2.txt', 'r')
+        frontier = json.load(data2)
+        data2.close()
+    except (OSError, ValueError):
+        frontier = []
 
     n2fline = nearfl(finish)  # compute the near fline points
     nfline = listfl(finish)  # compute the on fline points
@@ -98,6 +112,21 @@ def main(state, finish, walls):
 
     print(res, file=choices_file, flush=True)
 
+    # Save the move table for the next move, if this one filled in more of it. It's
+    # put in trackcache for the next game just once, by the next initialize.
+    table = geometry.move_table(walls)
+    if table.nfilled != filled:
+        gridfile.write_move_table('moves.pickle', table, finish, walls)
+
+    # If initialize didn't have time to finish the grid, use the rest of this move's
+    # time to work on it; compute_grid saves its progress as it goes. Unmap grid.dat
+    # first, since compute_grid replaces it. A finished grid stays mapped.
+    if missing:
+        gridfile.close_grid(saved)
+        grid = gridfile.compute_grid('grid.dat', finish, walls)
+    elif saved is None and len(grid) > 0:
+        gridfile.write_grid('grid.dat', grid, finish, walls)
+
 
 def oppcrashcheck(prev, state, walls, n2finish):
     """
@@ -112,12 +141,8 @@ def oppcrashcheck(prev, state, walls, n2finish):
     # check if it's near fline and its velocity if (0, 0)
     if state in n2finish and prev == state:
         return False
-    for i in range(x2 - 1, x2 + 2):
-        for j in range(y2 - 1, y2 + 2):
-            # check if it crashes
-            if racetrack.crash([(x1, y1), (i, j)], walls):
-                return True
-    return False
+    # check all nine error locations for a crash with one lookup
+    return racetrack.crash_fans((x1, y1), [(x2 - x1, y2 - y1)], walls)[0]
 
 
 def oppChoice(state, fline, walls, n2finish):
@@ -190,123 +215,61 @@ def LDabSearch(state, fline, walls, d, a, b, mx):
 
 def initialize(state, fline, walls):
     """
-        Call bfs to initialize the grid for h_opp, then write the data, in
-        json format, to the file "data.txt" so it won't be lost when the process exits
+        Compute the grid for h_opp (the same one dgrid computes) and write it to the
+        file "grid.dat" (see gridfile) so it won't be lost when the process exits.
+        The file is kept in trackcache, so for a track that's been seen before,
+        it's just copied from there, and so is the move table that main keeps in
+        moves.pickle (see gridfile.write_move_table). main only updates moves.pickle,
+        so if the last game here was on this track, its table is put in trackcache
+        here, once per game, rather than on every move.
 
         :param: state, fline, walls
         :return: none (set up the grid and cycle detection)
         """
-    # use bfs to set up the grid and write it to data
-    bfs(fline, walls)
-    data_file = open('data.txt', 'w')
-    json.dump(grid, data_file)
-    data_file.close()
-
-    # set up data2 for cycle checking
+    # set up data2 for cycle checking (first, since the grid may not get finished)
     d2 = open('data2.txt', 'w')
     f = []
     json.dump(f, d2)
     d2.close()
 
+    # use the move table from the last game on this track, unless it's already here
+    # (from the last game in this directory), in which case it goes in the cache at
+    # the end, if this isn't killed first
+    table_here = gridfile.read_move_table('moves.pickle', fline, walls) is not None
+    if not table_here:
+        trackcache.fetch(fline, walls, 'moves', 'moves.pickle')
 
-def bfs(fline, walls):
+    # compute the grid and write it to grid.dat, unless it's in the cache; if this is
+    # killed first, main finishes it (see gridfile.compute_grid)
+    if not trackcache.fetch(fline, walls, 'grid', 'grid.dat'):
+        gridfile.compute_grid('grid.dat', fline, walls)
+        trackcache.store(fline, walls, 'grid', 'grid.dat')
+
+    if table_here:
+        trackcache.store(fline, walls, 'moves', 'moves.pickle')
+
+
+def dgrid(fline, walls):
     """
-        Use a breath-first-search from the fline to compute costs for points on the grid
-        (combine edistw_to_finish and edist_grid into one time traversal of the nodes;
-        significantly reduce the runtime)
+        Compute the costs for all the points on the grid with geometry.distance_grid:
+        the shortest 8-connected path around the walls to a point that can see the
+        fline, plus the straight-line distance from there (the same values as
+        edist_grid in proj2_example, but computed with Dijkstra's algorithm)
         :param: fline, walls
-        :return: return the grid
+        :return: return the grid, indexed by grid[x, y]
         """
     global grid, g_fline, g_walls, xmax, ymax
     xmax = max([max(x, x0) for ((x, y), (x0, y0)) in walls])
     ymax = max([max(y, y0) for ((x, y), (x0, y0)) in walls])
-    grid = [[infinity for i in range(ymax + 1)] for j in range(xmax + 1)]
-    ((x1, y1), (x2, y2)) = fline
-    frontier = deque([])
-    visited = []
-
-    # set the points on fline as 0 in the grid
-    # and put all neighbors of the fline in the frontier
-    if x1 == x2:
-        for y3 in range(min(y1, y2), max(y1, y2) + 1):
-            grid[x1][y3] = 0
-            visited.append((x1, y3))
-
-        for y3 in range(min(y1, y2), max(y1, y2) + 1):
-            for n in range(max(0, y3 - 1), min(ymax + 1, y3 + 2)):
-                for m in range(max(0, x1 - 1), min(xmax + 1, x1 + 2)):
-                    if frontier.count((m, n)) == 0 and grid[m][n] == infinity:
-                        frontier.append((m, n))
-    else:
-        for x3 in range(min(x1, x2), max(x1, x2) + 1):
-            grid[x3][y1] = 0
-            visited.append((x3, y1))
-
-        for x3 in range(min(x1, x2), max(x1, x2) + 1):
-            for n in range(max(0, y1 - 1), min(ymax + 1, y1 + 2)):
-                for m in range(max(0, x3 - 1), min(xmax + 1, x3 + 2)):
-                    if frontier.count((m, n)) == 0 and grid[m][n] == infinity:
-                        frontier.append((m, n))
-
-    # use breath-first-search to compute the costs in the grid
-    while frontier:
-        (v1, v2) = frontier.popleft()
-        visited.append((v1, v2))
-        grid[v1][v2] = edistw_to_finish((v1, v2), fline, walls)
-
-        # check if edistw_to_finish is able to compute the cost
-        # if not, compute the cost using its non-infinity neighbors
-        if grid[v1][v2] == infinity:
-
-            for g in range(max(0, v1 - 1), min(xmax + 1, v1 + 2)):
-                for h in range(max(0, v2 - 1), min(ymax + 1, v2 + 2)):
-                    if grid[g][h] != infinity and not racetrack.crash(((v1, v2), (g, h)), walls):
-                        if g == v1 or h == v2:
-                            d = grid[g][h] + 1
-                        else:
-
-                            d = grid[g][h] + 1.4142135623730951
-                        if d < grid[v1][v2]:
-                            grid[v1][v2] = d
-
-        if grid[v1][v2] != infinity:
-            for i in range(max(0, v1 - 1), min(xmax + 1, v1 + 2)):
-                for j in range(max(0, v2 - 1), min(ymax + 1, v2 + 2)):
-                    if frontier.count((i, j)) == 0 and visited.count((i, j)) == 0:  ##and grid[i][j] == infinity:
-                        frontier.append((i, j))
-
+    grid = gridfile.as_grid(geometry.distance_grid(fline, walls, xmax, ymax), xmax + 1, ymax + 1)
     g_fline = fline
     g_walls = walls
     return grid
 
 
-def edistw_to_finish(point, fline, walls):
-    """
-        The function from h_walldist:
-        straight-line distance from (x,y) to the finish line ((x1,y1),(x2,y2)).
-        Return infinity if there's no way to do it without intersecting a wall
-        :param a: point, fline, walls
-        :return: straight-line distance from point to finish line (considering walls)
-        """
-
-    (x, y) = point
-    ((x1, y1), (x2, y2)) = fline
-    # make a list of distances to each reachable point in fline
-    if x1 == x2:  # fline is vertical, so iterate over y
-        ds = [math.sqrt((x1 - x) ** 2 + (y3 - y) ** 2) \
-              for y3 in range(min(y1, y2), max(y1, y2) + 1) \
-              if not racetrack.crash(((x, y), (x1, y3)), walls)]
-    else:  # fline is horizontal, so iterate over x
-        ds = [math.sqrt((x3 - x) ** 2 + (y1 - y) ** 2) \
-              for x3 in range(min(x1, x2), max(x1, x2) + 1) \
-              if not racetrack.crash(((x, y), (x3, y1)), walls)]
-    ds.append(infinity)  # for the case where ds is empty
-    return min(ds)
-
-
 def h_opp(state, fline, walls):
     """
-    The first time this function is called, it will use optimized breath first search to find the cost for all the
+    The first time this function is called, it will use dgrid to find the cost for all the
     points on the grid.
     On all subsequent calls, this function will retrieve the cached value and add an
     estimate of how long it will take to stop.
@@ -315,13 +278,16 @@ def h_opp(state, fline, walls):
     """
     global g_fline, g_walls
 
-    if fline != g_fline or walls != g_walls or grid == []:
-        bfs(fline, walls)
+    if fline != g_fline or walls != g_walls or len(grid) == 0:
+        dgrid(fline, walls)
     ((x, y), (u, v)) = state
     if x > xm or x < 0 or y > ym or y < 0: return infinity  # add on
     ((h1, w1), (h2, w2)) = fline
     li = listfl(fline)
-    hval = float(grid[x][y])
+    hval = grid[x, y]
+    if hval != hval:
+        # NaN: the grid isn't finished, so use the distance ignoring walls instead
+        hval = geometry.edge_distance((x, y), fline)
 
     au = abs(u)
     av = abs(v)
@@ -343,7 +309,7 @@ def h_opp(state, fline, walls):
     penalty = sd
 
     # compute location after stop, and add a penalty if it goes through a wall
-    if racetrack.crash([(x, y), (sx, sy)], walls):
+    if racetrack.crash_moves((x, y), [(int(sdu), int(sdv))], walls)[0]:
         penalty += 1.1 * math.sqrt(au ** 2 + av ** 2)
     else:
         penalty -= sd / 10.0
@@ -362,7 +328,7 @@ def h_opp(state, fline, walls):
     ssx = x + int(ssu)
     ssy = y + int(ssv)
 
-    if not racetrack.crash([(x, y), (ssx, ssy)], walls):
+    if not racetrack.crash_moves((x, y), [(int(ssu), int(ssv))], walls)[0]:
         # check if the slowest stop point land on the fline
         # if yes, significantly reduce the return cost
         if (ssx, ssy) in li:
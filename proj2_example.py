@@ -8,22 +8,32 @@ To run this program in the supervisor, rename the file to proj2.py .
 """
 
 import racetrack_example as rt
+import geometry
+import gridfile
+import trackcache
 import math
 import sys
-import json
+import os
+import pickle
+import time
 
 # Global variable for h_walldist
 infinity = float('inf')     # same as math.inf
 
+ara_time = 1.0              # seconds main lets ara* run before it starts the replanner
+checkpoint_interval = 1.0   # seconds between the saves of the replanner's search graph
+replan_steps = 1000         # expansions the replanner does between looks at the clock
+
 
 # Your proj2 function
 def main(state,finish,walls):
+    start = time.time()
     ((x,y), (u,v)) = state
     
-    # Retrieve the grid data that the "initialize" function stored in data.txt
-    data_file = open('data.txt', 'r')
-    grid = json.load(data_file)
-    data_file.close()
+    # Map in the grid that the "initialize" function stored in grid.dat
+    grid = gridfile.read_grid('grid.dat',finish,walls)
+    if grid is None:
+        grid = edist_grid(finish,walls)
     
     choices_file = open('choices.txt', 'w')
     
@@ -34,43 +44,149 @@ def main(state,finish,walls):
     if edist_to_line((x,y),finish) <= 1 and abs(u) <= 2 and abs(v) <= 2:
         velocity = (0,0)
         print('  proj2_example: finishing, new velocity =', velocity)
+        # need to flush because Python uses buffered output
+        print(velocity,file=choices_file,flush=True)
     else:
-        path = rt.main(state,finish,walls,'gbf', h, verbose=0, draw=0)
-        print('  proj2_example: path =', path)
-        for i in range(len(path)):
-            print('  proj2_example: path[',i,'] =', path[i])
-            if path[i] == state:
-                print('  proj2_example: found state', state)
-                velocity = path[i+1][1]
-                print('  proj2_example: new velocity', velocity)
-                break
-    # need to flush because Python uses buffered output
-    print(velocity,file=choices_file,flush=True)
+        # The replanner keeps its search graph in replan.pickle from one move to the
+        # next. If it already has a path from this state, use it; otherwise run ara*
+        # for ara_time seconds to get a velocity into choices.txt quickly, then let
+        # the replanner search, saving its graph as it goes (see run_replanner).
+        load_move_table(finish,walls)
+        replanner = load_replanner(finish,walls)
+        if not replanner.has_path(state):
+            # ara* finds a rough path right away and then keeps improving it. Write
+            # the first velocity of each new path, since the supervisor may kill the
+            # process at any time and uses the last velocity in choices.txt. The path
+            # is reported before its search is done, so weight isn't a bound on it yet.
+            def write_velocity(path,cost,weight):
+                if len(path) > 1:
+                    velocity = path[1][1]
+                    print('  proj2_example: cost', cost, 'search weight', weight, \
+                        'new velocity', velocity)
+                    print(velocity,file=choices_file,flush=True)
+            path = rt.main(state,finish,walls,'ara*', h, verbose=0, draw=0, \
+                on_solution=write_velocity, deadline=start+ara_time)
+            print('  proj2_example: path =', path)
+            if not path:
+                # ara* ran out of time, so write a fallback velocity before the
+                # replanner starts, in case the process is killed before it finishes
+                velocity = fallback_velocity(state,finish,walls,h)
+                print('  proj2_example: fallback velocity', velocity)
+                print(velocity,file=choices_file,flush=True)
+        path = run_replanner(replanner,state,finish,walls)
+        if path and len(path) > 1:
+            velocity = path[1][1]
+            print('  proj2_example: replanned path =', path)
+            print(velocity,file=choices_file,flush=True)
+
+def fallback_velocity(state,finish,walls,h):
+    """
+    Return the velocity of the move to the child of state that h likes best, which is
+    the move gbf would try first, or state's own velocity if every move crashes.
+    """
+    children = rt.next_states(state,finish,walls)
+    if not children:
+        return state[1]
+    return min(children, key=lambda s: h(s,finish,walls))[1]
+
+def run_replanner(replanner,state,finish,walls):
+    """
+    Call rt.replan replan_steps expansions at a time until it's done, saving the
+    replanner in replan.pickle and the walls' move table in moves.pickle every
+    checkpoint_interval seconds and at the end, so that if the process is killed
+    first, the next call carries on from the last save rather than starting over.
+    If it had to search, put both files in trackcache when it's done, under keys
+    that depend only on the track, since the replanner can plan from any state.
+    Return rt.replan's path.
+    """
+    (start, expansions) = (replanner.iteration, replanner.iteration)
+    filled = geometry.move_table(walls).nfilled
+    last_save = time.time()
+    while True:
+        path = rt.replan(replanner,state,finish,walls,max_expansions=replan_steps)
+        if path is not None or time.time() - last_save >= checkpoint_interval:
+            if replanner.iteration != expansions:
+                save_replanner(replanner,finish,walls)
+                expansions = replanner.iteration
+            table = geometry.move_table(walls)
+            if table.nfilled != filled:
+                gridfile.write_move_table('moves.pickle',table,finish,walls)
+                filled = table.nfilled
+            last_save = time.time()
+        if path is not None:
+            if replanner.iteration != start:
+                trackcache.store(finish,walls,'replan','replan.pickle')
+                trackcache.store(finish,walls,'moves','moves.pickle')
+            return path
+
+def load_replanner(finish,walls):
+    """
+    Return the replanner saved in replan.pickle, or a new one if there isn't a saved
+    replanner for this finish line and these walls.
+    """
+    try:
+        with open('replan.pickle', 'rb') as replan_file:
+            (f, w, replanner) = pickle.load(replan_file)
+        if f == finish and w == walls:
+            return replanner
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    return rt.new_replanner(finish,walls)
+
+def save_replanner(replanner,finish,walls):
+    """
+    Save replanner in replan.pickle. Write it to a temporary file and rename that, so
+    that if the process is killed in the middle, the old replan.pickle is still there.
+    The temporary file's name has the process ID in it, so that two processes saving
+    at the same time don't write to the same one.
+    """
+    temp = 'replan.pickle.{}.tmp'.format(os.getpid())
+    with open(temp, 'wb') as replan_file:
+        pickle.dump((finish, walls, replanner), replan_file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, 'replan.pickle')
+
+def load_move_table(finish,walls):
+    """
+    If moves.pickle has a move table for this track, tell geometry to use it, and
+    return True; otherwise return False
+    """
+    table = gridfile.read_move_table('moves.pickle',finish,walls)
+    if table is None:
+        return False
+    geometry.use_move_table(table,walls)
+    return True
 
 def edist_to_line(point, edge):
     """
     Euclidean distance from (x,y) to the line ((x1,y1),(x2,y2)).
     """
-    (x,y) = point
-    ((x1,y1),(x2,y2)) = edge
-    if x1 == x2:
-        ds = [math.sqrt((x1-x)**2 + (y3-y)**2) \
-            for y3 in range(min(y1,y2),max(y1,y2)+1)]
-    else:
-        ds = [math.sqrt((x3-x)**2 + (y1-y)**2) \
-            for x3 in range(min(x1,x2),max(x1,x2)+1)]
-    return min(ds)
+    return geometry.edge_distance(point, edge)
                 
 
 def initialize(state,fline,walls):    
     """
-    Call edist_grid to initialize the grid for h_walldist, then write the data, in
-    json format, to the file "data.txt" so it won't be lost when the process exits
+    Compute edist_grid's grid for h_walldist and write it to the file "grid.dat"
+    (see gridfile) so it won't be lost when the process exits. If this is killed
+    before it's done, the part it's done is in grid.dat.
+    Then build a replanner's search graph back to the starting state, and save it in
+    replan.pickle for main, every so often while it's being built (see run_replanner),
+    so that if this is killed, main carries on from the last save. The move table is
+    saved with it, in moves.pickle. All three files are kept in trackcache, so if this
+    track has been seen before, they're just copied from there; the replanner then
+    only has to search if it was built for a different starting state. A replanner or
+    move table that's already here for this track (e.g., from an initialize that was
+    killed) is used instead of the cached one.
     """
-    edist_grid(fline,walls)
-    data_file = open('data.txt', 'w')
-    json.dump(grid,data_file)
-    data_file.close()
+    if not trackcache.fetch(fline,walls,'grid','grid.dat'):
+        gridfile.compute_grid('grid.dat',fline,walls)
+        trackcache.store(fline,walls,'grid','grid.dat')
+    if not load_move_table(fline,walls) \
+        and trackcache.fetch(fline,walls,'moves','moves.pickle'):
+        load_move_table(fline,walls)
+    replanner = load_replanner(fline,walls)
+    if replanner.iteration == 0 and trackcache.fetch(fline,walls,'replan','replan.pickle'):
+        replanner = load_replanner(fline,walls)
+    run_replanner(replanner,state,fline,walls)
 
 
 def h_walldist(state, fline, walls, grid):
@@ -80,7 +196,10 @@ def h_walldist(state, fline, walls, grid):
     and adds an estimate of how long it will take to stop. 
     """
     ((x,y),(u,v)) = state
-    hval = float(grid[x][y])
+    hval = grid[x,y]
+    if hval != hval:
+        # NaN: initialize didn't get this far, so use the distance ignoring walls
+        hval = edist_to_line((x,y),fline)
     
     # add a small penalty to favor short stopping distances
     au = abs(u); av = abs(v); 
@@ -103,47 +222,12 @@ def edist_grid(fline,walls):
     global grid
     xmax = max([max(x,x1) for ((x,y),(x1,y1)) in walls])
     ymax = max([max(y,y1) for ((x,y),(x1,y1)) in walls])
-    grid = [[edistw_to_finish((x,y), fline, walls) for y in range(ymax+1)] for x in range(xmax+1)]
-    flag = True
     print('computing edist grid', end=' '); sys.stdout.flush()
-    while flag:
-        print('.', end=''); sys.stdout.flush()
-        flag = False
-        for x in range(xmax+1):
-            for y in range(ymax+1):
-                for y1 in range(max(0,y-1),min(ymax+1,y+2)):
-                    for x1 in range(max(0,x-1),min(xmax+1,x+2)):
-                        if grid[x1][y1] != infinity and not rt.crash(((x,y),(x1,y1)),walls):
-                            if x == x1 or y == y1:
-                                d = grid[x1][y1] + 1
-                            else:
-                                # In principle, it seems like a taxicab metric should be just as
-                                # good, but Euclidean seems to work a little better in my tests.
-                                d = grid[x1][y1] + 1.4142135623730951
-                            if d < grid[x][y]:
-                                grid[x][y] = d
-                                flag = True
+    # The distance from each point to the finish line, going around the walls in
+    # steps of 1 or sqrt(2) to a point that can see it. In principle, it seems like
+    # a taxicab metric should be just as good, but Euclidean seems to work a little
+    # better in my tests.
+    dist = geometry.distance_grid(fline, walls, xmax, ymax)
+    grid = gridfile.as_grid(dist, xmax+1, ymax+1)
     print(' done')
     return grid
-
-
-def edistw_to_finish(point, fline, walls):
-    """
-    straight-line distance from (x,y) to the finish line ((x1,y1),(x2,y2)).
-    Return infinity if there's no way to do it without intersecting a wall
-    """
-#   if min(x1,x2) <= x <= max(x1,x2) and  min(y1,y2) <= y <= max(y1,y2):
-#       return 0
-    (x,y) = point
-    ((x1,y1),(x2,y2)) = fline
-    # make a list of distances to each reachable point in fline
-    if x1 == x2:           # fline is vertical, so iterate over y
-        ds = [math.sqrt((x1-x)**2 + (y3-y)**2) \
-            for y3 in range(min(y1,y2),max(y1,y2)+1) \
-            if not rt.crash(((x,y),(x1,y3)), walls)]
-    else:                  # fline is horizontal, so iterate over x
-        ds = [math.sqrt((x3-x)**2 + (y1-y)**2) \
-            for x3 in range(min(x1,x2),max(x1,x2)+1) \
-            if not rt.crash(((x,y),(x3,y1)), walls)]
-    ds.append(infinity)    # for the case where ds is empty
-    return min(ds)
@@ -5,18 +5,27 @@ The racetrack file from project 1, modified for use by proj2_nau.py
 """
 
 import tdraw, turtle    # Code to use Python's "turtle drawing" package
-import math, sys
+import sys, time, json
+import multiprocessing as mp
+from queue import Empty
 import fsearch
 import opponents
+from geometry import crash, crash_mask, crash_moves, crash_fans, intersect
 
 
-def main(s0, f_line, walls, strategy, h, verbose=2, draw=0, title=''):
+def main(s0, f_line, walls, strategy, h, verbose=2, draw=0, title='', max_nodes=100000, \
+         weight=3.0, on_solution=None, lazy=False, stats=False, batch=1, processes=None, \
+         deterministic=True, opponent=None, deadline=None):
     """
     Args are as follows:
     - prob should be a triple [s0, f_line, walls], where
         s0 is the initial state, f_line is the finish line, walls is a list of walls
     - strategy should be 'bf' (best first), 'df' (depth first),
-        'uc' (uniform cost), 'gbf' (greedy best first), or 'a*'.
+        'uc' (uniform cost), 'gbf' (greedy best first), 'a*', 'ida*' (iterative
+        deepening a*), 'sma*' (simplified memory-bounded a*), 'ara*' (anytime
+        repairing a*), or 'bi-uc' or 'bi-a*' (bidirectional uniform cost or a*). The
+        bidirectional strategies search backward from goal_states(f_line,walls), so
+        their paths end at a stopped car within distance 1 of the finish line.
     - h should be a heuristic function of three arguments h(s,f_line,walls), where
         s is the current state, f_line is the finish line, walls is a list of walls
     - verbose should be one of the following:
@@ -28,14 +37,35 @@ def main(s0, f_line, walls, strategy, h, verbose=2, draw=0, title=''):
     - draw should either be 0 (draw nothing) or 1 (draw everything)
     - title is a title to put at the top of the drawing. It defaults to the names of the
         search strategy and heuristic (if there is one)
+    - max_nodes is the most nodes that 'sma*' may keep in memory at once
+    - weight is the heuristic weight that 'ara*' starts with
+    - on_solution(path,cost,weight) is an optional function that 'ara*' calls each
+        time it finds a better path, where path is a list of states and weight is the
+        weight of the search that found it (see fsearch.main)
+    - deadline is an optional time (as time.time() gives it) at which 'ara*' stops
+        and returns the best path it has found so far
+    - lazy tells fsearch to call h on a node only when it gets to the top of the
+        frontier (see fsearch.main)
+    - stats tells whether to return (solution, stats) instead of just the solution,
+        where stats is the fsearch.Stats for the search
+    - batch, processes, and deterministic tell fsearch to expand batch nodes at a
+        time, computing their children in processes worker processes, and whether to
+        add the children in the same order every time (see fsearch.main); the workers
+        get copies of the walls and h when they start
+    - opponent tells next_states which moves to leave out because of the opponent's
+        errors: None (the default) ignores the opponent, 'opponent1' leaves out the
+        moves that crash after the error opponents.opponent1 would choose, and 'fan'
+        leaves out the moves that crash after any of the 9 errors
     """
 #   s0 = (problem[0], (0,0))    # initial state
 #   f_line = problem[1]
 #   walls = problem[2]
     # convert h, next_states, and goal_test to the one-arg functions fsearch wants
     h_for_fsearch = lambda state: h(state, f_line, walls)
-    next_for_fsearch = lambda state: [(s,1) for s in next_states(state,f_line,walls)]
+    next_for_fsearch = lambda state: [(s,1) for s in next_states(state,f_line,walls,opponent)]
     goal_for_fsearch = lambda state: goal_test(state,f_line)
+    prev_for_fsearch = lambda state: [(s,1) for s in prev_states(state,f_line,walls)]
+    h_back_for_fsearch = lambda state: h_from_start(state, s0)
 
     if draw:
         draw_edges = tdraw.draw_edges
@@ -46,8 +76,15 @@ def main(s0, f_line, walls, strategy, h, verbose=2, draw=0, title=''):
         tdraw.draw_problem(problem, title=title)
     else:
         draw_edges = None
+    if strategy in ('bi-uc', 'bi-a*'):   goals = goal_states(f_line,walls)
+    else:                               goals = None
     solution = fsearch.main(s0, next_for_fsearch, goal_for_fsearch, strategy, \
-    h_for_fsearch, verbose, draw_edges)
+    h_for_fsearch, verbose, draw_edges, pack_state, unpack_state, max_nodes, weight, \
+    on_solution=on_solution, prev_states=prev_for_fsearch, goals=goals, \
+    h_back=h_back_for_fsearch, lazy=lazy, stats=stats, batch=batch, processes=processes, \
+    deterministic=deterministic, deadline=deadline)
+    if stats:
+        (solution, record) = solution
     if verbose:
        print('Solution ({} states):\n{}'.format(len(solution), solution))
     if draw:
@@ -55,96 +92,249 @@ def main(s0, f_line, walls, strategy, h, verbose=2, draw=0, title=''):
         print("Type carriage return to continue:")
         sys.stdin.readline()
 #        turtle.mainloop()
+    if stats:
+        return (solution, record)
     return solution
 
 
+def portfolio(s0, f_line, walls, combos, max_time=None, max_nodes=100000, name='', \
+              log_file=None, verbose=0):
+    """
+    Race several searches in separate processes and return the first valid solution.
+    - s0, f_line, walls, and max_nodes are as in main.
+    - combos is a list of (strategy, h) pairs; each one is run by main in its own
+        process, with stats=True. h must be a function that the processes can use,
+        e.g. one defined at the top level of a module.
+    - max_time is how many seconds to wait before giving up, or None to wait for all
+        of the searches to finish.
+    - name is a name for the problem, to put in the log.
+    - log_file is the name of a file to append one json line to for each search, with
+        the problem's name, strategy, heuristic name, status ('won', 'lost' if it
+        finished later or with an invalid solution, 'failed' if it found no
+        solution, 'error' if it raised an exception, or 'cancelled'), wall_time
+        (seconds from the start until it finished or was cancelled), and the search's
+        fsearch.Stats if it finished, or the exception (as 'error') if it raised one.
+    As soon as a search returns a valid solution, the others are terminated. Return
+    (solution, records), where solution is False if no search found a valid one, and
+    records is the list of dictionaries that are written to log_file.
+    """
+    queue = mp.Queue()
+    workers = []
+    for (i, (strategy, h)) in enumerate(combos):
+        p = mp.Process(target=portfolio_worker, \
+            args=(queue, i, s0, f_line, walls, strategy, h, max_nodes))
+        p.start()
+        workers.append(p)
+    start = time.time()
+    records = [{'problem': name, 'strategy': strategy, \
+        'heuristic': getattr(h, '__name__', str(h)), 'status': 'cancelled', \
+        'wall_time': None} for (strategy, h) in combos]
+    solution = False
+    running = len(workers)
+    while running:
+        if solution:
+            wait = 0            # just collect the results that are already there
+        elif max_time is None:
+            wait = None
+        else:
+            wait = max(0, start + max_time - time.time())
+        try:
+            (i, path, stats) = queue.get(timeout=wait)
+        except Empty:
+            break
+        running -= 1
+        records[i].update(stats)
+        records[i]['wall_time'] = time.time() - start
+        if 'error' in stats:
+            records[i]['status'] = 'error'
+            if verbose:
+                print('portfolio: {} with {} raised {}'.format(records[i]['strategy'], \
+                    records[i]['heuristic'], stats['error']))
+        elif not path:
+            records[i]['status'] = 'failed'
+        elif solution or not valid_path(path, s0, f_line, walls):
+            records[i]['status'] = 'lost'
+        else:
+            records[i]['status'] = 'won'
+            solution = path
+            if verbose:
+                print('portfolio: {} with {} won after {:.2f} seconds'.format( \
+                    records[i]['strategy'], records[i]['heuristic'], \
+                    records[i]['wall_time']))
+    for (p, record) in zip(workers, records):
+        if p.is_alive():
+            p.terminate()
+        p.join()
+        if record['wall_time'] is None:
+            record['wall_time'] = time.time() - start
+    if log_file:
+        with open(log_file, 'a') as log:
+            for record in records:
+                print(json.dumps(record), file=log)
+    return (solution, records)
+
+def portfolio_worker(queue, i, s0, f_line, walls, strategy, h, max_nodes):
+    """
+    Run one of portfolio's searches, and put (i, solution, stats) into queue. If the
+    search raises an exception, put (i, False, {'error': the exception}) instead, so
+    that portfolio doesn't wait for it forever.
+    """
+    try:
+        (solution, stats) = main(s0, f_line, walls, strategy, h, verbose=0, \
+            max_nodes=max_nodes, stats=True)
+    except Exception as e:
+        queue.put((i, False, {'error': repr(e)}))
+        raise
+    queue.put((i, solution, stats.as_dict()))
+
+def valid_path(path, s0, f_line, walls):
+    """
+    Test whether path starts at s0, makes only moves that next_states allows, and ends
+    with the car stopped within distance 1 of the finish line (so paths from the
+    bidirectional strategies count).
+    """
+    if not path or path[0] != s0:
+        return False
+    for ((loc,(vx,vy)), (newloc,(wx,wy))) in zip(path, path[1:]):
+        if abs(wx-vx) > 2 or abs(wy-vy) > 2 \
+            or newloc != (loc[0]+wx,loc[1]+wy) or crash((loc,newloc),walls):
+            return False
+    return path[-1] in goal_states(f_line, walls)
+
+
+def new_replanner(f_line, walls):
+    """
+    Return an fsearch.Replanner for this track. Call replan with it after each move,
+    and it will reuse the search graph built by the earlier calls.
+    """
+    return fsearch.Replanner(goal_states(f_line,walls), pack_state, unpack_state)
+
+def replan(replanner, s0, f_line, walls, verbose=0, max_expansions=None):
+    """
+    Use replanner to find a shortest path from s0 to a stopped car within distance 1
+    of the finish line. Return the path as a list of states, or False if there's none.
+    If max_expansions is given, return None if the path isn't found after that many
+    expansions; calling replan again carries on the search (see fsearch.Replanner).
+    """
+    prev = lambda state: [(s,1) for s in prev_states(state,f_line,walls)]
+    return replanner.plan(s0, prev, h_from_start, verbose, max_expansions)
+
+
 ###########################################################
 ####  Domain-Specific Functions for the Racetrack game ####
 ###########################################################
 
-def next_states(state, f_line, walls):
-    """Return a list of states we can go to from state"""
-    states = []
+def next_states(state, f_line, walls, opponent=None):
+    """
+    Return a list of states we can go to from state. If opponent is 'opponent1', leave
+    out the moves that would crash after the error that opponents.opponent1 chooses;
+    if it's 'fan', leave out the moves that would crash after any error. Moves that
+    stop the car get no error.
+    """
+    candidates = []
     (loc,(vx,vy)) = state
     for dx in [0,-1,1,-2,2]:
         for dy in [0,-1,1,-2,2]:
             (wx,wy) = (vx+dx,vy+dy)
             newloc = (loc[0]+wx,loc[1]+wy)
-            err = opponents.opponent1(loc, (wx, wy), f_line, walls)
-#           errloc = (newloc[0] + err[0], newloc[1] + err[1])
-            if not crash((loc,newloc),walls):
-#           and not crash((loc,errloc),walls):
-                states.append((newloc,(wx,wy)))
+            candidates.append((newloc,(wx,wy)))
+    # look all of the moves up in the walls' move table at once
+    velocities = [w for (newloc,w) in candidates]
+    crashed = crash_moves(loc, velocities, walls)
+    if opponent == 'opponent1':
+        errs = [opponent_error(newloc, w, f_line, walls) for (newloc,w) in candidates]
+        crashed = [c or e for (c,e) in zip(crashed, crash_moves(loc, \
+            [(wx+q,wy+r) for ((wx,wy),(q,r)) in zip(velocities,errs)], walls))]
+    elif opponent == 'fan':
+        # there's no error when the velocity is (0,0)
+        crashed = [c or (e and w != (0,0)) for (c,e,w) in \
+            zip(crashed, crash_fans(loc, velocities, walls), velocities)]
+    states = [s for (s,c) in zip(candidates,crashed) if not c]
 #   print('next states:', states)
     return states
 
+# opponent_error's cache, for the finish line and walls in _opponent_track
+_opponent_errors = {}
+_opponent_track = None
+
+def opponent_error(newloc, velocity, f_line, walls):
+    """
+    Return the error that opponents.opponent1 would choose for a move to newloc with
+    the given velocity. opponent1's choice depends only on newloc (unless velocity is
+    (0,0), when there's no error), so the choices are cached by newloc until f_line or
+    walls changes.
+    """
+    global _opponent_track
+    if velocity == (0,0):
+        return (0,0)
+    if _opponent_track is None or f_line is not _opponent_track[0] \
+        or walls is not _opponent_track[1] or len(walls) != _opponent_track[2]:
+        _opponent_errors.clear()
+        _opponent_track = (f_line, walls, len(walls))
+    if newloc not in _opponent_errors:
+        loc = (newloc[0]-velocity[0], newloc[1]-velocity[1])
+        # opponent1 returns None if there are no walls to push the car toward
+        _opponent_errors[newloc] = opponents.opponent1(loc, velocity, f_line, walls) \
+            or (0,0)
+    return _opponent_errors[newloc]
+
+def prev_states(state, f_line, walls):
+    """
+    Return a list of states we can come to state from. If state is (loc,(wx,wy)), the
+    car moved from loc-(wx,wy), and its old velocity was (wx,wy) minus the change
+    next_states makes, so the states differ only in their old velocities.
+    """
+    (loc,(wx,wy)) = state
+    oldloc = (loc[0]-wx,loc[1]-wy)
+    if crash_moves(oldloc, [(wx,wy)], walls)[0]:
+        return []
+    return [(oldloc,(wx-dx,wy-dy)) for dx in [0,-1,1,-2,2] for dy in [0,-1,1,-2,2]]
+
+def goal_states(f_line, walls):
+    """
+    Return the states that win: velocity (0,0) at a point within distance 1 of the
+    finish line. That's a point on the line or next to one. Points that can only be
+    separated from the line by a wall are left out.
+    """
+    ((x1,y1),(x2,y2)) = f_line
+    if x1 == x2:    line = [(x1,y) for y in range(min(y1,y2),max(y1,y2)+1)]
+    else:           line = [(x,y1) for x in range(min(x1,x2),max(x1,x2)+1)]
+    moves = [((x,y),p) for (x,y) in line \
+        for p in [(x,y), (x-1,y), (x+1,y), (x,y-1), (x,y+1)]]
+    points = []
+    for ((_,p),c) in zip(moves, crash_mask(moves,walls)):
+        if p not in points and not c:
+            points.append(p)
+    return [(p,(0,0)) for p in points]
+
+def h_from_start(state, s0):
+    """
+    A lower bound on the number of moves from s0 to state, for the backward side of
+    a bidirectional search. In k moves, each component of the velocity can change by
+    at most 2k, and the position can get at most k(k+1) away from where the starting
+    velocity alone would take it; return the smallest k that allows both. Any move
+    raises this by at most 1, so the bound is consistent.
+    """
+    (((x,y),(u,v)), ((x0,y0),(u0,v0))) = (state, s0)
+    k = 0
+    while max(abs(u-u0), abs(v-v0)) > 2*k \
+        or max(abs(x-x0-k*u0), abs(y-y0-k*v0)) > k*(k+1):
+        k += 1
+    return k
+
+def pack_state(state):
+    """
+    Pack state ((x,y),(u,v)) into one unsigned 64-bit integer, 16 bits per number,
+    so that fsearch can keep it in an array. Each number must be in [-32768, 32767].
+    """
+    ((x,y),(u,v)) = state
+    return ((x+32768) << 48) | ((y+32768) << 32) | ((u+32768) << 16) | (v+32768)
+
+def unpack_state(n):
+    """Inverse of pack_state"""
+    return (((n >> 48) - 32768, ((n >> 32) & 0xffff) - 32768), \
+        (((n >> 16) & 0xffff) - 32768, (n & 0xffff) - 32768))
+
 def goal_test(state,f_line):
     """Test whether state is on the finish line and has velocity (0,0)"""
     return state[1] == (0,0) and intersect((state[0],state[0]), f_line)
-
-def crash(move,walls):
-    """Test whether move intersects a wall in walls"""
-    for wall in walls:
-        if intersect(move,wall): return True
-    return False
-
-def intersect(e1,e2):
-    """Test whether edges e1 and e2 intersect"""       
-    
-    # First, grab all the coordinates
-    ((x1a,y1a), (x1b,y1b)) = e1
-    ((x2a,y2a), (x2b,y2b)) = e2
-    dx1 = x1a-x1b
-    dy1 = y1a-y1b
-    dx2 = x2a-x2b
-    dy2 = y2a-y2b
-    
-    if (dx1 == 0) and (dx2 == 0):       # both lines vertical
-        if x1a != x2a: return False
-        else:   # the lines are collinear
-            return collinear_point_in_edge((x1a,y1a),e2) \
-                or collinear_point_in_edge((x1b,y1b),e2) \
-                or collinear_point_in_edge((x2a,y2a),e1) \
-                or collinear_point_in_edge((x2b,y2b),e1)
-    if (dx2 == 0):      # e2 is vertical (so m2 = infty), but e1 isn't vertical
-        x = x2a
-        # compute y = m1 * x + b1, but minimize roundoff error
-        y = (x2a-x1a)*dy1/float(dx1) + y1a
-        return collinear_point_in_edge((x,y),e1) and collinear_point_in_edge((x,y),e2) 
-    elif (dx1 == 0):        # e1 is vertical (so m1 = infty), but e2 isn't vertical
-        x = x1a
-        # compute y = m2 * x + b2, but minimize roundoff error
-        y = (x1a-x2a)*dy2/float(dx2) + y2a
-        return collinear_point_in_edge((x,y),e1) and collinear_point_in_edge((x,y),e2) 
-    else:       # neither line is vertical
-        # check m1 = m2, without roundoff error:
-        if dy1*dx2 == dx1*dy2:      # same slope, so either parallel or collinear
-            # check b1 != b2, without roundoff error:
-            if dx2*dx1*(y2a-y1a) != dy2*dx1*x2a - dy1*dx2*x1a:  # not collinear
-                return False
-            # collinear
-            return collinear_point_in_edge((x1a,y1a),e2) \
-                or collinear_point_in_edge((x1b,y1b),e2) \
-                or collinear_point_in_edge((x2a,y2a),e1) \
-                or collinear_point_in_edge((x2b,y2b),e1)
-        # compute x = (b2-b1)/(m1-m2) but minimize roundoff error:
-        x = (dx2*dx1*(y2a-y1a) - dy2*dx1*x2a + dy1*dx2*x1a)/float(dx2*dy1 - dy2*dx1)
-        # compute y = m1*x + b1 but minimize roundoff error
-        y = (dy2*dy1*(x2a-x1a) - dx2*dy1*y2a + dx1*dy2*y1a)/float(dy2*dx1 - dx2*dy1)
-    return collinear_point_in_edge((x,y),e1) and collinear_point_in_edge((x,y),e2) 
-
-
-def collinear_point_in_edge(point, edge):
-    """
-    Helper function for intersect, to test whether a point is in an edge,
-    assuming the point and edge are already known to be collinear.
-    """
-    (x,y) = point
-    ((xa,ya),(xb,yb)) = edge
-    # point is in edge if (i) x is between xa and xb, inclusive, and (ii) y is between
-    # ya and yb, inclusive. The test of y is redundant unless the edge is vertical.
-    if ((xa <= x <= xb) or (xb <= x <= xa)) and ((ya <= y <= yb) or (yb <= y <= ya)):
-       return True
-    return False
-        
-
@@ -0,0 +1,425 @@
+"""
+File: test_fsearch.py
+Tests for fsearch.py, run with pytest. The searches are run with racetrack_example's
+functions, on a small track defined here and on some of the small problems in
+sample_probs.
+"""
+
+import json
+import math
+import time
+import pickle
+import sample_probs
+import fsearch
+import random
+import opponents
+import racetrack_example as rt
+from test_geometry import old_crash
+
+
+def no_h(state, f_line, walls):
+    """A heuristic that's always 0, so that a* and uc find shortest paths"""
+    return 0
+
+# A small track for the strategies that expand everything, and the baseline engine's
+# results on it (with h_line) before the frontier became a heap: each strategy's
+# path and numbers of generated, pruned and explored nodes, and the final frontier size
+tiny = ['tiny', (1,1), [(7,5),(7,7)], [[(0,0),(8,0)], [(8,0),(8,8)], [(8,8),(0,8)], \
+    [(0,8),(0,0)], [(4,0),(4,5)]]]
+shortest_tiny_path = [((1,1),(0,0)), ((1,2),(0,1)), ((2,4),(1,2)), ((5,6),(3,2)), \
+    ((7,7),(2,1)), ((7,7),(0,0))]
+greedy_tiny_path = [((1,1),(0,0)), ((3,3),(2,2)), ((4,6),(1,3)), ((6,7),(2,1)), \
+    ((7,7),(1,0)), ((7,7),(0,0))]
+baseline_tiny = {
+    'bf':   (shortest_tiny_path, 3975, 3320, 470, 185),
+    'df':   ([((1,1),(0,0)), ((3,3),(2,2)), ((3,3),(0,0)), ((1,5),(-2,2)), ((1,5),(0,0)), \
+             ((3,7),(2,2)), ((3,7),(0,0)), ((5,5),(2,-2)), ((5,5),(0,0)), ((7,7),(2,2)), \
+             ((7,7),(0,0))], 104, 19, 8, 77),
+    'uc':   (shortest_tiny_path, 3975, 3320, 470, 185),
+    'gbf':  (greedy_tiny_path, 42, 1, 8, 33),
+    'a*':   (greedy_tiny_path, 86, 13, 14, 59),
+}
+# the baseline engine's path lengths, numbers of generated, pruned and explored nodes,
+# and final frontier sizes on sample tracks
+baseline_samples = {
+    ('wall16a', 'gbf'): (6, 204, 45, 11, 148),
+    ('wall16a', 'a*'):  (6, 1809, 1113, 97, 599),
+    ('rect20a', 'gbf'): (5, 301, 51, 15, 235),
+    ('rect20a', 'a*'):  (5, 1917, 972, 94, 851),
+}
+
+def h_line(state, f_line, walls):
+    """The straight-line distance to the nearest point of the finish line"""
+    ((x,y),_) = state
+    ((x1,y1),(x2,y2)) = f_line
+    return min(math.hypot(x-a, y-b) for a in range(min(x1,x2), max(x1,x2)+1) \
+        for b in range(min(y1,y2), max(y1,y2)+1))
+
+def h_moves(state, f_line, walls):
+    """
+    A lower bound on the number of moves to the finish line. In k moves, the car can
+    go at most k*speed + k(k+1) in each direction, so return the smallest k that
+    gets it to the finish line's nearest point.
+    """
+    ((x,y),(u,v)) = state
+    ((x1,y1),(x2,y2)) = f_line
+    d = min(max(abs(x-a), abs(y-b)) for a in range(min(x1,x2), max(x1,x2)+1) \
+        for b in range(min(y1,y2), max(y1,y2)+1))
+    speed = max(abs(u), abs(v))
+    k = 0
+    while k*speed + k*(k+1) < d:
+        k += 1
+    return k
+
+def h_slow(state, f_line, walls):
+    """h_line, slowed down so that a portfolio's other searches can finish first"""
+    time.sleep(0.02)
+    return h_line(state, f_line, walls)
+
+def h_stuck(state, f_line, walls):
+    """A heuristic whose search never finishes, so portfolio has to cancel it"""
+    time.sleep(60)
+    return 0
+
+def h_broken(state, f_line, walls):
+    """A heuristic whose search raises an exception"""
+    raise ValueError('broken heuristic')
+
+def brute_next_states(state, f_line, walls, opponent):
+    """
+    next_states with the given opponent mode, done the slow way: opponent1 for each
+    move, and the original crash for the move and for each error the mode allows
+    """
+    (loc,(vx,vy)) = state
+    states = []
+    for dx in [0,-1,1,-2,2]:
+        for dy in [0,-1,1,-2,2]:
+            w = (vx+dx,vy+dy)
+            newloc = (loc[0]+w[0],loc[1]+w[1])
+            if w == (0,0) or opponent is None:
+                errors = [(0,0)]
+            elif opponent == 'opponent1':
+                errors = [opponents.opponent1(loc, w, f_line, walls) or (0,0)]
+            else:
+                errors = [(q,r) for q in (-1,0,1) for r in (-1,0,1)]
+            if not old_crash((loc,newloc), walls) and not any(old_crash((loc, \
+                (newloc[0]+q,newloc[1]+r)), walls) for (q,r) in errors):
+                states.append((newloc,w))
+    return states
+
+def valid(problem, path):
+    """Test whether path is a legal path from problem's start to the finish"""
+    (title, p0, f_line, walls) = problem
+    return rt.valid_path(path, (p0,(0,0)), f_line, walls)
+
+def search(problem, strategy, h, **kwargs):
+    """Run fsearch.main on problem with racetrack_example's functions, quietly"""
+    (title, p0, f_line, walls) = problem
+    return fsearch.main((p0,(0,0)), \
+        lambda s: [(t,1) for t in rt.next_states(s, f_line, walls)], \
+        lambda s: rt.goal_test(s, f_line), strategy, \
+        lambda s: h(s, f_line, walls), 0, **kwargs)
+
+def counts(stats):
+    """
+    The numbers of generated, pruned and explored nodes, and the final frontier size:
+    every generated node that wasn't pruned or explored is still in the frontier
+    """
+    return (stats.generated, stats.pruned, stats.explored, \
+        stats.generated - stats.pruned - stats.explored)
+
+def test_graph_search_matches_baseline():
+    """
+    The heap frontier and the dictionary of states give the same paths, and generate,
+    prune and explore the same nodes, as the baseline's sorted lists did, with or
+    without packed states
+    """
+    for (strategy, (path, *expected)) in baseline_tiny.items():
+        for pack in ({}, {'pack': rt.pack_state, 'unpack': rt.unpack_state}):
+            (solution, stats) = search(tiny, strategy, h_line, stats=True, **pack)
+            assert solution == path, strategy
+            assert counts(stats) == tuple(expected), strategy
+    for ((title, strategy), (length, *expected)) in baseline_samples.items():
+        (solution, stats) = search(getattr(sample_probs, title), strategy, h_line, \
+            stats=True)
+        assert len(solution)-1 == length, (title, strategy)
+        assert counts(stats) == tuple(expected), (title, strategy)
+
+def test_node_store_keeps_nodes_in_arrays(capsys):
+    """
+    A NodeStore gives back the nodes added to it through Node views, with or without
+    packed states, and its nbytes grows by about the size of a node's columns (32
+    bytes: parent, depth, g, h, and the state or a pointer to it) for each node
+    """
+    n = 1000
+    states = [((x, y), (x-y, y-x)) for x in range(-20, 30) for y in range(-5, 15)][:n]
+    stores = []
+    for pack in ({}, {'pack': rt.pack_state, 'unpack': rt.unpack_state}):
+        store = fsearch.NodeStore(**pack)
+        empty = store.nbytes()
+        ids = [store.add(states[0], 0, 0, None)]
+        for (i, state) in enumerate(states[1:]):
+            ids.append(store.add(state, ids[i//2], 1.5, float(i)))
+        assert len(store) == n and ids == list(range(1, n+1))
+        root = fsearch.Node(store, ids[0])
+        assert root.state == states[0] and root.parent is None
+        assert (root.depth, root.g) == (0, 0) and math.isnan(root.h)
+        for (i, id) in enumerate(ids[1:]):
+            node = fsearch.Node(store, id)
+            assert node.state == states[i+1] and node.parent.id == ids[i//2]
+            assert node.depth == node.parent.depth + 1
+            assert (node.g, node.h) == (node.parent.g + 1.5, i)
+        # the arrays over-allocate as they grow, but not by much
+        assert 32*n <= store.nbytes() - empty <= 40*n
+        stores.append(store)
+    fsearch.print_memory(*stores)
+    assert capsys.readouterr().out == '==> Peak node memory {:.3f} MB for {} nodes.\n'.format( \
+        (stores[0].nbytes() + stores[1].nbytes())/1e6, 2*n)
+
+def test_batch_search_is_deterministic():
+    """
+    Deterministic batched searches do the same thing however many workers there are,
+    with or without packed states, and batched uc finds paths as short as unbatched uc's, deterministic or not.
+    """
+    (title, p0, f_line, walls) = sample_probs.wall16a
+    s0 = (p0, (0,0))
+    shortest = rt.main(s0, f_line, walls, 'uc', no_h, verbose=0)
+    runs = [rt.main(s0, f_line, walls, 'uc', no_h, verbose=0, stats=True, batch=16, \
+        processes=n) for n in (1, 3)]
+    for (path, stats) in runs:
+        assert path == runs[0][0]
+        assert (stats.generated, stats.explored) \
+            == (runs[0][1].generated, runs[0][1].explored)
+        assert len(path) == len(shortest)
+        # h is called once for s0 and once for each child the workers made
+        assert stats.h_calls == stats.generated
+    # the workers send back the states themselves when they aren't packed
+    (path, stats) = search(sample_probs.wall16a, 'uc', no_h, stats=True, batch=16, \
+        processes=2)
+    assert path == runs[0][0]
+    assert (stats.generated, stats.explored) == (runs[0][1].generated, runs[0][1].explored)
+    path = rt.main(s0, f_line, walls, 'uc', no_h, verbose=0, batch=16, processes=2, \
+        deterministic=False)
+    assert len(path) == len(shortest)
+
+def test_portfolio_returns_the_winner_and_records_the_others(tmp_path):
+    """
+    portfolio returns the valid path of the search that finished first, cancels the
+    one still running, and records the one that raised an exception as an error
+    """
+    (title, p0, f_line, walls) = tiny
+    log_file = str(tmp_path / 'portfolio.log')
+    start = time.time()
+    (path, records) = rt.portfolio((p0,(0,0)), f_line, walls, \
+        [('gbf', h_slow), ('gbf', h_stuck), ('gbf', h_broken)], max_time=30, \
+        name=title, log_file=log_file)
+    assert time.time() - start < 30
+    assert path == greedy_tiny_path
+    assert [r['status'] for r in records] == ['won', 'cancelled', 'error']
+    assert [r['heuristic'] for r in records] == ['h_slow', 'h_stuck', 'h_broken']
+    assert records[0]['solved'] and records[0]['generated'] == baseline_tiny['gbf'][1]
+    assert 'broken heuristic' in records[2]['error']
+    with open(log_file) as f:
+        assert [json.loads(line) for line in f] == records
+
+def test_next_states_opponent_modes_match_brute_force():
+    """
+    With each opponent mode, next_states leaves out exactly the moves that crash
+    without an error, or with opponent1's error, or with any of the 9 errors
+    """
+    rng = random.Random(16)
+    for problem in (tiny, sample_probs.wall16a, sample_probs.rhook32a, \
+                    sample_probs.pdes30, sample_probs.twisty1):
+        (title, p0, f_line, walls) = problem
+        xmax = max([max(x,x1) for ((x,y),(x1,y1)) in walls])
+        ymax = max([max(y,y1) for ((x,y),(x1,y1)) in walls])
+        states = [(p0,(0,0))] + [((rng.randint(0,xmax), rng.randint(0,ymax)), \
+            (rng.randint(-4,4), rng.randint(-4,4))) for _ in range(40)]
+        for opponent in (None, 'opponent1', 'fan'):
+            for state in states:
+                assert rt.next_states(state, f_line, walls, opponent) \
+                    == brute_next_states(state, f_line, walls, opponent), \
+                    (title, opponent, state)
+
+def test_ida_star_finds_shortest_path():
+    """With an admissible heuristic, ida* finds a path as short as breadth-first's"""
+    path = search(tiny, 'ida*', h_moves)
+    assert valid(tiny, path)
+    assert len(path) == len(shortest_tiny_path)
+
+def test_sma_star_keeps_within_max_nodes():
+    """
+    sma* never has more than max_nodes nodes in memory, and with an admissible
+    heuristic it still finds a shortest path when there's room for one
+    """
+    for max_nodes in (20, 100, 1000):
+        (path, stats) = search(tiny, 'sma*', h_moves, stats=True, max_nodes=max_nodes)
+        assert stats.peak_frontier <= max_nodes
+        assert valid(tiny, path), max_nodes
+        assert len(path) == len(shortest_tiny_path), max_nodes
+
+def test_ara_star_improves_as_weight_goes_down():
+    """
+    ara* reports better and better paths as it lowers the weight, each within weight
+    times the optimal cost, and returns the last one, which is optimal
+    """
+    (title, p0, f_line, walls) = problem = sample_probs.wall16a
+    optimal = len(search(problem, 'a*', h_moves)) - 1
+    found = []
+    path = search(problem, 'ara*', h_moves, weight=5.0, weight_step=1.0, \
+        on_solution=lambda path, cost, weight: found.append((path, cost, weight)))
+    assert len(found) > 1
+    for ((p, cost, weight), (_, next_cost, next_weight)) in zip(found, found[1:]):
+        assert next_cost < cost and next_weight < weight
+    for (p, cost, weight) in found:
+        assert valid(problem, p)
+        assert len(p)-1 == cost <= weight*optimal
+    assert path == found[-1][0]
+    assert len(path)-1 == optimal
+
+def test_ara_star_stops_at_deadline(monkeypatch):
+    """
+    At the deadline, ara* returns the best path it has found so far, or False if it
+    hasn't found one
+    """
+    problem = sample_probs.wall16a
+    found = []
+    assert search(problem, 'ara*', h_moves, on_solution=lambda *a: found.append(a), \
+        deadline=time.time()) is False
+    assert found == []
+    def out_of_time(path, cost, weight):
+        """make it past the deadline as soon as there's a solution"""
+        found.append(path)
+        monkeypatch.setattr(time, 'time', lambda: math.inf)
+    path = search(problem, 'ara*', h_moves, weight=5.0, weight_step=1.0, \
+        on_solution=out_of_time, deadline=time.time() + 3600)
+    assert found == [path]
+    assert valid(problem, path)
+
+def shortest_to_goals(problem, s0):
+    """
+    A shortest path from s0 to the stopped cars within distance 1 of the finish line,
+    found by breadth-first search
+    """
+    (title, p0, f_line, walls) = problem
+    goals = rt.goal_states(f_line, walls)
+    return fsearch.main(s0, lambda s: [(t,1) for t in rt.next_states(s, f_line, walls)], \
+        lambda s: s in goals, 'bf', None, 0)
+
+def test_bidirectional_paths_end_at_a_stopped_car():
+    """
+    bi-uc and bi-a* find shortest paths to the stopped cars within distance 1 of the
+    finish line, which is where their backward searches start
+    """
+    for problem in (tiny, sample_probs.wall16a):
+        (title, p0, f_line, walls) = problem
+        s0 = (p0, (0,0))
+        goals = rt.goal_states(f_line, walls)
+        shortest = shortest_to_goals(problem, s0)
+        for strategy in ('bi-uc', 'bi-a*'):
+            path = rt.main(s0, f_line, walls, strategy, h_moves, verbose=0)
+            assert valid(problem, path), (title, strategy)
+            assert path[-1] in goals and path[-1][1] == (0,0), (title, strategy)
+            assert len(path) == len(shortest), (title, strategy)
+
+def test_replanner_reroots_and_replans():
+    """
+    After a move along its path, the replanner returns the rest of the path without
+    searching; after a move off its path, it finds a new shortest path
+    """
+    (title, p0, f_line, walls) = tiny
+    s0 = (p0, (0,0))
+    replanner = rt.new_replanner(f_line, walls)
+    path = rt.replan(replanner, s0, f_line, walls)
+    assert valid(tiny, path)
+    assert len(path) == len(shortest_to_goals(tiny, s0))
+    expansions = replanner.iteration
+    assert replanner.has_path(path[1])
+    assert rt.replan(replanner, path[1], f_line, walls) == path[1:]
+    assert replanner.iteration == expansions
+    for s in rt.next_states(s0, f_line, walls):
+        if s != path[1] and not replanner.has_path(s):
+            new_path = rt.replan(replanner, s, f_line, walls)
+            assert new_path[0] == s
+            assert valid(tiny, [s0] + new_path)
+            assert len(new_path) == len(shortest_to_goals(tiny, s))
+    assert replanner.iteration > expansions
+
+def test_replanner_resumes_after_pickling():
+    """
+    A replanner stopped by max_expansions and pickled carries on where it stopped, and
+    ends up with the same path after the same number of expansions
+    """
+    (title, p0, f_line, walls) = tiny
+    s0 = (p0, (0,0))
+    replanner = rt.new_replanner(f_line, walls)
+    path = rt.replan(replanner, s0, f_line, walls)
+    resumed = rt.new_replanner(f_line, walls)
+    calls = 0
+    while True:
+        resumed = pickle.loads(pickle.dumps(resumed))
+        result = rt.replan(resumed, s0, f_line, walls, max_expansions=10)
+        calls += 1
+        if result is not None:
+            break
+        assert resumed.iteration == 10*calls
+    assert calls > 1
+    assert result == path
+    assert resumed.iteration == replanner.iteration
+
+def test_replanner_keeps_explored_g_values_exact():
+    """
+    A node with a worse g-value doesn't prune an explored node whose h-value was
+    computed for an earlier root
+    """
+    edges = [('S','G'), ('X','G'), ('S','X'), ('T','S'), ('T','X'), ('Q2','S'), \
+        ('Q','Q2'), ('R1','Q')]
+    def h_back(s, s0):
+        """the exact cost from s0 to s"""
+        dist = {s0: 0}
+        todo = [s0]
+        for a in todo:
+            for (u,v) in edges:
+                if u == a and v not in dist:
+                    dist[v] = dist[a] + 1
+                    todo.append(v)
+        return dist.get(s, math.inf)
+    prev_states = lambda s: [(u,1) for (u,v) in edges if v == s]
+    replanner = fsearch.Replanner(['G'])
+    assert replanner.plan('R1', prev_states, h_back) == ['R1', 'Q', 'Q2', 'S', 'G']
+    assert replanner.plan('T', prev_states, h_back) in (['T', 'S', 'G'], ['T', 'X', 'G'])
+    assert replanner.plan('S', prev_states, h_back) == ['S', 'G']
+
+def test_lazy_a_star_calls_h_less():
+    """
+    With a consistent heuristic, lazy a* finds a path as short as a*'s and generates
+    the same number of nodes, but calls h on far fewer of them
+    """
+    (path, stats) = search(tiny, 'a*', h_moves, stats=True)
+    (lazy_path, lazy_stats) = search(tiny, 'a*', h_moves, stats=True, lazy=True)
+    assert valid(tiny, lazy_path)
+    assert len(lazy_path) == len(path)
+    assert lazy_stats.generated == stats.generated
+    assert lazy_stats.h_calls < stats.h_calls
+
+def test_stats_records_the_search():
+    """Stats has consistent counts and times, for searches that succeed and fail"""
+    (path, stats) = search(tiny, 'a*', h_moves, stats=True)
+    assert stats.solved and stats.path_length == len(path)-1
+    assert stats.strategy == 'a*'
+    assert stats.h_calls == stats.generated     # h is called once for each node
+    assert 0 < stats.explored <= stats.generated
+    assert 0 < stats.peak_frontier <= stats.generated
+    assert stats.time >= stats.next_states_time + stats.h_time + stats.prune_time
+    record = json.loads(json.dumps(stats.as_dict()))
+    assert record['generated'] == stats.generated
+    assert record['expansions_per_sec'] == stats.explored/stats.time
+    (path, stats) = search(tiny, 'ida*', h_moves, stats=True)
+    assert stats.solved and stats.prune_time is None
+    # a finish line outside the walls can't be reached
+    boxed = ['boxed', (1,1), [(6,1),(6,3)], [[(0,0),(4,0)], [(4,0),(4,4)], [(4,4),(0,4)], \
+        [(0,4),(0,0)]]]
+    (path, stats) = search(boxed, 'bf', h_moves, stats=True)
+    assert path is False
+    assert not stats.solved and stats.path_length is None
+    assert stats.explored == stats.generated - stats.pruned > 0
@@ -0,0 +1,411 @@
+"""
+File: test_geometry.py
+Tests for geometry.py, run with pytest. The crash tests are checked against
+old_crash and old_intersect, which are the project's original versions of crash and
+intersect (from racetrack.py), kept here as the reference. The other old_ functions
+are the original versions of functions from the other files, for the same purpose.
+"""
+
+import math
+import random
+import pickle
+import sample_probs
+import geometry
+import opponents
+import proj2
+
+
+def old_crash(move,walls):
+    """Test whether move intersects a wall in walls"""
+    for wall in walls:
+        if old_intersect(move,wall): return True
+    return False
+
+def old_intersect(e1,e2):
+    """Test whether edges e1 and e2 intersect"""
+    # First, grab all the coordinates
+    ((x1a,y1a), (x1b,y1b)) = e1
+    ((x2a,y2a), (x2b,y2b)) = e2
+    dx1 = x1a-x1b
+    dy1 = y1a-y1b
+    dx2 = x2a-x2b
+    dy2 = y2a-y2b
+    if (dx1 == 0) and (dx2 == 0):       # both lines vertical
+        if x1a != x2a: return False
+        else:   # the lines are collinear
+            return old_collinear_point_in_edge((x1a,y1a),e2) \
+                or old_collinear_point_in_edge((x1b,y1b),e2) \
+                or old_collinear_point_in_edge((x2a,y2a),e1) \
+                or old_collinear_point_in_edge((x2b,y2b),e1)
+    if (dx2 == 0):      # e2 is vertical (so m2 = infty), but e1 isn't vertical
+        x = x2a
+        # compute y = m1 * x + b1, but minimize roundoff error
+        y = (x2a-x1a)*dy1/float(dx1) + y1a
+        return old_collinear_point_in_edge((x,y),e1) and old_collinear_point_in_edge((x,y),e2)
+    elif (dx1 == 0):        # e1 is vertical (so m1 = infty), but e2 isn't vertical
+        x = x1a
+        # compute y = m2 * x + b2, but minimize roundoff error
+        y = (x1a-x2a)*dy2/float(dx2) + y2a
+        return old_collinear_point_in_edge((x,y),e1) and old_collinear_point_in_edge((x,y),e2)
+    else:       # neither line is vertical
+        # check m1 = m2, without roundoff error:
+        if dy1*dx2 == dx1*dy2:      # same slope, so either parallel or collinear
+            # check b1 != b2, without roundoff error:
+            if dx2*dx1*(y2a-y1a) != dy2*dx1*x2a - dy1*dx2*x1a:  # not collinear
+                return False
+            # collinear
+            return old_collinear_point_in_edge((x1a,y1a),e2) \
+                or old_collinear_point_in_edge((x1b,y1b),e2) \
+                or old_collinear_point_in_edge((x2a,y2a),e1) \
+                or old_collinear_point_in_edge((x2b,y2b),e1)
+        # compute x = (b2-b1)/(m1-m2) but minimize roundoff error:
+        x = (dx2*dx1*(y2a-y1a) - dy2*dx1*x2a + dy1*dx2*x1a)/float(dx2*dy1 - dy2*dx1)
+        # compute y = m1*x + b1 but minimize roundoff error
+        y = (dy2*dy1*(x2a-x1a) - dx2*dy1*y2a + dx1*dy2*y1a)/float(dy2*dx1 - dx2*dy1)
+    return old_collinear_point_in_edge((x,y),e1) and old_collinear_point_in_edge((x,y),e2)
+
+def old_collinear_point_in_edge(point, edge):
+    """
+    Helper function for old_intersect, to test whether a point is in an edge,
+    assuming the point and edge are already known to be collinear.
+    """
+    (x,y) = point
+    ((xa,ya),(xb,yb)) = edge
+    if ((xa <= x <= xb) or (xb <= x <= xa)) and ((ya <= y <= yb) or (yb <= y <= ya)):
+       return True
+    return False
+
+def old_oppcrashcheck(prev, state, walls, n2finish):
+    """The original oppcrashcheck from proj2, which makes 9 crash checks"""
+    (x1, y1) = prev
+    (x2, y2) = state
+    if state in n2finish and prev == state:
+        return False
+    for i in range(x2 - 1, x2 + 2):
+        for j in range(y2 - 1, y2 + 2):
+            if old_crash([(x1, y1), (i, j)], walls):
+                return True
+    return False
+
+def old_opponent1(p, z, finish, walls):
+    """The original opponent1 from opponents.py, which checks every wall for every error"""
+    if z == (0,0):
+        return (0,0)
+    x = p[0] + z[0]
+    y = p[1] + z[1]
+    ebest = None
+    dbest = math.inf
+    for q in range(-1,2):
+        for r in range(-1,2):
+            for w in walls:
+                d = old_edistf_to_line((x+q,y+r), w, finish)
+                if d < dbest:
+                    dbest = d
+                    ebest = (q,r)
+    return ebest
+
+def old_edistf_to_line(point, edge, f_line):
+    """
+    The original edistf_to_line from opponents.py: the distance from point to the
+    nearest lattice point of edge that it can reach without intersecting f_line
+    """
+    (x,y) = point
+    ((x1,y1),(x2,y2)) = edge
+    if x1 == x2:
+        ds = [math.sqrt((x1-x)**2 + (yy-y)**2) \
+            for yy in range(min(y1,y2),max(y1,y2)+1) \
+            if not old_intersect([(x,y),(x1,yy)], f_line)]
+    else:
+        ds = [math.sqrt((xx-x)**2 + (y1-y)**2) \
+            for xx in range(min(x1,x2),max(x1,x2)+1) \
+            if not old_intersect([(x,y),(xx,y1)], f_line)]
+    ds.append(math.inf)
+    return min(ds)
+
+def old_edist_to_line(point, edge):
+    """The original edist_to_line from proj2_example and env"""
+    (x,y) = point
+    ((x1,y1),(x2,y2)) = edge
+    if x1 == x2:
+        ds = [math.sqrt((x1-x)**2 + (y3-y)**2) \
+            for y3 in range(min(y1,y2),max(y1,y2)+1)]
+    else:
+        ds = [math.sqrt((x3-x)**2 + (y1-y)**2) \
+            for x3 in range(min(x1,x2),max(x1,x2)+1)]
+    return min(ds)
+
+
+def old_edist_grid(fline,walls):
+    """
+    The original edist_grid from proj2_example: each point's distance to fline, going
+    around the walls, found by relaxing every point until nothing changes
+    """
+    xmax = max([max(x,x1) for ((x,y),(x1,y1)) in walls])
+    ymax = max([max(y,y1) for ((x,y),(x1,y1)) in walls])
+    grid = [[old_edistw_to_finish((x,y), fline, walls) for y in range(ymax+1)] \
+        for x in range(xmax+1)]
+    flag = True
+    while flag:
+        flag = False
+        for x in range(xmax+1):
+            for y in range(ymax+1):
+                for y1 in range(max(0,y-1),min(ymax+1,y+2)):
+                    for x1 in range(max(0,x-1),min(xmax+1,x+2)):
+                        if grid[x1][y1] != math.inf and not old_crash(((x,y),(x1,y1)),walls):
+                            if x == x1 or y == y1:
+                                d = grid[x1][y1] + 1
+                            else:
+                                d = grid[x1][y1] + 1.4142135623730951
+                            if d < grid[x][y]:
+                                grid[x][y] = d
+                                flag = True
+    return grid
+
+def old_edistw_to_finish(point, fline, walls):
+    """
+    straight-line distance from (x,y) to the finish line ((x1,y1),(x2,y2)).
+    Return infinity if there's no way to do it without intersecting a wall
+    """
+    (x,y) = point
+    ((x1,y1),(x2,y2)) = fline
+    if x1 == x2:           # fline is vertical, so iterate over y
+        ds = [math.sqrt((x1-x)**2 + (y3-y)**2) \
+            for y3 in range(min(y1,y2),max(y1,y2)+1) \
+            if not old_crash(((x,y),(x1,y3)), walls)]
+    else:                  # fline is horizontal, so iterate over x
+        ds = [math.sqrt((x3-x)**2 + (y1-y)**2) \
+            for x3 in range(min(x1,x2),max(x1,x2)+1) \
+            if not old_crash(((x,y),(x3,y1)), walls)]
+    ds.append(math.inf)    # for the case where ds is empty
+    return min(ds)
+
+
+def sample_tracks():
+    """The problems in sample_probs, each a list [title, p0, f_line, walls]"""
+    return [p for p in vars(sample_probs).values() \
+        if isinstance(p, list) and len(p) == 4 and isinstance(p[0], str)]
+
+def random_points(rng, walls, n, margin=2):
+    """n random lattice points in the walls' bounding box, widened by margin"""
+    xs = [x for wall in walls for (x,y) in wall]
+    ys = [y for wall in walls for (x,y) in wall]
+    return [(rng.randint(min(xs)-margin, max(xs)+margin), \
+        rng.randint(min(ys)-margin, max(ys)+margin)) for _ in range(n)]
+
+def random_walls(rng, n, size):
+    """
+    n random walls in [0,size]^2: mostly vertical or horizontal, with some
+    diagonal ones and some that are single points
+    """
+    walls = []
+    for _ in range(n):
+        (x, y) = (rng.randint(0,size), rng.randint(0,size))
+        kind = rng.random()
+        if kind < 0.4:      walls.append(((x,y), (x, rng.randint(0,size))))
+        elif kind < 0.8:    walls.append(((x,y), (rng.randint(0,size), y)))
+        elif kind < 0.9:    walls.append(((x,y), (rng.randint(0,size), rng.randint(0,size))))
+        else:               walls.append(((x,y), (x,y)))
+    return walls
+
+def random_moves(rng, walls, n, size, speed):
+    """
+    n random moves in [-1,size+1]^2 of at most speed in each direction. Half of them
+    start at a wall's endpoint, to test moves that graze the walls' ends.
+    """
+    moves = []
+    for _ in range(n):
+        if rng.random() < 0.5:
+            (x, y) = rng.choice(rng.choice(walls))
+        else:
+            (x, y) = (rng.randint(-1,size+1), rng.randint(-1,size+1))
+        (dx, dy) = (rng.randint(-speed,speed), rng.randint(-speed,speed))
+        moves.append(((x,y), (x+dx,y+dy)))
+    return moves
+
+def test_intersect_matches_old_intersect():
+    """
+    Fuzz intersect against the original on random integer edges. Small coordinate
+    ranges make touching, collinear, and single-point edges common.
+    """
+    rng = random.Random(20)
+    for size in (1, 2, 3, 5, 10, 100, 1000):
+        for _ in range(20000):
+            (e1, e2) = [((rng.randint(-size,size), rng.randint(-size,size)), \
+                (rng.randint(-size,size), rng.randint(-size,size))) for _ in range(2)]
+            expected = old_intersect(e1, e2)
+            assert geometry.intersect(e1, e2) == expected, (e1, e2)
+            assert geometry.intersect(e2, e1) == expected, (e2, e1)
+            # integer-valued floats give the same answers as ints
+            floats = [tuple((float(x), float(y)) for (x,y) in e) for e in (e1, e2)]
+            assert geometry.intersect(*floats) == expected, (e1, e2)
+
+def test_raster_crash_matches_old_crash():
+    """RasterIndex.crash agrees with the original crash on random tracks and moves"""
+    rng = random.Random(13)
+    for _ in range(200):
+        size = rng.randint(2, 30)
+        walls = random_walls(rng, rng.randint(1,12), size)
+        raster = geometry.RasterIndex(walls)
+        for move in random_moves(rng, walls, 200, size, 8):
+            assert raster.crash(move) == old_crash(move, walls), (move, walls)
+
+def test_backends_match_old_crash_on_sample_tracks():
+    """Both backends give the original crash's answers for moves on the sample tracks"""
+    rng = random.Random(130)
+    for problem in sample_tracks():
+        (title, p0, f_line, walls) = problem
+        xmax = max([max(x,x1) for ((x,y),(x1,y1)) in walls])
+        ymax = max([max(y,y1) for ((x,y),(x1,y1)) in walls])
+        moves = random_moves(rng, walls, 300, max(xmax,ymax), 10)
+        expected = [old_crash(move, walls) for move in moves]
+        for kind in geometry.backends:
+            index = geometry.backends[kind](walls)
+            assert [index.crash(move) for move in moves] == expected, (title, kind)
+            assert list(index.crash_mask(moves)) == expected, (title, kind)
+
+def test_rebuilt_indexes_match_old_crash(monkeypatch):
+    """
+    An index rebuilt for changed walls gives the original crash's answers for them,
+    whether it's rebuilt directly, or by crash (for a new list) or rebuild_index (for
+    a list changed in place). On twisty1, either backend tests a move against fewer
+    walls than crash did.
+    """
+    rng = random.Random(12)
+    (title, p0, f_line, walls) = sample_probs.twisty1
+    size = max([max(x,y,x1,y1) for ((x,y),(x1,y1)) in walls])
+    moves = random_moves(rng, walls, 300, size, 10)
+    changed = random_walls(rng, len(walls), size)
+    for kind in geometry.backends:
+        index = geometry.backends[kind](walls)
+        assert [index.crash(move) for move in moves] == [old_crash(m, walls) for m in moves]
+        assert index.candidates_per_query() < len(walls), kind
+        index.rebuild(changed)
+        assert [index.crash(move) for move in moves] == [old_crash(m, changed) for m in moves]
+        monkeypatch.setattr(geometry, 'backend', kind)
+        monkeypatch.setattr(geometry, '_index', None)
+        track = list(walls)
+        assert [geometry.crash(m, track) for m in moves] == [old_crash(m, walls) for m in moves]
+        track[:] = changed
+        geometry.rebuild_index(track)
+        assert [geometry.crash(m, track) for m in moves] == [old_crash(m, changed) for m in moves]
+
+def test_finish_distance_grid_matches_brute_force():
+    """finish_distance_grid gives each point's distance to the nearest visible finish point"""
+    for problem in sample_tracks():
+        (title, p0, f_line, walls) = problem
+        xmax = max([max(x,x1) for ((x,y),(x1,y1)) in walls])
+        ymax = max([max(y,y1) for ((x,y),(x1,y1)) in walls])
+        if (xmax+1)*(ymax+1) > 3000:
+            continue
+        grid = geometry.finish_distance_grid(f_line, walls, xmax, ymax)
+        ((x1,y1),(x2,y2)) = f_line
+        if x1 == x2:    line = [(x1,y) for y in range(min(y1,y2), max(y1,y2)+1)]
+        else:           line = [(x,y1) for x in range(min(x1,x2), max(x1,x2)+1)]
+        for x in range(xmax+1):
+            for y in range(ymax+1):
+                expected = min([math.sqrt((x-fx)**2 + (y-fy)**2) for (fx,fy) in line \
+                    if not old_crash(((x,y),(fx,fy)), walls)] + [float('inf')])
+                assert grid[x][y] == expected, (title, (x,y))
+
+def test_distance_grid_matches_old_edist_grid():
+    """distance_grid gives the original edist_grid's values, to the last bit"""
+    for problem in sample_tracks():
+        (title, p0, f_line, walls) = problem
+        xmax = max([max(x,x1) for ((x,y),(x1,y1)) in walls])
+        ymax = max([max(y,y1) for ((x,y),(x1,y1)) in walls])
+        if (xmax+1)*(ymax+1) > 1100:
+            continue
+        grid = geometry.distance_grid(f_line, walls, xmax, ymax)
+        expected = old_edist_grid(f_line, walls)
+        assert list(grid) == [d for column in expected for d in column], title
+
+def test_move_table_matches_old_crash():
+    """
+    A MoveTable gives the original crash's answers for every move from a sample of
+    points on the sample tracks, whether the move is in the table, beyond its speed,
+    or from a point outside it, and so does one that has been pickled
+    """
+    rng = random.Random(14)
+    for problem in sample_tracks():
+        (title, p0, f_line, walls) = problem
+        for speed in (2, None):
+            table = geometry.MoveTable(walls, speed)
+            s = table.speed + 2
+            displacements = [(dx,dy) for dx in range(-s,s+1) for dy in range(-s,s+1)]
+            for (x,y) in random_points(rng, walls, 10):
+                expected = [old_crash(((x,y),(x+dx,y+dy)), walls) for (dx,dy) in displacements]
+                assert table.crashes((x,y), displacements) == expected, (title, (x,y))
+                # the second time, the answers come from the filled bitmask
+                assert table.crashes((x,y), displacements) == expected, (title, (x,y))
+                copy = pickle.loads(pickle.dumps(table))
+                assert copy.crashes((x,y), displacements) == expected, (title, (x,y))
+                assert geometry.crash_moves((x,y), displacements, walls) == expected, \
+                    (title, (x,y))
+
+def test_crash_fans_match_nine_crash_checks():
+    """
+    crash_fans says a move crashes exactly when one of the 9 moves to its endpoint
+    plus an error crashes, and proj2.oppcrashcheck gives the original's answers
+    """
+    rng = random.Random(15)
+    for problem in sample_tracks():
+        (title, p0, f_line, walls) = problem
+        n2finish = proj2.nearfl(f_line)
+        s = geometry.max_speed + 1
+        displacements = [(dx,dy) for dx in range(-s,s+1) for dy in range(-s,s+1)]
+        points = random_points(rng, walls, 5) + rng.sample(n2finish, 3)
+        for (x,y) in points:
+            expected = [any(old_crash(((x,y),(x+dx+q,y+dy+r)), walls) \
+                for (q,r) in geometry.errors) for (dx,dy) in displacements]
+            assert geometry.crash_fans((x,y), displacements, walls) == expected, \
+                (title, (x,y))
+            for (dx,dy) in displacements:
+                (prev, state) = ((x,y), (x+dx,y+dy))
+                assert proj2.oppcrashcheck(prev, state, walls, n2finish) \
+                    == old_oppcrashcheck(prev, state, walls, n2finish), (title, prev, state)
+
+def test_opponent1_matches_old_opponent1():
+    """opponent1, with its distance field, picks the same error as the original"""
+    rng = random.Random(17)
+    for problem in sample_tracks():
+        (title, p0, f_line, walls) = problem
+        for p in random_points(rng, walls, 150):
+            z = (rng.randint(-4,4), rng.randint(-4,4))
+            assert opponents.opponent1(p, z, f_line, walls) \
+                == old_opponent1(p, z, f_line, walls), (title, p, z)
+
+def test_edge_distances_match_old_edist_functions():
+    """
+    edge_distance, edge_distances and edge_distance_blocked give the original
+    edist_to_line's and edistf_to_line's values at points of the sample tracks, and
+    finish_distance_grid gives the original edistw_to_finish's, including at points
+    that walls hide part of the finish line from
+    """
+    rng = random.Random(18)
+    partly_blocked = {'wall': 0, 'finish line': 0}
+    for problem in sample_tracks():
+        (title, p0, f_line, walls) = problem
+        xmax = max([max(x,x1) for ((x,y),(x1,y1)) in walls])
+        ymax = max([max(y,y1) for ((x,y),(x1,y1)) in walls])
+        if (xmax+1)*(ymax+1) <= 1100:
+            points = [(x,y) for x in range(xmax+1) for y in range(ymax+1)]
+        else:
+            points = random_points(rng, walls, 500, margin=0)
+        for edge in walls + [f_line]:
+            expected = [old_edist_to_line(p, edge) for p in points]
+            assert [geometry.edge_distance(p, edge) for p in points] == expected, title
+            assert list(geometry.edge_distances(points, edge)) == expected, title
+        for edge in walls:
+            for p in points:
+                expected = old_edistf_to_line(p, edge, f_line)
+                assert geometry.edge_distance_blocked(p, edge, f_line) == expected, \
+                    (title, p, edge)
+                if old_edist_to_line(p, edge) < expected < math.inf:
+                    partly_blocked['wall'] += 1
+        grid = geometry.finish_distance_grid(f_line, walls, xmax, ymax)
+        for (x,y) in points:
+            expected = old_edistw_to_finish((x,y), f_line, walls)
+            assert grid[x][y] == expected, (title, (x,y))
+            if old_edist_to_line((x,y), f_line) < expected < math.inf:
+                partly_blocked['finish line'] += 1
+    assert all(partly_blocked.values()), partly_blocked
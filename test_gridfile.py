@@ -0,0 +1,163 @@
+"""
+File: test_gridfile.py
+Tests for gridfile.py, run with pytest. Each test writes its files in a temporary
+directory.
+"""
+
+import os
+import math
+import signal
+import struct
+import multiprocessing as mp
+from array import array
+import pytest
+import sample_probs
+import geometry
+import gridfile
+
+
+def small_grid(width, height):
+    """A grid of width*height floats that aren't all representable as 32-bit floats"""
+    values = array('d', [x + y/3 for x in range(width) for y in range(height)])
+    values[1] = math.nan
+    values[2] = math.inf
+    return gridfile.as_grid(values, width, height)
+
+def test_header_has_size_missing_and_fingerprint(tmp_path):
+    """The header says what the module docstring says it does"""
+    (title, p0, f_line, walls) = sample_probs.rect20a
+    filename = str(tmp_path / 'grid.dat')
+    gridfile.write_grid(filename, small_grid(4, 3), f_line, walls, missing=5)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    assert len(data) == 40 + 4*4*3
+    assert struct.unpack_from('<8sIIQ16s', data) \
+        == (b'RTGRID2\0', 4, 3, 5, gridfile.fingerprint(f_line, walls))
+
+def test_fingerprint_depends_only_on_the_track():
+    """Lists and tuples, and ints and equal floats, give the same fingerprint"""
+    (title, p0, f_line, walls) = sample_probs.rect20a
+    same = (tuple(map(tuple, f_line)), [[(float(x), y) for (x,y) in w] for w in walls])
+    assert gridfile.fingerprint(f_line, walls) == gridfile.fingerprint(*same)
+    moved = [[(x+1, y) for (x,y) in w] for w in walls]
+    assert gridfile.fingerprint(f_line, walls) != gridfile.fingerprint(f_line, moved)
+    assert gridfile.fingerprint(f_line, walls) != gridfile.fingerprint(f_line[::-1], walls)
+
+def test_values_round_trip_as_float32(tmp_path):
+    """read_grid gives back each value rounded to a 32-bit float, with NaN and inf kept"""
+    (title, p0, f_line, walls) = sample_probs.rect20a
+    filename = str(tmp_path / 'grid.dat')
+    grid = small_grid(5, 7)
+    gridfile.write_grid(filename, grid, f_line, walls)
+    read = gridfile.read_grid(filename, f_line, walls)
+    assert read.shape == (5, 7)
+    for x in range(5):
+        for y in range(7):
+            expected = array('f', [grid[x,y]])[0]
+            if expected != expected:
+                assert read[x,y] != read[x,y]
+            else:
+                assert read[x,y] == expected
+    gridfile.close_grid(read)
+
+def test_stale_or_broken_grids_are_rejected(tmp_path):
+    """read_grid returns None for another track's grid, or a file that isn't a grid"""
+    (title, p0, f_line, walls) = sample_probs.rect20a
+    filename = str(tmp_path / 'grid.dat')
+    assert gridfile.read_grid(filename, f_line, walls) is None
+    gridfile.write_grid(filename, small_grid(4, 3), f_line, walls)
+    assert gridfile.read_grid(filename, sample_probs.rect20b[2], walls) is None
+    assert gridfile.read_grid(filename, f_line, walls[:-1]) is None
+    with open(filename, 'rb') as f:
+        data = f.read()
+    for broken in (b'', data[:20], data[:-4], b'RTGRID1\0' + data[8:]):
+        with open(filename, 'wb') as f:
+            f.write(broken)
+        assert gridfile.read_grid(filename, f_line, walls) is None
+
+def test_closed_grid_file_can_be_replaced(tmp_path):
+    """After close_grid, the file's mapping is gone, so the file can be rewritten"""
+    (title, p0, f_line, walls) = sample_probs.rect20a
+    filename = str(tmp_path / 'grid.dat')
+    gridfile.write_grid(filename, small_grid(4, 3), f_line, walls)
+    grid = gridfile.read_grid(filename, f_line, walls)
+    data = grid.obj
+    gridfile.close_grid(grid)
+    assert data.closed
+    gridfile.write_grid(filename, small_grid(4, 3), f_line, walls, missing=1)
+    assert gridfile._map(filename, f_line, walls)[3] == 1
+
+class Killed(Exception):
+    """Raised to stop compute_grid partway, as if its process had been killed"""
+
+def test_resumed_grid_matches_clean_run(tmp_path, monkeypatch):
+    """
+    A grid that compute_grid carries on from a checkpoint, in either of its phases,
+    is the same to the last bit as one computed without stopping
+    """
+    (title, p0, f_line, walls) = sample_probs.lhook32
+    clean = gridfile.compute_grid(str(tmp_path / 'clean.dat'), f_line, walls, processes=1)
+    monkeypatch.setattr(gridfile, 'checkpoint_interval', 0)
+    monkeypatch.setattr(gridfile, 'checkpoint_steps', 100)
+    monkeypatch.setattr(gridfile, 'strip_cells', 100)
+    (run, strip_distances) = (geometry.GridSearch.run, gridfile.strip_distances)
+    for (owner, name, func) in ((geometry.GridSearch, 'run', run), \
+                                (gridfile, 'strip_distances', strip_distances)):
+        calls = 0
+        def stop_after_3(*args):
+            nonlocal calls
+            calls += 1
+            if calls > 3:
+                raise Killed
+            return func(*args)
+        filename = str(tmp_path / '{}.dat'.format(name))
+        monkeypatch.setattr(owner, name, stop_after_3)
+        with pytest.raises(Killed):
+            gridfile.compute_grid(filename, f_line, walls, processes=1)
+        monkeypatch.setattr(owner, name, func)
+        saved = filename if owner is geometry.GridSearch else filename + '.los'
+        (values, width, height, missing) = gridfile._map(saved, f_line, walls)
+        assert values.format == 'd' and 0 < missing < width*height, name
+        gridfile.close_grid(values)
+        resumed = gridfile.compute_grid(filename, f_line, walls, processes=1)
+        assert resumed.tobytes() == clean.tobytes(), name
+
+def test_strip_pool_matches_one_process(monkeypatch):
+    """finish_distances gives the same distances with worker processes as without"""
+    (title, p0, f_line, walls) = sample_probs.lhook32
+    alone = gridfile.finish_distances(f_line, walls, 32, 32, processes=1)
+    monkeypatch.setattr(gridfile, 'parallel_cells', 1)
+    monkeypatch.setattr(gridfile, 'strip_cells', 100)
+    pooled = gridfile.finish_distances(f_line, walls, 32, 32, processes=2)
+    assert pooled.tobytes() == alone.tobytes()
+
+def test_sigterm_stops_the_strip_pool(tmp_path, monkeypatch):
+    """
+    SIGTERM while the workers are running raises SystemExit, leaves the strips done so
+    far in the file, terminates the workers, and puts back the old SIGTERM handler; a
+    later call carries on from the file
+    """
+    (title, p0, f_line, walls) = sample_probs.lhook32
+    alone = gridfile.finish_distances(f_line, walls, 32, 32, processes=1)
+    filename = str(tmp_path / 'grid.dat.los')
+    monkeypatch.setattr(gridfile, 'parallel_cells', 1)
+    monkeypatch.setattr(gridfile, 'strip_cells', 100)
+    monkeypatch.setattr(gridfile, 'checkpoint_interval', 0)
+    write_grid = gridfile.write_grid
+    def write_then_terminate(*args):
+        write_grid(*args)
+        os.kill(os.getpid(), signal.SIGTERM)
+    monkeypatch.setattr(gridfile, 'write_grid', write_then_terminate)
+    handler = signal.getsignal(signal.SIGTERM)
+    with pytest.raises(SystemExit) as stopped:
+        gridfile.finish_distances(f_line, walls, 32, 32, processes=2, filename=filename)
+    assert stopped.value.code == 128 + signal.SIGTERM
+    assert signal.getsignal(signal.SIGTERM) == handler
+    assert mp.active_children() == []
+    (values, width, height, missing) = gridfile._map(filename, f_line, walls)
+    assert 0 < missing < width*height
+    gridfile.close_grid(values)
+    monkeypatch.setattr(gridfile, 'write_grid', write_grid)
+    resumed = gridfile.finish_distances(f_line, walls, 32, 32, processes=2, \
+        filename=filename)
+    assert resumed.tobytes() == alone.tobytes()
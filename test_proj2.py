@@ -0,0 +1,70 @@
+"""
+File: test_proj2.py
+Tests for proj2.py, run with pytest. Each test runs in its own temporary directory,
+with its own trackcache directory, since proj2 keeps its files in the current
+directory and its precomputed files in trackcache.
+"""
+
+import os
+import math
+import mmap
+from array import array
+import pytest
+import sample_probs
+import geometry
+import gridfile
+import trackcache
+import proj2
+
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    """Run in tmp_path, with an empty cache and no move table left from other tests"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(trackcache, 'cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.setattr(geometry, '_table', None)
+    (title, p0, f_line, walls) = sample_probs.wall16a
+    return ((p0,(0,0)), f_line, walls)
+
+def test_main_keeps_the_move_table_here_and_initialize_caches_it(game):
+    """
+    main saves the move table it fills in to moves.pickle but not to trackcache; the
+    next initialize in the same directory puts it in trackcache
+    """
+    (state, f_line, walls) = game
+    moves = trackcache.entry(f_line, walls, 'moves')
+    proj2.initialize(state, f_line, walls)
+    assert not os.path.exists(moves)
+    proj2.main(state, f_line, walls)
+    table = gridfile.read_move_table('moves.pickle', f_line, walls)
+    assert table.nfilled > 0
+    assert not os.path.exists(moves)
+    proj2.initialize(state, f_line, walls)
+    assert gridfile.read_move_table(moves, f_line, walls).nfilled == table.nfilled
+
+def test_main_keeps_a_finished_grid_mapped(game, monkeypatch):
+    """When grid.dat is finished, main uses it as it is, without computing it again"""
+    (state, f_line, walls) = game
+    proj2.initialize(state, f_line, walls)
+    def fail(*args, **kwargs):
+        raise AssertionError('compute_grid was called')
+    monkeypatch.setattr(gridfile, 'compute_grid', fail)
+    monkeypatch.setattr(gridfile, 'write_grid', fail)
+    proj2.main(state, f_line, walls)
+    assert isinstance(proj2.grid.obj, mmap.mmap) and not proj2.grid.obj.closed
+
+def test_main_finishes_a_partial_grid(game, monkeypatch):
+    """When grid.dat isn't finished, main finishes it, and uses the finished grid"""
+    (state, f_line, walls) = game
+    proj2.initialize(state, f_line, walls)
+    (grid, missing) = gridfile.map_grid('grid.dat', f_line, walls)
+    (width, height) = grid.shape
+    gridfile.close_grid(grid)
+    empty = gridfile.as_grid(array('d', [math.nan])*(width*height), width, height)
+    gridfile.write_grid('grid.dat', empty, f_line, walls, width*height, 'd')
+    proj2.main(state, f_line, walls)
+    (grid, missing) = gridfile.map_grid('grid.dat', f_line, walls)
+    assert missing == 0
+    # (compute_grid returns the 64-bit floats it wrote as 32-bit ones)
+    assert array('f', proj2.grid.cast('B').cast('d')) == array('f', grid.cast('B').cast('f'))
+    gridfile.close_grid(grid)
@@ -0,0 +1,31 @@
+"""
+File: test_proj2_example.py
+Tests for proj2_example.py, run with pytest. Each test runs in its own temporary
+directory, since proj2_example keeps its files in the current directory.
+"""
+
+import ast
+import sample_probs
+import racetrack_example as rt
+import proj2_example
+
+
+def velocities(filename='choices.txt'):
+    """The velocities that main wrote to filename, in order"""
+    with open(filename) as f:
+        return [ast.literal_eval(line) for line in f if line.strip()]
+
+def test_main_writes_a_velocity_before_replanning(tmp_path, monkeypatch):
+    """
+    If ara* runs out of time without a path, main writes a fallback velocity before
+    starting the replanner, so that one is there even if the replanner is killed
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(proj2_example, 'ara_time', 0)
+    monkeypatch.setattr(proj2_example, 'run_replanner', lambda *args: None)
+    (title, p0, f_line, walls) = sample_probs.wall16a
+    state = (p0, (0,0))
+    proj2_example.main(state, f_line, walls)
+    [velocity] = velocities()
+    newloc = (p0[0]+velocity[0], p0[1]+velocity[1])
+    assert (newloc, velocity) in rt.next_states(state, f_line, walls)
@@ -0,0 +1,84 @@
+"""
+File: test_trackcache.py
+Tests for trackcache.py, run with pytest. Each test uses a cache directory in a
+temporary directory, rather than the user's.
+"""
+
+import os
+import shutil
+import pytest
+import sample_probs
+import trackcache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Make trackcache use an empty directory, and return its path"""
+    monkeypatch.setattr(trackcache, 'cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / 'cache'
+
+def write(filename, data):
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+def read(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+def test_fetch_gets_what_store_stored(cache):
+    """A stored file comes back from fetch, for the same track and kind"""
+    (title, p0, f_line, walls) = sample_probs.rect20a
+    write('grid.dat', b'grid data')
+    trackcache.store(f_line, walls, 'grid', 'grid.dat')
+    assert trackcache.fetch(f_line, walls, 'grid', 'copy.dat')
+    assert read('copy.dat') == b'grid data'
+
+def test_fetch_misses_for_another_track_or_kind(cache):
+    """fetch returns False, and writes nothing, for a track or kind that isn't stored"""
+    (title, p0, f_line, walls) = sample_probs.rect20a
+    write('grid.dat', b'grid data')
+    trackcache.store(f_line, walls, 'grid', 'grid.dat')
+    assert not trackcache.fetch(sample_probs.rect20b[2], walls, 'grid', 'copy.dat')
+    assert not trackcache.fetch(f_line, walls[:-1], 'grid', 'copy.dat')
+    assert not trackcache.fetch(f_line, walls, 'moves', 'copy.dat')
+    assert not os.path.exists('copy.dat')
+
+def test_failed_copy_leaves_no_partial_file(cache, monkeypatch):
+    """
+    If copying fails partway, there's no entry or temporary file in the cache, and a
+    file that fetch was copying to keeps its old contents
+    """
+    (title, p0, f_line, walls) = sample_probs.rect20a
+    write('grid.dat', b'grid data')
+    trackcache.store(f_line, walls, 'grid', 'grid.dat')
+    def fail_partway(src, dst):
+        dst.write(src.read(4))
+        raise OSError('disk full')
+    monkeypatch.setattr(shutil, 'copyfileobj', fail_partway)
+    trackcache.store(f_line, walls, 'moves', 'grid.dat')
+    assert os.listdir(cache) == [os.path.basename(trackcache.entry(f_line, walls, 'grid'))]
+    write('copy.dat', b'old data')
+    assert not trackcache.fetch(f_line, walls, 'grid', 'copy.dat')
+    assert read('copy.dat') == b'old data'
+    assert sorted(os.listdir('.')) == ['cache', 'copy.dat', 'grid.dat']
+
+def test_evict_removes_least_recently_used(cache, monkeypatch):
+    """
+    When the cache gets too big, the entries used least recently are deleted first,
+    where fetching an entry counts as using it, and so are stale temporary files
+    """
+    tracks = [sample_probs.rect20a, sample_probs.rect20b, sample_probs.rect20c, \
+        sample_probs.rect20d]
+    write('grid.dat', b'x'*100)
+    for (k, (title, p0, f_line, walls)) in enumerate(tracks[:3]):
+        trackcache.store(f_line, walls, 'grid', 'grid.dat')
+        os.utime(trackcache.entry(f_line, walls, 'grid'), (1000*(k+1), 1000*(k+1)))
+    write(str(cache / 'left.tmp'), b'partial')
+    os.utime(str(cache / 'left.tmp'), (0, 0))
+    assert trackcache.fetch(tracks[0][2], tracks[0][3], 'grid', 'copy.dat')
+    monkeypatch.setattr(trackcache, 'cache_limit', 250)
+    trackcache.store(tracks[3][2], tracks[3][3], 'grid', 'grid.dat')
+    kept = sorted(os.listdir(cache))
+    assert kept == sorted(os.path.basename(trackcache.entry(f_line, walls, 'grid')) \
+        for (title, p0, f_line, walls) in (tracks[0], tracks[3]))
@@ -0,0 +1,97 @@
+"""
+File: trackcache.py
+An on-disk cache of the files that initialize computes for a track (the grid file,
+the replanner and move table), so that when the same track is raced again,
+initialize can copy them instead of computing them again.
+
+Entries are files in cache_dir (~/.cache/racetrack, unless the environment variable
+RACETRACK_CACHE names another directory), named by the track's fingerprint (see
+gridfile.fingerprint) and the kind of file, e.g. '<fingerprint>.grid'. Every write
+goes to a temporary file that's then renamed, so a reader, e.g. another game running
+at the same time, never sees a half-written entry. Reading an entry updates its
+modification time, and when the entries take up more than cache_limit bytes, the
+ones least recently used are deleted.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import gridfile
+
+cache_dir = os.environ.get('RACETRACK_CACHE') \
+    or os.path.join(os.path.expanduser('~'), '.cache', 'racetrack')
+cache_limit = 1 << 30       # most bytes the entries can take up
+stale_after = 600           # seconds after which a temporary file is left over from a killed process
+
+def entry(f_line, walls, kind):
+    """Return the name of the cache file for the given kind of file for this track"""
+    return os.path.join(cache_dir, gridfile.fingerprint(f_line, walls).hex() + '.' + kind)
+
+def fetch(f_line, walls, kind, filename):
+    """
+    If the cache has the given kind of file for the track given by f_line and walls,
+    copy it to filename and return True; otherwise return False.
+    """
+    path = entry(f_line, walls, kind)
+    try:
+        os.utime(path)
+        _copy(path, filename)
+        return True
+    except OSError:         # it's not in the cache, or was evicted just now
+        return False
+
+def store(f_line, walls, kind, filename):
+    """
+    Copy filename into the cache, as the given kind of file for the track given by
+    f_line and walls, and then evict old entries if the cache is too big. If the
+    cache directory can't be written, this does nothing.
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _copy(filename, entry(f_line, walls, kind))
+        evict()
+    except OSError:
+        pass
+
+def evict(limit=None):
+    """
+    Delete the least recently used entries until they take up no more than limit
+    bytes (by default, cache_limit), along with any stale temporary files
+    """
+    limit = cache_limit if limit is None else limit
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if name.endswith('.tmp'):
+            if now - stat.st_mtime > stale_after:
+                _remove(path)
+        else:
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for (mtime, size, path) in entries)
+    for (mtime, size, path) in sorted(entries):
+        if total <= limit: break
+        _remove(path)
+        total -= size
+
+def _copy(source, target):
+    """Copy source to target by way of a temporary file in target's directory"""
+    (fd, temp) = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(target) or '.')
+    try:
+        with open(source, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(temp, target)
+    except BaseException:
+        _remove(temp)
+        raise
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass